@@ -1,40 +1,135 @@
-from flask import Flask, render_template, Response
-from bicep_curl import bicep_curl_detection
-from squats import squat_detection  # Assumes squat_detection(cap) is defined in squats.py
-from pushups import push_up_detection  # Import the push-up detection function
-import cv2
+from flask import Flask, render_template, Response, jsonify, request
+from capture import CameraRegistry, parse_camera_sources
+from broadcast import StreamBroadcaster
+from packets import PACKET_MIMETYPES, packet_stream
+from ingest import INGEST_OPTIONS, IngestManager, serve_websocket
+from metrics import METRICS
+from pose_pool import POSE_POOL
+from rep_events import USER_TOTAL
+import routes
+from routes import DATA_STREAMS, INGEST_FACTORIES, MJPEG_MIMETYPE, PACKET_HEADERS, PAGES, VIDEO_STREAMS, RouteError
+import os
+import threading
+
+# WebSocket ingest is optional, the HTTP endpoints work without it
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
-cap = cv2.VideoCapture(0)
 
-@app.route('/')
-def home():
-    return render_template('index.html')
+# Cameras of this host by id, e.g. GYMGENIUS_CAMERAS="station1=0,station2=1,door=rtsp://10.0.0.5/stream".
+# One reader thread owns each camera, every route picks one with ?camera=<id> (the first by default).
+# GYMGENIUS_PIN_CPUS=1 gives every camera its own share of the CPU cores.
+cameras = CameraRegistry(parse_camera_sources(os.environ.get('GYMGENIUS_CAMERAS', '0')),
+                         pin_cpus=os.environ.get('GYMGENIUS_PIN_CPUS') == '1')
+
+# One detection stream per camera and exercise, shared by all of its viewers
+streams = StreamBroadcaster()
+
+# Remote clients that push their own frames instead of using the camera
+ingest = IngestManager(INGEST_FACTORIES, **INGEST_OPTIONS)
+
+# Build the default pose graphs in the background so the first stream starts instantly
+threading.Thread(target=POSE_POOL.warm, kwargs={'count': 2}, daemon=True).start()
+
+# Routes shared with asgi.py live in routes.py, this file adds the Flask glue
+
+@app.errorhandler(RouteError)
+def route_error(e):
+    return Response(e.message, status=e.status, mimetype='text/plain')
+
+def video_response(exercise, factory):
+    camera_id, camera = routes.camera(cameras, request.args.get('camera'))
+    return Response(streams.stream((camera_id, exercise), lambda: factory(camera.subscribe())), mimetype=MJPEG_MIMETYPE)
+
+def data_response(exercise, factory):
+    # Per-frame analysis packets, ?format=json (Server-Sent Events, default) or ?format=binary.
+    # Both formats share one analysis stream per camera and exercise.
+    fmt = routes.packet_format(request.args.get('format', 'json'))
+    camera_id, camera = routes.camera(cameras, request.args.get('camera'))
+    parts = streams.stream((camera_id, exercise, 'data'), lambda: factory(camera.subscribe()))
+    return Response(packet_stream(parts, fmt), mimetype=PACKET_MIMETYPES[fmt], headers=PACKET_HEADERS)
+
+def page_view(template):
+    def view():
+        return render_template(template, camera=request.args.get('camera'))
+    return view
+
+def stream_view(respond, exercise, factory):
+    def view():
+        return respond(exercise, factory)
+    return view
+
+for endpoint, path, template in PAGES:
+    app.add_url_rule(path, endpoint, page_view(template))
+for endpoint, path, exercise, factory in VIDEO_STREAMS:
+    app.add_url_rule(path, endpoint, stream_view(video_response, exercise, factory))
+for endpoint, path, exercise, factory in DATA_STREAMS:
+    app.add_url_rule(path, endpoint, stream_view(data_response, exercise, factory))
+
+# Per-stage latency, fps and dropped frames of every stream and camera, Prometheus text format
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+# Rep history and stats for the dashboards, ?exercise=<name>&days=30&window=7 (rolling average days).
+# /stats sums everyone, history pages take ?before=<ended_at>&before_id=<id> from the next of the previous page, &limit=50.
+@app.route('/stats')
+def stats_all():
+    return jsonify(routes.stats_summary(USER_TOTAL, request.args))
+
+@app.route('/stats/users/<user>')
+def stats_user(user):
+    return jsonify(routes.stats_summary(user, request.args))
+
+@app.route('/stats/users/<user>/history')
+def stats_history(user):
+    return jsonify(routes.stats_history(user, request.args))
+
+# Check in at a station (camera id, "<camera>/<track>" in group mode) so its reps go to a user,
+# POST {"user": "<id>"}, DELETE to check out
+@app.route('/stations/<path:station>/checkin', methods=['POST'])
+def station_check_in(station):
+    return jsonify(routes.check_in(station, request.get_json(silent=True)))
+
+@app.route('/stations/<path:station>/checkin', methods=['DELETE'])
+def station_check_out(station):
+    routes.check_out(station)
+    return Response(status=204)
+
+# Group mode: reps counted separately for everyone in view of one camera
+@app.route('/group-video/<exercise>')
+def group_video(exercise):
+    stream, factory = routes.group_stream(exercise)
+    return video_response(stream, factory)
 
-@app.route('/bicep-curls')
-def bicep_curls():
-    return render_template('bicep-curls.html')
+# Ingest: the browser sends its own frames and gets analysis packets back.
+# Open a session, POST each JPEG/WebP frame as the request body, DELETE when done.
+@app.route('/ingest/<exercise>', methods=['POST'])
+def ingest_open(exercise):
+    return jsonify(routes.open_ingest(ingest, exercise))
 
-@app.route('/bicep-video')
-def bicep_video():
-    return Response(bicep_curl_detection(cap), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/ingest/sessions/<session_id>', methods=['POST'])
+def ingest_frame(session_id):
+    session = routes.ingest_session(ingest, session_id, request.content_length)
+    session.push(request.get_data())
 
-@app.route('/squats')
-def squats():
-    return render_template('squats.html')
+    status, body, mimetype, headers = session.reply(request.args.get('format', 'json'))
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
 
-@app.route('/squats-video')
-def squats_video():
-    return Response(squat_detection(cap), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/ingest/sessions/<session_id>', methods=['DELETE'])
+def ingest_close(session_id):
+    routes.close_ingest(ingest, session_id)
+    return Response(status=204)
 
-# New routes for push-ups
-@app.route('/push-ups')
-def push_ups():
-    return render_template('push-ups.html')
+if Sock is not None:
+    sock = Sock(app)
 
-@app.route('/push-ups-video')
-def push_ups_video():
-    return Response(push_up_detection(cap), mimetype='multipart/x-mixed-replace; boundary=frame')
+    @sock.route('/ingest/<exercise>/ws')
+    def ingest_websocket(ws, exercise):
+        serve_websocket(ingest, ws, exercise, request.args.get('format', 'json'))
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,142 @@
+# asgi.py
+#
+# Production serving path: the routes of app.py on an ASGI server, e.g.
+#
+#     hypercorn asgi:app --bind 0.0.0.0:5000
+#
+# Needs Quart (pip install quart hypercorn). Viewers are async generators
+# awaiting the shared streams, so an idle or slow connection costs a
+# coroutine instead of a blocked OS thread. Capture, inference and encoding
+# keep running on the worker threads of each StreamPipeline, one set per
+# camera and exercise however many viewers are connected. No reloader runs,
+# so the camera is opened exactly once. What the routes do is shared with
+# app.py through routes.py, this file only adds the async glue.
+
+import asyncio
+import functools
+
+from quart import Quart, Response, jsonify, render_template, request, websocket
+
+from app import cameras, ingest, streams
+from ingest import serve_websocket_async
+from metrics import METRICS
+from packets import PACKET_MIMETYPES, apacket_stream
+from rep_events import USER_TOTAL
+import routes
+from routes import DATA_STREAMS, MJPEG_MIMETYPE, PACKET_HEADERS, PAGES, VIDEO_STREAMS, RouteError
+
+app = Quart(__name__)
+
+
+@app.errorhandler(RouteError)
+async def route_error(e):
+    return Response(e.message, status=e.status, mimetype='text/plain')
+
+
+def streaming_response(body, mimetype, headers=None):
+    response = Response(body, mimetype=mimetype, headers=headers)
+    # Streams run until the viewer leaves, not until a response timeout
+    response.timeout = None
+    return response
+
+
+async def off_loop(func, *args):
+    # SQLite queries and other blocking calls run on the default executor, not the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+def video_response(exercise, factory):
+    camera_id, camera = routes.camera(cameras, request.args.get('camera'))
+    return streaming_response(streams.astream((camera_id, exercise), lambda: factory(camera.subscribe())), MJPEG_MIMETYPE)
+
+
+def data_response(exercise, factory):
+    fmt = routes.packet_format(request.args.get('format', 'json'))
+    camera_id, camera = routes.camera(cameras, request.args.get('camera'))
+    parts = streams.astream((camera_id, exercise, 'data'), lambda: factory(camera.subscribe()))
+    return streaming_response(apacket_stream(parts, fmt), PACKET_MIMETYPES[fmt], headers=PACKET_HEADERS)
+
+
+def page_view(template):
+    async def view():
+        return await render_template(template, camera=request.args.get('camera'))
+    return view
+
+
+def stream_view(respond, exercise, factory):
+    async def view():
+        return respond(exercise, factory)
+    return view
+
+
+# The page and stream routes of app.py, see routes.py
+for endpoint, path, template in PAGES:
+    app.add_url_rule(path, endpoint, page_view(template))
+for endpoint, path, exercise, factory in VIDEO_STREAMS:
+    app.add_url_rule(path, endpoint, stream_view(video_response, exercise, factory))
+for endpoint, path, exercise, factory in DATA_STREAMS:
+    app.add_url_rule(path, endpoint, stream_view(data_response, exercise, factory))
+
+@app.route('/metrics')
+async def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+# Rep history, stats and check-ins, see app.py
+@app.route('/stats')
+async def stats_all():
+    return jsonify(await off_loop(routes.stats_summary, USER_TOTAL, request.args))
+
+@app.route('/stats/users/<user>')
+async def stats_user(user):
+    return jsonify(await off_loop(routes.stats_summary, user, request.args))
+
+@app.route('/stats/users/<user>/history')
+async def stats_history(user):
+    return jsonify(await off_loop(routes.stats_history, user, request.args))
+
+@app.route('/stations/<path:station>/checkin', methods=['POST'])
+async def station_check_in(station):
+    return jsonify(routes.check_in(station, await request.get_json(silent=True)))
+
+@app.route('/stations/<path:station>/checkin', methods=['DELETE'])
+async def station_check_out(station):
+    routes.check_out(station)
+    return Response(b'', status=204)
+
+@app.route('/group-video/<exercise>')
+async def group_video(exercise):
+    stream, factory = routes.group_stream(exercise)
+    return video_response(stream, factory)
+
+# Ingest, see app.py
+@app.route('/ingest/<exercise>', methods=['POST'])
+async def ingest_open(exercise):
+    return jsonify(routes.open_ingest(ingest, exercise))
+
+@app.route('/ingest/sessions/<session_id>', methods=['POST'])
+async def ingest_frame(session_id):
+    session = routes.ingest_session(ingest, session_id, request.content_length)
+    session.push(await request.get_data())
+
+    status, body, mimetype, headers = session.reply(request.args.get('format', 'json'))
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+@app.route('/ingest/sessions/<session_id>', methods=['DELETE'])
+async def ingest_close(session_id):
+    routes.close_ingest(ingest, session_id)
+    return Response(b'', status=204)
+
+@app.websocket('/ingest/<exercise>/ws')
+async def ingest_websocket(exercise):
+    try:
+        await serve_websocket_async(ingest, websocket, exercise, websocket.args.get('format', 'json'))
+    except (ValueError, RuntimeError) as e:
+        # Unknown exercise or no free session
+        await websocket.close(1008, str(e))
+
+@app.after_serving
+async def release_cameras():
+    cameras.stop()
+
+if __name__ == "__main__":
+    app.run()
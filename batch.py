@@ -0,0 +1,150 @@
+# batch.py
+#
+# Analyze recorded workout videos offline:
+#
+#     python batch.py clips/ --exercise squat --out reps.csv
+#
+# Every worker process owns one Pose graph and runs the analyzers headless
+# (no drawing, no JPEG encoding) on whole videos as fast as it can decode them.
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from bicep_curl import BicepCurlProcessor
+from pushups import PushUpProcessor
+from squat_modules.process_frame import ProcessFrame
+from squat_modules.thresholds import get_thresholds_beginner, get_thresholds_pro
+from squat_modules.utils import get_mediapipe_pose
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+RESULT_FIELDS = ['video', 'exercise', 'rep', 'frame', 'time_s', 'correct', 'feedback']
+
+
+def make_bicep(clock, level):
+    return BicepCurlProcessor(draw=False, countdown=False, clock=clock)
+
+def make_pushup(clock, level):
+    return PushUpProcessor(draw=False, countdown=False, clock=clock)
+
+def make_squat(clock, level):
+    thresholds = get_thresholds_pro() if level == 'pro' else get_thresholds_beginner()
+    return ProcessFrame(thresholds=thresholds, draw=False, clock=clock)
+
+
+# exercise -> processor factory
+EXERCISES = {
+    'bicep': make_bicep,
+    'pushup': make_pushup,
+    'squat': make_squat
+}
+
+# One Pose graph per worker process, built by the pool initializer
+_pose = None
+
+
+def _init_worker():
+    global _pose
+    # The pool already uses every core, keep OpenCV from oversubscribing them
+    cv2.setNumThreads(1)
+    _pose = get_mediapipe_pose()
+
+
+def analyze_video(path, exercises, level='beginner'):
+    """
+    Run the requested analyzers over one video and collect every rep
+
+    Args:
+        path: Video file to analyze
+        exercises: Names from EXERCISES to run on the same inference pass
+        level: Squat thresholds to use, 'beginner' or 'pro'
+
+    Returns:
+        List of per-rep result dicts with RESULT_FIELDS keys
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Could not open {path}")
+        return []
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_idx = 0
+
+    # Processors see video time, not wall-clock time
+    def clock():
+        return frame_idx / fps
+
+    analyzers = {name: EXERCISES[name](clock, level) for name in exercises}
+
+    _pose.reset()
+    results = []
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        height, width, _ = frame.shape
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        image.flags.writeable = False
+        keypoints = _pose.process(image)
+
+        for name, processor in analyzers.items():
+            rep = processor.analyze(keypoints.pose_landmarks, width, height)['rep']
+            if rep is not None:
+                results.append({
+                    'video': os.path.basename(path),
+                    'exercise': name,
+                    'rep': rep['number'],
+                    'frame': frame_idx,
+                    'time_s': round(clock(), 3),
+                    'correct': rep['correct'],
+                    'feedback': rep['feedback']
+                })
+
+        frame_idx += 1
+
+    cap.release()
+    return results
+
+
+def find_videos(directory):
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count reps in recorded workout videos")
+    parser.add_argument('directory', help="Directory of video files")
+    parser.add_argument('--exercise', choices=sorted(EXERCISES) + ['all'], default='all')
+    parser.add_argument('--level', choices=['beginner', 'pro'], default='beginner', help="Squat thresholds")
+    parser.add_argument('--out', default='rep_results.csv', help="CSV file for per-rep results")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    args = parser.parse_args()
+
+    exercises = sorted(EXERCISES) if args.exercise == 'all' else [args.exercise]
+    videos = find_videos(args.directory)
+    if not videos:
+        parser.error(f"No videos found in {args.directory}")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool, \
+            open(args.out, 'w', newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+
+        jobs = [pool.submit(analyze_video, path, exercises, args.level) for path in videos]
+        for path, job in zip(videos, jobs):
+            reps = job.result()
+            writer.writerows(reps)
+            print(f"{os.path.basename(path)}: {len(reps)} reps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# benchmarks/fixtures.py
+#
+# Replay fixtures for the benchmarks: deterministic landmark sequences of
+# clean reps, plus stand-ins for cv2.VideoCapture and the MediaPipe Pose
+# graph so the streaming code runs without a camera or a model.
+#
+# A sequence is (timestamps, landmarks): seconds as (N,) float64 and
+# MediaPipe landmarks as (N, 33, 4) float32 x, y, z, visibility, the
+# layout of LandmarkArray.data.
+
+import math
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from squat_modules.utils import NUM_LANDMARKS
+
+FIXTURE_FPS = 30
+FRAME_SIZE = (640, 480)
+
+# Visibility of the joints a sequence moves, the rest sit at the center
+VISIBLE = 0.99
+HIDDEN = 0.1
+
+
+def _rotate(center, radius, degrees):
+    # Point at `radius` from `center`, `degrees` clockwise from straight up
+    a = math.radians(degrees)
+    return center[0] + radius * math.sin(a), center[1] - radius * math.cos(a)
+
+
+def _sequence(reps, period, fps, pose_at):
+    # One extra second holding the starting pose, so the last rep finishes
+    # well inside the clip and no further rep begins
+    end = period * reps
+    n = int(fps * end) + fps
+    timestamps = np.arange(n, dtype=np.float64) / fps
+    landmarks = np.zeros((n, NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, :, :2] = 0.5
+    landmarks[:, :, 3] = HIDDEN
+
+    for i, t in enumerate(timestamps):
+        for index, (x, y) in pose_at(min(t, end)).items():
+            landmarks[i, index] = (x, y, 0.0, VISIBLE)
+    return timestamps, landmarks
+
+
+def bicep_sequence(reps=5, period=2.0, fps=FIXTURE_FPS):
+    """
+    Left arm curling between 170 and 20 degrees, starting extended
+    """
+    def pose_at(t):
+        angle = 95 + 75 * math.cos(2 * math.pi * t / period)
+        elbow = (0.5, 0.5)
+        return {11: (0.5, 0.3), 13: elbow, 15: _rotate(elbow, 0.18, angle)}
+
+    return _sequence(reps, period, fps, pose_at)
+
+
+def pushup_sequence(reps=5, period=2.0, fps=FIXTURE_FPS):
+    """
+    Side view plank with a straight body, elbow bending between 175 and 75 degrees
+    """
+    def pose_at(t):
+        angle = 125 + 50 * math.cos(2 * math.pi * t / period)
+        elbow = (0.4, 0.62)
+        return {11: (0.4, 0.5), 13: elbow, 15: _rotate(elbow, 0.12, angle),
+                23: (0.6, 0.5), 25: (0.75, 0.5), 27: (0.9, 0.5)}
+
+    return _sequence(reps, period, fps, pose_at)
+
+
+def squat_sequence(reps=5, period=3.0, fps=FIXTURE_FPS):
+    """
+    Side view squat, knee bending between 5 and 90 degrees from vertical
+    """
+    def pose_at(t):
+        knee_angle = 47.5 - 42.5 * math.cos(2 * math.pi * t / period)
+        ankle, foot = (0.5, 0.9), (0.56, 0.9)
+        knee = _rotate(ankle, 0.2, knee_angle * 0.3)
+        hip = _rotate(knee, 0.2, -knee_angle)
+        shoulder = _rotate(hip, 0.25, knee_angle * 0.4)
+        elbow = (shoulder[0], shoulder[1] + 0.1)
+        wrist = (shoulder[0], shoulder[1] + 0.2)
+        # Both sides almost on top of each other, as seen from the side
+        return {0: (shoulder[0] + 0.02, shoulder[1] - 0.08),
+                11: shoulder, 12: (shoulder[0] + 0.001, shoulder[1]), 13: elbow, 14: elbow, 15: wrist, 16: wrist,
+                23: hip, 24: hip, 25: knee, 26: knee, 27: ankle, 28: ankle, 31: foot, 32: (foot[0], foot[1] - 0.001)}
+
+    return _sequence(reps, period, fps, pose_at)
+
+
+# exercise -> () -> (timestamps, landmarks)
+SEQUENCES = {
+    'bicep': bicep_sequence,
+    'pushup': pushup_sequence,
+    'squat': squat_sequence
+}
+
+
+class ReplayResults:
+    """
+    The part of a MediaPipe Pose result the analyzers read
+    """
+
+    __slots__ = ('pose_landmarks',)
+
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+def to_results(landmarks):
+    """
+    (N, 33, 4) landmarks -> list of ReplayResults, frames that are all NaN
+    have nobody detected
+    """
+    results = []
+    for frame in landmarks:
+        if np.isnan(frame).all():
+            results.append(ReplayResults(None))
+            continue
+        landmark_list = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z, visibility in frame.tolist():
+            landmark_list.landmark.add(x=x, y=y, z=z, visibility=visibility)
+        results.append(ReplayResults(landmark_list))
+    return results
+
+
+class ReplayPose:
+    """
+    MediaPipe Pose stand-in returning prebuilt results in order, looping
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self._index = 0
+
+    def process(self, image):
+        result = self.results[self._index % len(self.results)]
+        self._index += 1
+        return result
+
+    def reset(self):
+        self._index = 0
+
+    def close(self):
+        pass
+
+
+class ReplayPosePool:
+    """
+    PosePool stand-in handing out ReplayPose graphs over the same results
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def acquire(self, **config):
+        return ReplayPose(self.results)
+
+    def release(self, pose):
+        pose.reset()
+
+    @contextmanager
+    def checkout(self, **config):
+        pose = self.acquire(**config)
+        try:
+            yield pose
+        finally:
+            self.release(pose)
+
+
+class FakeCapture:
+    """
+    cv2.VideoCapture stand-in over frames held in memory.
+
+    Args:
+        frames: BGR frames, repeated in order
+        count: Frames to return before reporting the end of the stream, None never ends
+        fps: Pace reads like a camera at this rate, None reads as fast as asked
+    """
+
+    def __init__(self, frames, count=None, fps=None):
+        self.frames = frames
+        self.count = float('inf') if count is None else count
+        self.fps = fps
+        self.read_count = 0
+        self._opened = True
+        self._next_time = None
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or self.read_count >= self.count:
+            return False, None
+
+        if self.fps:
+            now = time.perf_counter()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + 1.0 / self.fps
+
+        frame = self.frames[self.read_count % len(self.frames)]
+        self.read_count += 1
+        return True, frame
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        self._opened = False
+
+
+def blank_frames(size=FRAME_SIZE):
+    """
+    A single black BGR frame, enough for replays where the landmarks are prerecorded
+    """
+    return [np.zeros((size[1], size[0], 3), dtype=np.uint8)]
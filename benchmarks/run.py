@@ -0,0 +1,409 @@
+# benchmarks/run.py
+#
+# Replay benchmarks, CPU-only and without a camera. Run from the repository root:
+#
+#     python -m benchmarks.run
+#     python -m benchmarks.run --suite landmarks pipeline --json results.json
+#     python -m benchmarks.run --baseline results.json --tolerance 0.2
+#
+# Suites:
+#   landmarks  Fixture landmark sequences through each processor's process(),
+#              overlays included, on video time. Rep counts are checked
+#              against golden.json.
+#   logs       Landmark logs from --logs (see recording.py) replayed through
+#              the headless analyzers; the replay has to reproduce the
+#              recorded feedback and counts frame by frame.
+#   pipeline   The fixture sequences through bicep_curl_detection and
+#              push_up_detection, fed by a FakeCapture and a replaying Pose
+#              graph: the streaming cost (threads, color conversion, overlays,
+#              JPEG encoding) without the model.
+#   video      Clips from --clips through the real Pose graph, decoded into
+#              memory first so decoding is not measured. Clips listed in
+#              golden.json also get their rep counts checked (batch analysis).
+#
+# Exits with 1 when a rep count differs from golden.json, or when a
+# benchmark's fps fell more than --tolerance below the --baseline run.
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+
+import batch
+from bicep_curl import BicepCurlProcessor, bicep_curl_detection
+from metrics import METRICS, StageTimings
+from pushups import PushUpProcessor, push_up_detection
+from recording import LandmarkLog, differences, replay
+from rep_events import REP_EVENT_OPTIONS
+from squat_modules.process_frame import ProcessFrame
+from squat_modules.thresholds import get_thresholds_beginner
+
+from benchmarks.fixtures import (SEQUENCES, FakeCapture, ReplayPosePool, blank_frames, to_results)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(HERE, 'golden.json')
+CLIPS_DIR = os.path.join(HERE, 'clips')
+LOGS_DIR = os.path.join(HERE, 'logs')
+
+SUITES = ('landmarks', 'logs', 'pipeline', 'video')
+
+# exercise -> streaming generator function, see --suite pipeline
+DETECTORS = {
+    'bicep': bicep_curl_detection,
+    'pushup': push_up_detection
+}
+
+# Seconds of each stream left out of the measurement, covers the 3 s
+# countdown of the processors
+WARMUP = 3.5
+
+# Frame rate of the pipeline suite's fake camera. Far above what the stages
+# manage, but an unpaced capture thread would spin and compete with them for
+# the GIL.
+CAMERA_FPS = 1000
+
+
+def _bicep(clock, timings):
+    processor = BicepCurlProcessor(countdown=False, clock=clock, timings=timings)
+    return processor, lambda frame, results: processor.process(frame, results), \
+        lambda: {'total': processor.counter, 'correct': processor.correct_reps}
+
+def _pushup(clock, timings):
+    processor = PushUpProcessor(countdown=False, clock=clock, timings=timings)
+    return processor, lambda frame, results: processor.process(frame, results), \
+        lambda: {'total': processor.counter, 'correct': processor.acceptable_form_count}
+
+def _squat(clock, timings):
+    processor = ProcessFrame(thresholds=get_thresholds_beginner(), flip_frame=True, clock=clock, timings=timings)
+    state = processor.state_tracker
+    # Draws into the frame it is given, like the squat stream's display buffer
+    display = blank_frames()[0]
+    return processor, lambda frame, results: processor.process(display, None, keypoints=results), \
+        lambda: {'total': state['SQUAT_COUNT'] + state['IMPROPER_SQUAT'], 'correct': state['SQUAT_COUNT']}
+
+
+# exercise -> (clock, timings) -> (processor, step(frame, results), counts())
+PROCESSORS = {
+    'bicep': _bicep,
+    'pushup': _pushup,
+    'squat': _squat
+}
+
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def stage_latencies(stream):
+    """
+    {stage: {'p50': ms, 'p95': ms, 'p99': ms}} recorded for a stream
+    """
+    stages = {}
+    for labels, summary in METRICS.find('gymgenius_stage_seconds', stream=stream):
+        quantiles, _, count = summary.snapshot()
+        if count:
+            stages[labels['stage']] = {f"p{round(q * 100)}": round(value * 1000, 3) for q, value in quantiles.items()}
+    return stages
+
+
+def dropped_frames(stream):
+    return sum(counter.value for _, counter in METRICS.find('gymgenius_dropped_frames_total', stream=stream))
+
+
+def max_rss_mb():
+    # Peak resident set size of the whole process so far, KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextlib.contextmanager
+def measure_memory(row, trace):
+    """
+    Add the memory figures of the enclosed run to a result row
+    """
+    if trace:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if trace:
+            row['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+        row['max_rss_mb'] = max_rss_mb()
+
+
+def check_counts(row, expected):
+    row['golden'] = expected
+    row['ok'] = expected is None or row['counts'] == expected
+
+
+def bench_landmarks(exercise, golden, trace=False):
+    """
+    Replay a fixture sequence through the processor on video time
+    """
+    timestamps, landmarks = SEQUENCES[exercise]()
+    results = to_results(landmarks)
+    frame = blank_frames()[0]
+
+    video_time = 0.0
+    timings = StageTimings(f'replay-{exercise}')
+    processor, step, counts = PROCESSORS[exercise](lambda: video_time, timings)
+
+    row = {'suite': 'landmarks', 'name': exercise, 'frames': len(results)}
+    with measure_memory(row, trace), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for video_time, result in zip(timestamps.tolist(), results):
+            step(frame, result)
+        elapsed = time.perf_counter() - start
+
+    row['seconds'] = round(elapsed, 3)
+    row['fps'] = round(len(results) / elapsed, 1)
+    row['stages'] = stage_latencies(timings.stream)
+    row['counts'] = counts()
+    check_counts(row, golden.get('landmarks', {}).get(exercise))
+    return row
+
+
+def bench_log(path, trace=False):
+    """
+    Replay a landmark log, the counts it recorded are the golden result
+    """
+    log = LandmarkLog.load(path)
+    row = {'suite': 'logs', 'name': os.path.basename(path), 'frames': len(log)}
+    with measure_memory(row, trace), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        results = replay(log)
+        elapsed = time.perf_counter() - start
+
+    row['seconds'] = round(elapsed, 3)
+    row['fps'] = round(len(log) / elapsed, 1) if elapsed else 0.0
+    row['counts'] = results[-1]['counts'] if results else {'total': 0, 'correct': 0}
+    row['differences'] = len(differences(log, results))
+    recorded = {'total': int(log.counts[-1, 0]), 'correct': int(log.counts[-1, 1])} if len(log) else None
+    check_counts(row, recorded)
+    row['ok'] = row['ok'] and not row['differences']
+    return row
+
+
+def _run_stream(parts, duration):
+    """
+    Consume a stream for WARMUP + `duration` seconds, returning (parts, seconds) after the warmup
+    """
+    start = time.perf_counter()
+    measured_from = None
+    count = 0
+    try:
+        for _ in parts:
+            now = time.perf_counter()
+            if measured_from is None:
+                if now - start >= WARMUP:
+                    measured_from = now
+                continue
+            count += 1
+            if now - measured_from >= duration:
+                break
+    finally:
+        parts.close()
+
+    if measured_from is None:
+        return 0, 0.0
+    return count, time.perf_counter() - measured_from
+
+
+def bench_stream(suite, name, stream, parts, duration, trace=False):
+    row = {'suite': suite, 'name': name}
+    with measure_memory(row, trace), contextlib.redirect_stdout(io.StringIO()):
+        count, elapsed = _run_stream(parts, duration)
+
+    row['frames'] = count
+    row['seconds'] = round(elapsed, 3)
+    row['fps'] = round(count / elapsed, 1) if elapsed else 0.0
+    row['stages'] = stage_latencies(stream)
+    row['dropped'] = dropped_frames(stream)
+    return row
+
+
+def bench_pipeline(exercise, duration, camera_fps=None, trace=False):
+    """
+    Stream a fixture sequence through the exercise's detection generator with a replaying Pose graph
+    """
+    _, landmarks = SEQUENCES[exercise]()
+    pool = ReplayPosePool(to_results(landmarks))
+    cap = FakeCapture(blank_frames(), fps=camera_fps or None)
+
+    METRICS.clear()
+    parts = DETECTORS[exercise](cap, pose_pool=pool)
+    return bench_stream('pipeline', exercise, exercise, parts, duration, trace)
+
+
+def read_clip(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    fps = cap.get(cv2.CAP_PROP_FPS) or None
+    cap.release()
+    return frames, fps
+
+
+def bench_video(path, duration, max_frames, realtime=False, trace=False):
+    """
+    Stream a clip through every detection generator with the real Pose graph
+    """
+    frames, fps = read_clip(path, max_frames)
+    if not frames:
+        print(f"Could not read {path}")
+        return []
+
+    rows = []
+    for exercise, detector in DETECTORS.items():
+        cap = FakeCapture(frames, fps=fps if realtime else None)
+        METRICS.clear()
+        row = bench_stream('video', f"{os.path.basename(path)}:{exercise}", exercise, detector(cap), duration, trace)
+        rows.append(row)
+    return rows
+
+
+def check_video_counts(path, expected):
+    """
+    Rep counts of a clip through the headless batch analyzers, for clips with golden counts
+    """
+    if batch._pose is None:
+        batch._init_worker()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        reps = batch.analyze_video(path, list(expected))
+
+    counts = {
+        exercise: {
+            'total': sum(1 for rep in reps if rep['exercise'] == exercise),
+            'correct': sum(1 for rep in reps if rep['exercise'] == exercise and rep['correct'])
+        }
+        for exercise in expected
+    }
+    row = {'suite': 'video', 'name': f"{os.path.basename(path)}:counts", 'counts': counts}
+    check_counts(row, expected)
+    return row
+
+
+def compare_to_baseline(rows, baseline, tolerance):
+    """
+    Mark rows whose fps fell more than `tolerance` below the same benchmark in `baseline`
+    """
+    previous = {(row['suite'], row['name']): row for row in baseline}
+    for row in rows:
+        before = previous.get((row['suite'], row['name']))
+        if before is None or 'fps' not in row or not before.get('fps'):
+            continue
+        row['baseline_fps'] = before['fps']
+        if row['fps'] < before['fps'] * (1 - tolerance):
+            row['ok'] = False
+            row['regression'] = round(1 - row['fps'] / before['fps'], 3)
+
+
+def print_report(rows):
+    for row in rows:
+        status = 'ok' if row.get('ok', True) else 'FAIL'
+        line = f"{status:4}  {row['suite']:9}  {row['name']:28}"
+        if 'fps' in row:
+            line += f"  {row['fps']:9.1f} fps"
+            if 'baseline_fps' in row:
+                line += f" (was {row['baseline_fps']:.1f})"
+        if 'counts' in row:
+            line += f"  counts {json.dumps(row['counts'], sort_keys=True)}"
+            if row.get('golden') is not None and row['counts'] != row['golden']:
+                line += f" expected {json.dumps(row['golden'], sort_keys=True)}"
+        if 'max_rss_mb' in row:
+            line += f"  rss {row['max_rss_mb']} MB"
+        if 'peak_traced_mb' in row:
+            line += f"  traced {row['peak_traced_mb']} MB"
+        print(line)
+
+        for stage, quantiles in sorted(row.get('stages', {}).items()):
+            print(f"        {stage:16} " + '  '.join(f"{q} {ms:8.3f} ms" for q, ms in quantiles.items()))
+        if row.get('differences'):
+            print(f"        {row['differences']} frames differ from the recording")
+        if row.get('dropped'):
+            print(f"        dropped {row['dropped']} frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay benchmarks for the exercise analyzers and streams")
+    parser.add_argument('--suite', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--clips', default=CLIPS_DIR, help="Directory of clips for the video suite")
+    parser.add_argument('--logs', default=LOGS_DIR, help="Directory of landmark logs for the logs suite")
+    parser.add_argument('--golden', default=GOLDEN_PATH, help="Expected rep counts")
+    parser.add_argument('--duration', type=float, default=5.0, help="Measured seconds per stream, after the warmup")
+    parser.add_argument('--max-frames', type=int, default=300, help="Frames of a clip held in memory")
+    parser.add_argument('--camera-fps', type=float, default=CAMERA_FPS,
+                        help="Rate the pipeline suite's capture delivers frames at, 0 for as fast as possible")
+    parser.add_argument('--realtime', action='store_true', help="Pace the video suite at each clip's frame rate")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Also report peak Python allocations (slows down the runs)")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Results file of an earlier run to compare fps against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed fps drop against the baseline")
+    args = parser.parse_args()
+
+    # Replayed reps are no workouts, keep them out of the rep history
+    REP_EVENT_OPTIONS['database'] = ''
+
+    golden = load_golden(args.golden)
+    rows = []
+
+    if 'landmarks' in args.suite:
+        for exercise in PROCESSORS:
+            rows.append(bench_landmarks(exercise, golden, args.tracemalloc))
+
+    if 'logs' in args.suite:
+        logs = sorted(glob.glob(os.path.join(args.logs, '*.npz')))
+        if not logs:
+            print(f"No landmark logs in {args.logs}, skipping the logs suite")
+        for path in logs:
+            rows.append(bench_log(path, args.tracemalloc))
+
+    if 'pipeline' in args.suite:
+        for exercise in DETECTORS:
+            rows.append(bench_pipeline(exercise, args.duration, args.camera_fps, args.tracemalloc))
+
+    if 'video' in args.suite:
+        clips = batch.find_videos(args.clips) if os.path.isdir(args.clips) else []
+        if not clips:
+            print(f"No clips in {args.clips}, skipping the video suite")
+        for path in clips:
+            rows.extend(bench_video(path, args.duration, args.max_frames, args.realtime, args.tracemalloc))
+        # After the throughput runs, the batch worker setup limits OpenCV to one thread
+        for path in clips:
+            expected = golden.get('videos', {}).get(os.path.basename(path))
+            if expected:
+                rows.append(check_video_counts(path, expected))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_to_baseline(rows, json.load(f), args.tolerance)
+
+    print_report(rows)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+    failed = [row for row in rows if not row.get('ok', True)]
+    if failed:
+        print(f"{len(failed)} benchmark(s) failed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,38 +5,24 @@ import mediapipe as mp
 import numpy as np
 import time
 
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
-
-def bicep_curl_detection(cap):
-    # Reset variables for each session
-    counter = 0
-    correct_reps = 0  # Track correct reps separately
-    stage = None
-    form_feedback = "Good form"
-    feedback_color = (0, 255, 0)
-
-    rep_start_time = None
-    rep_start_angle = None
-    rep_min_angle = 180
-    rep_max_angle = 0
-
-    lock_start_time = None
-    is_locked = False
-    lock_duration = 0
-
-    countdown_start = time.time()
-    countdown_duration = 3
-    countdown_active = True
-
+from encoder import make_encoder
+from metrics import NO_TIMINGS, StageTimings
+from packets import PacketEncoder, make_packet
+from pipeline import StreamPipeline, copy_to_buffer, pose_inference
+from pose_pool import POSE_POOL
+from recording import recording
+from squat_modules.hud import draw_counter_bar, draw_sprite
+from squat_modules.utils import LandmarkArray, find_angles
+
+# Feedback code -> (message, BGR box color)
+FEEDBACK = {
+    'GOOD_FORM': ("Good form", (0, 255, 0)),
+    'LOCKED_JOINTS': ("Avoid locking joints", (0, 0, 255)),
+    'SLOW_DOWN': ("Slow down", (0, 165, 255)),
+    'HALF_REP': ("Half rep detected", (0, 0, 255))
+}
+
+class BicepCurlProcessor:
     MIN_CURL_ANGLE = 30
     MAX_EXTENSION_ANGLE = 170
     HALF_REP_THRESHOLD = 80
@@ -44,196 +30,270 @@ def bicep_curl_detection(cap):
     LOCK_TIME_THRESHOLD = 0.5
     MIN_REP_DURATION = 0.7
 
-    mp_drawing = mp.solutions.drawing_utils
-    mp_pose = mp.solutions.pose
-
-    with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            image.flags.writeable = False
-            results = pose.process(image)
-            image.flags.writeable = True
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
-            # Get frame dimensions
-            h, w, _ = image.shape
-
-            if countdown_active:
-                elapsed = time.time() - countdown_start
-                if elapsed < countdown_duration:
-                    remaining = countdown_duration - elapsed
-                    countdown_text = str(int(remaining) + 1)
-                    font_scale = 7
-                    text_size = cv2.getTextSize(countdown_text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
-                    text_x = int((w - text_size[0]) / 2)
-                    text_y = int((h + text_size[1]) / 2)
-                    cv2.putText(image, countdown_text, (text_x, text_y), 
-                                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
-                else:
-                    h, w, _ = image.shape
-                    go_text = "GO!"
-                    font_scale = 7
-                    text_size = cv2.getTextSize(go_text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
-                    text_x = int((w - text_size[0]) / 2)
-                    text_y = int((h + text_size[1]) / 2)
-                    cv2.putText(image, go_text, (text_x, text_y), 
-                                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
-                    countdown_active = False
-                    continue
-
-            try:
-                landmarks = results.pose_landmarks.landmark
-                shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                            landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-                wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                         landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-                angle = calculate_angle(shoulder, elbow, wrist)
-
-                elbow_coords = tuple(np.multiply(elbow, [w, h]).astype(int))
-                cv2.putText(image, str(round(angle, 2)), elbow_coords, 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-
-                if angle > LOCK_ANGLE_THRESHOLD and not is_locked:
-                    if lock_start_time is None:
-                        lock_start_time = time.time()
-                    else:
-                        lock_duration = time.time() - lock_start_time
-                        if lock_duration > LOCK_TIME_THRESHOLD:
-                            is_locked = True
-                            form_feedback = "Avoid locking joints"
-                            feedback_color = (0, 0, 255)
-                elif angle < LOCK_ANGLE_THRESHOLD:
-                    lock_start_time = None
-                    lock_duration = 0
-                    if is_locked:
-                        is_locked = False
-                        if form_feedback == "Avoid locking joints":
-                            form_feedback = "Good form"
-                            feedback_color = (0, 255, 0)
-
-                if stage == "down":
-                    rep_min_angle = min(rep_min_angle, angle)
-                    rep_max_angle = max(rep_max_angle, angle)
-
-                if angle > 160 and stage != "down":
-                    stage = "down"
-                    rep_start_time = time.time()
-                    rep_start_angle = angle
-                    rep_min_angle = angle
-                    rep_max_angle = angle
-                    if is_locked:
-                        form_feedback = "Avoid locking joints"
-                        feedback_color = (0, 0, 255)
-
-                if angle < MIN_CURL_ANGLE and stage == "down":
-                    stage = "up"
-                    rep_end_time = time.time()
-                    rep_duration = rep_end_time - rep_start_time if rep_start_time else 0
-                    counter += 1
-                    
-                    # Track correct reps
-                    is_correct_rep = True
-                    
-                    if rep_duration < MIN_REP_DURATION:
-                        form_feedback = "Slow down"
-                        feedback_color = (0, 165, 255)
-                        is_correct_rep = False
-                    elif is_locked or form_feedback == "Avoid locking joints":
-                        is_correct_rep = False
-                    else:
-                        form_feedback = "Good form"
-                        feedback_color = (0, 255, 0)
-                        is_correct_rep = True
-                    
-                    if is_correct_rep:
-                        correct_reps += 1
-                        
-                    print(f"Rep {counter} duration: {rep_duration:.2f} seconds")
-                    rep_start_time = None
-                    rep_start_angle = None
-                    rep_min_angle = 180
-                    rep_max_angle = 0
-
-                if stage == "down" and angle > HALF_REP_THRESHOLD and rep_min_angle < angle and rep_min_angle > MIN_CURL_ANGLE:
-                    if angle - rep_min_angle > 20:
-                        form_feedback = "Half rep detected"
-                        feedback_color = (0, 0, 255)
-                        stage = None
-                        rep_start_time = None
-                        rep_min_angle = 180
-                        rep_max_angle = 0
-
-            except:
-                pass
-
-            # ====== IMPROVED UI LAYOUT ======
-            
-            # Calculate widths for UI elements with better spacing
-            counter_width = 150
-            feedback_width = w - counter_width - 300
-            correct_width = 150
-            
-            # Total rep counter (left side)
-            cv2.rectangle(image, (10, 10), (10 + counter_width, 60), (245, 117, 16), -1)
-            cv2.putText(image, 'TOTAL REPS', (15, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-            cv2.putText(image, str(counter), (50, 50), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
-            
-            # Correct form counter (right side)
-            cv2.rectangle(image, (w - 10 - correct_width, 10), (w - 10, 60), (0, 255, 0), -1)
-            cv2.putText(image, 'CORRECT', (w - correct_width + 5, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-            cv2.putText(image, str(correct_reps), (w - correct_width + 50, 50), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
-            
-            # Form feedback (center)
-            feedback_x = 10 + counter_width + 10
-            feedback_width = w - feedback_x - correct_width - 20
-            
-            cv2.rectangle(image, (feedback_x, 10), (feedback_x + feedback_width, 60), feedback_color, -1)
-            
-            # Ensure form feedback text fits in the box
-            form_text = form_feedback
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.7
-            thickness = 2
-            
-            # Calculate text width to ensure it fits
-            text_size = cv2.getTextSize(form_text, font, font_scale, thickness)[0]
+    # Shoulder, elbow and wrist of the tracked arm
+    ARM = [mp.solutions.pose.PoseLandmark.LEFT_SHOULDER.value,
+           mp.solutions.pose.PoseLandmark.LEFT_ELBOW.value,
+           mp.solutions.pose.PoseLandmark.LEFT_WRIST.value]
+
+    def __init__(self, draw=True, countdown=True, clock=time.time, timings=None, recorder=None):
+        # Headless callers (batch analysis) skip every drawing call
+        self.draw = draw
+        # Source of timestamps, video time when analyzing recordings
+        self.clock = clock
+        # Where rep logic and overlay latencies are recorded (metrics.StageTimings)
+        self.timings = timings or NO_TIMINGS
+        # Landmark log of every analyzed frame (recording.LandmarkRecorder)
+        self.recorder = recorder
+
+        # Reset variables for each session
+        self.counter = 0
+        self.correct_reps = 0  # Track correct reps separately
+        self.stage = None
+        self.form_feedback = 'GOOD_FORM'
+
+        self.rep_start_time = None
+        self.rep_start_angle = None
+        self.rep_min_angle = 180
+        self.rep_max_angle = 0
+
+        self.lock_start_time = None
+        self.is_locked = False
+        self.lock_duration = 0
+
+        self.countdown_start = clock()
+        self.countdown_duration = 3
+        self.countdown_active = countdown
+
+        self.mp_drawing = mp.solutions.drawing_utils
+        self.mp_pose = mp.solutions.pose
+
+        # Landmark buffers reused for every frame
+        self.landmarks = LandmarkArray()
+        # Frame copy the overlays are drawn on, reused for every frame
+        self._display = None
+
+    def process(self, frame, results):
+        """
+        Run the rep logic on one frame and draw the overlays
+
+        Args:
+            frame: Captured BGR frame (left untouched)
+            results: MediaPipe Pose output for the frame
+
+        Returns:
+            Annotated BGR image (overwritten by the next call), or None if the frame should not be streamed
+            or the processor is headless
+        """
+        h, w, _ = frame.shape
+        countdown_text = None
+
+        if self.countdown_active:
+            elapsed = self.clock() - self.countdown_start
+            if elapsed < self.countdown_duration:
+                countdown_text = str(int(self.countdown_duration - elapsed) + 1)
+            else:
+                self.countdown_active = False
+                return None
+
+        start = time.perf_counter()
+        result = self.analyze(results.pose_landmarks, w, h)
+        analyzed = time.perf_counter()
+        self.timings.observe('rep_logic', analyzed - start)
+
+        if not self.draw:
+            return None
+        image = self._display_image(frame)
+        if countdown_text is not None:
+            self.render_countdown(image, countdown_text)
+        self.render(image, result, results.pose_landmarks)
+        self.timings.observe('overlay', time.perf_counter() - analyzed)
+        return image
+
+    def analyze(self, pose_landmarks, width, height):
+        """
+        Update the rep state machine from one frame of landmarks, without drawing
+
+        Args:
+            pose_landmarks: MediaPipe NormalizedLandmarkList, or None if nobody was detected
+            width, height: Frame size used to place the angle in pixels
+
+        Returns:
+            Dict with the counts, stage, feedback code, elbow angle and the
+            finished rep (or None) for this frame
+        """
+        result = {
+            'exercise': 'bicep',
+            'detected': False,
+            'angles': {},
+            'points': {},
+            'rep': None
+        }
+
+        try:
+            landmarks = self.landmarks.update(pose_landmarks.landmark, width, height)
+            angle = find_angles(landmarks.xy, [self.ARM])[0]
+
+            result['detected'] = True
+            result['angles']['elbow'] = angle
+            result['points']['elbow'] = tuple(landmarks.pixels[self.ARM[1]])
+            result['rep'] = self._update(angle)
+
+        except:
+            pass
+
+        result['counts'] = {'total': self.counter, 'correct': self.correct_reps}
+        result['stage'] = self.stage
+        result['feedback'] = self.form_feedback
+        result['locked'] = self.is_locked
+
+        if self.recorder is not None:
+            self.recorder.add(self.clock(), self.landmarks if result['detected'] else None, width, height, result)
+        return result
+
+    def _update(self, angle):
+        rep = None
+
+        if angle > self.LOCK_ANGLE_THRESHOLD and not self.is_locked:
+            if self.lock_start_time is None:
+                self.lock_start_time = self.clock()
+            else:
+                self.lock_duration = self.clock() - self.lock_start_time
+                if self.lock_duration > self.LOCK_TIME_THRESHOLD:
+                    self.is_locked = True
+                    self.form_feedback = 'LOCKED_JOINTS'
+        elif angle < self.LOCK_ANGLE_THRESHOLD:
+            self.lock_start_time = None
+            self.lock_duration = 0
+            if self.is_locked:
+                self.is_locked = False
+                if self.form_feedback == 'LOCKED_JOINTS':
+                    self.form_feedback = 'GOOD_FORM'
+
+        if self.stage == "down":
+            self.rep_min_angle = min(self.rep_min_angle, angle)
+            self.rep_max_angle = max(self.rep_max_angle, angle)
+
+        if angle > 160 and self.stage != "down":
+            self.stage = "down"
+            self.rep_start_time = self.clock()
+            self.rep_start_angle = angle
+            self.rep_min_angle = angle
+            self.rep_max_angle = angle
+            if self.is_locked:
+                self.form_feedback = 'LOCKED_JOINTS'
+
+        if angle < self.MIN_CURL_ANGLE and self.stage == "down":
+            self.stage = "up"
+            rep_end_time = self.clock()
+            rep_duration = rep_end_time - self.rep_start_time if self.rep_start_time is not None else 0
+            self.counter += 1
             
-            # If text is too long, reduce font size
-            if text_size[0] > feedback_width - 20:
-                font_scale = 0.5
-                text_size = cv2.getTextSize(form_text, font, font_scale, thickness)[0]
+            # Track correct reps
+            is_correct_rep = True
             
-            # Calculate text position to center it
-            text_x = feedback_x + (feedback_width - text_size[0]) // 2
-            text_y = 40
+            if rep_duration < self.MIN_REP_DURATION:
+                self.form_feedback = 'SLOW_DOWN'
+                is_correct_rep = False
+            elif self.is_locked or self.form_feedback == 'LOCKED_JOINTS':
+                is_correct_rep = False
+            else:
+                self.form_feedback = 'GOOD_FORM'
+                is_correct_rep = True
             
-            cv2.putText(image, 'FORM', (feedback_x + 5, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-            cv2.putText(image, form_text, (text_x, text_y), 
-                       font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
-
-            if is_locked:
-                cv2.circle(image, (w - 30, 100), 15, (0, 0, 255), -1)
-                cv2.putText(image, "LOCKED", (w - 100, 105), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2, cv2.LINE_AA)
-
-            mp_drawing.draw_landmarks(image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                                      mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
-                                      mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2))
-
-            ret, buffer = cv2.imencode('.jpg', image)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            if is_correct_rep:
+                self.correct_reps += 1
+
+            rep = {
+                'number': self.counter,
+                'correct': is_correct_rep,
+                'duration': rep_duration,
+                'min_angle': self.rep_min_angle,
+                'max_angle': self.rep_max_angle,
+                'feedback': self.form_feedback,
+                'feedback_codes': [] if is_correct_rep else [self.form_feedback]
+            }
+
+            self.rep_start_time = None
+            self.rep_start_angle = None
+            self.rep_min_angle = 180
+            self.rep_max_angle = 0
+
+        if self.stage == "down" and angle > self.HALF_REP_THRESHOLD and self.rep_min_angle < angle and self.rep_min_angle > self.MIN_CURL_ANGLE:
+            if angle - self.rep_min_angle > 20:
+                self.form_feedback = 'HALF_REP'
+                self.stage = None
+                self.rep_start_time = None
+                self.rep_min_angle = 180
+                self.rep_max_angle = 0
+
+        return rep
+
+    def _display_image(self, frame):
+        # Captured frames are shared read-only, draw on a copy
+        self._display = copy_to_buffer(self._display, frame)
+        return self._display
+
+    def render_countdown(self, image, countdown_text):
+        h, w, _ = image.shape
+        font_scale = 7
+        text_size = cv2.getTextSize(countdown_text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
+        text_x = int((w - text_size[0]) / 2)
+        text_y = int((h + text_size[1]) / 2)
+        cv2.putText(image, countdown_text, (text_x, text_y), 
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
+
+    def render(self, image, result, pose_landmarks=None):
+        """
+        Draw the overlays for an analyze() result onto a BGR image in place
+        """
+        mp_drawing = self.mp_drawing
+        mp_pose = self.mp_pose
+        h, w, _ = image.shape
+
+        if 'elbow' in result['angles']:
+            cv2.putText(image, str(round(result['angles']['elbow'], 2)), result['points']['elbow'], 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
+
+        form_text, feedback_color = FEEDBACK[result['feedback']]
+        draw_counter_bar(image, result['counts']['total'], result['counts']['correct'], form_text,
+                         (245, 117, 16), (0, 255, 0), feedback_color)
+
+        if result['locked']:
+            draw_sprite(image, (
+                ('circle', (70, -5), 15, (0, 0, 255)),
+                ('text', "LOCKED", (0, 0), 0.5, (0, 0, 255), 2)
+            ), (w - 100, 105))
+
+        mp_drawing.draw_landmarks(image, pose_landmarks, mp_pose.POSE_CONNECTIONS,
+                                  mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
+                                  mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2))
+
+def bicep_curl_detection(cap, queue_sizes=None, inference_options=None, encoder_options=None, pose_pool=POSE_POOL):
+    timings = StageTimings('bicep', getattr(cap, 'station', None))
+    with pose_pool.checkout(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose, \
+            recording('bicep', 'bicep', station=getattr(cap, 'station', None)) as recorder:
+        processor = BicepCurlProcessor(timings=timings, recorder=recorder)
+        yield from StreamPipeline(cap, pose_inference(pose, inference_options, timings), processor.process, queue_sizes,
+                                  make_encoder(encoder_options), timings)
+
+def bicep_curl_data(cap, queue_sizes=None, inference_options=None, pose_pool=POSE_POOL):
+    """
+    Like bicep_curl_detection, but yields analysis packets instead of video
+    """
+    timings = StageTimings('bicep-data', getattr(cap, 'station', None))
+    with pose_pool.checkout(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose, \
+            recording('bicep-data', 'bicep', station=getattr(cap, 'station', None)) as recorder:
+        processor = BicepCurlProcessor(draw=False, countdown=False, timings=timings, recorder=recorder)
+
+        def analyze(frame, results):
+            h, w = frame.shape[:2]
+            start = time.perf_counter()
+            result = processor.analyze(results.pose_landmarks, w, h)
+            timings.observe('rep_logic', time.perf_counter() - start)
+            return make_packet(result, processor.landmarks)
+
+        yield from StreamPipeline(cap, pose_inference(pose, inference_options, timings), analyze, queue_sizes,
+                                  PacketEncoder(), timings)
 
 # # bicep_curl.py
 
@@ -0,0 +1,129 @@
+# broadcast.py
+
+import threading
+import time
+
+from capture import FrameBroadcast
+
+
+class SharedStream:
+    """
+    One running detection stream and the viewers attached to it
+    """
+
+    def __init__(self, key):
+        self.key = key
+        # Encoded MJPEG parts, viewers always pick up the newest one
+        self.parts = FrameBroadcast(ring_size=2)
+        self.viewers = 0
+        self.idle_since = None
+        self.stopping = False
+        self.thread = None
+
+
+class StreamBroadcaster:
+    """
+    Runs each detection stream once and fans its MJPEG parts out to every viewer.
+
+    Streams are keyed by (camera, exercise). The first viewer of a key starts
+    the producer, later viewers attach to it, so detection and JPEG encoding
+    cost the same for one viewer or ten. A viewer that falls behind skips to
+    the newest part instead of buffering. The producer is stopped once it has
+    had no viewers for `linger` seconds, which keeps a page reload from
+    restarting the whole stream.
+    """
+
+    def __init__(self, linger=5.0, viewer_timeout=5.0):
+        self.linger = linger
+        self.viewer_timeout = viewer_timeout
+
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, factory):
+        """
+        Generator of MJPEG parts for one viewer
+
+        Args:
+            key: Hashable stream identity, e.g. (camera source, exercise)
+            factory: Called without arguments to start the producer, returns a
+                     generator of parts (a *_detection or *_data generator)
+        """
+        def view():
+            # Attach lazily, a response that is never iterated never counts as a viewer
+            shared = self._join(key, factory)
+            seq = 0
+            try:
+                while True:
+                    seq, part = shared.parts.wait_newer(seq, timeout=self.viewer_timeout)
+                    if part is None:
+                        if shared.parts.closed:
+                            break
+                        continue
+                    yield part
+            finally:
+                self._leave(shared)
+
+        return view()
+
+    async def astream(self, key, factory):
+        """
+        Async generator of parts for one viewer, see `stream`. Waiting for
+        the next part costs a coroutine, not a thread, so an ASGI server can
+        hold many idle or slow viewers.
+        """
+        shared = self._join(key, factory)
+        seq = 0
+        try:
+            while True:
+                seq, part = await shared.parts.wait_newer_async(seq, timeout=self.viewer_timeout)
+                if part is None:
+                    if shared.parts.closed:
+                        break
+                    continue
+                yield part
+        finally:
+            self._leave(shared)
+
+    def _join(self, key, factory):
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = SharedStream(key)
+                shared.thread = threading.Thread(target=self._produce, args=(shared, factory), name=f"broadcast-{key}", daemon=True)
+                self._streams[key] = shared
+                shared.thread.start()
+            shared.viewers += 1
+            return shared
+
+    def _leave(self, shared):
+        with self._lock:
+            shared.viewers -= 1
+            if shared.viewers == 0:
+                shared.idle_since = time.monotonic()
+
+    def _should_stop(self, shared):
+        with self._lock:
+            if shared.viewers == 0 and time.monotonic() - shared.idle_since >= self.linger:
+                # Decided under the lock, so no viewer can attach to a stopping stream
+                shared.stopping = True
+                del self._streams[shared.key]
+            return shared.stopping
+
+    def _produce(self, shared, factory):
+        source = factory()
+        try:
+            for part in source:
+                shared.parts.publish(part)
+                if self._should_stop(shared):
+                    break
+        except Exception as e:
+            print(f"Broadcast {shared.key} failed: {e}")
+        finally:
+            # Runs the detection generator's cleanup (pipeline, pose graph, session)
+            source.close()
+            with self._lock:
+                if not shared.stopping:
+                    shared.stopping = True
+                    del self._streams[shared.key]
+            shared.parts.close()
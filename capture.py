@@ -0,0 +1,386 @@
+# capture.py
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# Number of consecutive failed reads before the reader gives up on the device
+MAX_READ_FAILURES = 50
+
+# Width, height every camera of a CameraRegistry is asked for, the overlays are laid out for it
+CAMERA_RESOLUTION = (640, 480)
+
+
+def parse_camera_sources(spec):
+    """
+    Parse a camera list like "front=0,back=1,door=rtsp://10.0.0.5/stream"
+    into {camera id: source}. Digits become device indexes, anything else
+    is a file path or stream URL passed to cv2.VideoCapture as is. An entry
+    without a name uses its source as the id ("0,1" -> {'0': 0, '1': 1}).
+    """
+    sources = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        camera_id, sep, source = entry.partition('=')
+        if not sep:
+            source = camera_id
+        source = source.strip()
+        sources[camera_id.strip()] = int(source) if source.isdigit() else source
+    return sources
+
+
+def pin_thread(cpus):
+    """
+    Restrict the calling thread to `cpus` (Linux only, a no-op elsewhere)
+    """
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return
+    try:
+        # pid 0 is the calling thread, not the whole process
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        print(f"Could not pin thread to CPUs {sorted(cpus)}: {e}")
+
+
+def _is_file_source(source):
+    return isinstance(source, str) and '://' not in source
+
+
+class FrameBroadcast:
+    """
+    Single-writer, many-reader fan-out of the newest items.
+
+    The writer never waits on readers: items go into a small ring and every
+    waiting reader is woken up. Readers always jump straight to the newest
+    item, so a slow reader skips items instead of building up a backlog.
+
+    Readers can be threads (`wait_newer`) or coroutines (`wait_newer_async`).
+    Coroutines are woken through their event loop, once per loop per item,
+    however many of them are waiting.
+    """
+
+    def __init__(self, ring_size=3):
+        self._ring = deque(maxlen=ring_size)
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        # event loop -> asyncio.Events of the coroutines waiting on it
+        self._async_waiters = {}
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, item):
+        with self._cond:
+            self._seq += 1
+            self._ring.append((self._seq, item))
+            self._cond.notify_all()
+            waiters = [(loop, list(events)) for loop, events in self._async_waiters.items()]
+        self._wake_async(waiters)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            waiters = [(loop, list(events)) for loop, events in self._async_waiters.items()]
+        self._wake_async(waiters)
+
+    @staticmethod
+    def _wake_async(waiters):
+        for loop, events in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_events, events)
+            except RuntimeError:
+                # The loop was closed, its waiters are gone with it
+                pass
+
+    def latest(self):
+        """
+        Return the newest (seq, item) pair, or (0, None) if nothing was published yet
+        """
+        with self._cond:
+            if not self._ring:
+                return 0, None
+            return self._ring[-1]
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Block until an item newer than `seq` is available
+
+        Args:
+            seq: Sequence number of the last item the reader has seen
+            timeout: Seconds to wait before giving up (None waits forever)
+
+        Returns:
+            (seq, item) of the newest item, or (seq, None) if the broadcast
+            was closed or the timeout expired
+        """
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._closed or (self._ring and self._ring[-1][0] > seq),
+                timeout=timeout
+            )
+            if not ready or not self._ring or self._ring[-1][0] <= seq:
+                return seq, None
+            return self._ring[-1]
+
+    async def wait_newer_async(self, seq, timeout=None):
+        """
+        Coroutine version of `wait_newer`, waits without blocking a thread
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        with self._cond:
+            self._async_waiters.setdefault(loop, set()).add(event)
+        try:
+            while True:
+                # Cleared before checking, so a publish in between is not missed
+                event.clear()
+                newest, item = self.wait_newer(seq, timeout=0)
+                if item is not None or self._closed:
+                    return newest, item
+
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return seq, None
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return seq, None
+        finally:
+            with self._cond:
+                events = self._async_waiters[loop]
+                events.discard(event)
+                if not events:
+                    del self._async_waiters[loop]
+
+
+def _set_events(events):
+    for event in events:
+        event.set()
+
+
+class CaptureService:
+    """
+    Owns one capture device and reads it on a background thread.
+
+    Frames are published read-only into a FrameBroadcast so any number of
+    route generators can share the camera at full sensor frame rate.
+
+    Args:
+        source: Device index, video file path or stream URL
+        ring_size: Frames kept for subscribers
+        cpus: CPU ids the reader and this camera's pipelines run on, None for any
+        station: Name the camera's rep events are stored under (its camera id)
+        resolution: (width, height) to ask the device for when it opens, None keeps its default
+    """
+
+    def __init__(self, source=0, ring_size=3, cpus=None, station=None, resolution=None):
+        self.source = source
+        self.ring_size = ring_size
+        self.cpus = cpus
+        self.station = station
+        self.frames = FrameBroadcast(ring_size)
+
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._pending_props = {}
+        self._props = {}
+
+        # Set once for the device, every stream reading it sees the same frame size
+        if resolution is not None:
+            self.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            self.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.frames.closed:
+                self.frames = FrameBroadcast(self.ring_size)
+            self._running = True
+            self._thread = threading.Thread(target=self._reader, name=f"capture-{self.source}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def set(self, prop, value):
+        # Applied by the reader thread so the device is only touched from one place
+        with self._lock:
+            self._pending_props[prop] = value
+            self._props[prop] = value
+        return True
+
+    def get(self, prop):
+        return self._props.get(prop, 0)
+
+    def subscribe(self):
+        self.start()
+        return CaptureSubscriber(self)
+
+    def _reader(self):
+        pin_thread(self.cpus)
+
+        cap = cv2.VideoCapture(self.source)
+        for prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS):
+            self._props.setdefault(prop, cap.get(prop))
+        failures = 0
+
+        # Files would otherwise be read as fast as they decode, play them back in real time
+        fps = cap.get(cv2.CAP_PROP_FPS) if _is_file_source(self.source) else 0
+        frame_interval = 1.0 / fps if fps > 0 else 0
+        next_frame = time.monotonic()
+
+        while self._running:
+            with self._lock:
+                pending, self._pending_props = self._pending_props, {}
+            for prop, value in pending.items():
+                cap.set(prop, value)
+
+            ret, frame = cap.read()
+            if not ret:
+                failures += 1
+                if failures >= MAX_READ_FAILURES or not cap.isOpened():
+                    print(f"Capture {self.source}: failed to grab frame, stopping reader")
+                    break
+                time.sleep(0.01)
+                continue
+            failures = 0
+
+            # Shared between subscribers, nobody may draw on it in place
+            frame.flags.writeable = False
+            self.frames.publish(frame)
+
+            if frame_interval:
+                next_frame = max(next_frame + frame_interval, time.monotonic() - frame_interval)
+                time.sleep(max(0.0, next_frame - time.monotonic()))
+
+        cap.release()
+        self._running = False
+        self.frames.close()
+
+
+class CaptureSubscriber:
+    """
+    Per-stream view of a CaptureService with the cv2.VideoCapture interface.
+
+    `read()` returns the newest frame the stream has not seen yet, so the
+    detectors can keep calling `cap.read()` without stealing frames from
+    each other.
+    """
+
+    def __init__(self, service, timeout=5.0):
+        self.service = service
+        self.timeout = timeout
+        # Pipelines reading this subscriber pin their stages to the camera's CPUs
+        self.cpus = service.cpus
+        self.station = service.station
+        self._frames = service.frames
+        self._seq = 0
+        self._released = False
+
+    def isOpened(self):
+        return not self._released and not self._frames.closed
+
+    def read(self):
+        if self._released:
+            return False, None
+        self._seq, frame = self._frames.wait_newer(self._seq, timeout=self.timeout)
+        if frame is None:
+            return False, None
+        return True, frame
+
+    def set(self, prop, value):
+        return self.service.set(prop, value)
+
+    def get(self, prop):
+        return self.service.get(prop)
+
+    def release(self):
+        # Only detaches this stream, the device stays open for everyone else
+        self._released = True
+
+
+class CameraRegistry:
+    """
+    The cameras of one host, by id, each with its own CaptureService.
+
+    Services start on their first subscriber. With `pin_cpus` the host's
+    CPUs are split evenly between the cameras, and each camera's capture
+    reader and detection pipelines stay on its share, so busy stations do
+    not compete for the same cores.
+
+    Args:
+        sources: {camera id: device index, file path or stream URL}
+        pin_cpus: Give every camera its own CPUs (Linux only)
+        resolution: (width, height) every camera is opened at, None for device defaults
+    """
+
+    def __init__(self, sources, pin_cpus=False, resolution=CAMERA_RESOLUTION):
+        if not sources:
+            raise ValueError("At least one camera source is required")
+
+        self.sources = dict(sources)
+        self.default = next(iter(self.sources))
+        self.cpus = self._assign_cpus(list(self.sources)) if pin_cpus else {}
+        self.resolution = resolution
+
+        self._services = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _assign_cpus(camera_ids):
+        if hasattr(os, 'sched_getaffinity'):
+            available = sorted(os.sched_getaffinity(0))
+        else:
+            available = list(range(os.cpu_count() or 1))
+
+        # Contiguous equal shares, cameras share cores only when there are more cameras than cores
+        share = max(1, len(available) // len(camera_ids))
+        cpus = {}
+        for i, camera_id in enumerate(camera_ids):
+            start = (i * share) % len(available)
+            cpus[camera_id] = set(available[start:start + share])
+        return cpus
+
+    def ids(self):
+        return list(self.sources)
+
+    def get(self, camera_id=None):
+        """
+        CaptureService of `camera_id` (the first camera when None)
+
+        Raises:
+            KeyError: Unknown camera id
+        """
+        if camera_id is None:
+            camera_id = self.default
+        if camera_id not in self.sources:
+            raise KeyError(camera_id)
+
+        with self._lock:
+            service = self._services.get(camera_id)
+            if service is None:
+                service = CaptureService(self.sources[camera_id], cpus=self.cpus.get(camera_id), station=str(camera_id),
+                                         resolution=self.resolution)
+                self._services[camera_id] = service
+            return service
+
+    def stop(self):
+        with self._lock:
+            services = list(self._services.values())
+        for service in services:
+            service.stop()
@@ -0,0 +1,122 @@
+# encoder.py
+
+import cv2
+import numpy as np
+
+# libjpeg-turbo through PyTurboJPEG is optional, OpenCV is the fallback
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJSAMP_422, TJSAMP_444
+except ImportError:
+    TurboJPEG = None
+
+# Default JPEG settings of every stream, routes can override them. These
+# match what cv2.imencode does without parameters.
+ENCODER_OPTIONS = {
+    # JPEG quality, 0-100
+    'quality': 95,
+    # Chroma subsampling: '444', '422' or '420'
+    'subsampling': '420',
+    # Output size relative to the rendered frame
+    'scale': 1.0,
+    # 'auto' (turbo when installed), 'turbo' or 'opencv'
+    'backend': 'auto'
+}
+
+MJPEG_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_TRAILER = b'\r\n'
+
+_CV2_SUBSAMPLING = {
+    '444': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+    '422': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+    '420': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420
+}
+
+_turbo = None
+
+
+def _get_turbo():
+    # One shared instance, loading the library is not free
+    global _turbo
+    if _turbo is None:
+        _turbo = TurboJPEG()
+    return _turbo
+
+
+def mjpeg_part(jpeg):
+    """
+    Frame one encoded JPEG (any bytes-like object) as a part of a
+    multipart/x-mixed-replace stream, copying it exactly once
+    """
+    return b''.join((MJPEG_HEADER, jpeg, MJPEG_TRAILER))
+
+
+class JpegEncoder:
+    """
+    Encodes rendered BGR frames into MJPEG stream parts.
+
+    Args:
+        quality: JPEG quality, 0-100
+        subsampling: Chroma subsampling, '444', '422' or '420'
+        scale: Output size relative to the input frame, e.g. 0.5
+        backend: 'auto', 'turbo' or 'opencv'
+    """
+
+    def __init__(self, quality=95, subsampling='420', scale=1.0, backend='auto'):
+        if subsampling not in _CV2_SUBSAMPLING:
+            raise ValueError(f"Unknown subsampling: {subsampling}")
+        if backend not in ('auto', 'turbo', 'opencv'):
+            raise ValueError(f"Unknown encoder backend: {backend}")
+        if backend == 'turbo' and TurboJPEG is None:
+            raise RuntimeError("The turbo backend needs PyTurboJPEG (pip install PyTurboJPEG)")
+
+        self.quality = quality
+        self.subsampling = subsampling
+        self.scale = scale
+        self.backend = 'turbo' if backend == 'turbo' or (backend == 'auto' and TurboJPEG is not None) else 'opencv'
+
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, quality,
+                        cv2.IMWRITE_JPEG_SAMPLING_FACTOR, _CV2_SUBSAMPLING[subsampling]]
+        if self.backend == 'turbo':
+            self._turbo_subsampling = {'444': TJSAMP_444, '422': TJSAMP_422, '420': TJSAMP_420}[subsampling]
+
+        # Downscaled frame, reused while the input size holds
+        self._scaled = None
+
+    def encode(self, image):
+        """
+        Encode a BGR image, returns a bytes-like JPEG or None on failure
+        """
+        if self.scale != 1.0:
+            h, w = image.shape[:2]
+            size = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+            if self._scaled is None or self._scaled.shape[:2] != (size[1], size[0]):
+                self._scaled = np.empty((size[1], size[0], image.shape[2]), dtype=np.uint8)
+            image = cv2.resize(image, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+
+        if self.backend == 'turbo':
+            return _get_turbo().encode(image, quality=self.quality, pixel_format=TJPF_BGR,
+                                       jpeg_subsample=self._turbo_subsampling)
+
+        ret, buffer = cv2.imencode('.jpg', image, self._params)
+        if not ret:
+            return None
+        # The encoded array itself, mjpeg_part copies it once into the part
+        return buffer.data
+
+    def encode_part(self, image):
+        """
+        Encode a BGR image straight into a ready-to-send MJPEG part
+        """
+        jpeg = self.encode(image)
+        if jpeg is None:
+            return None
+        return mjpeg_part(jpeg)
+
+
+def make_encoder(options=None):
+    """
+    Build a JpegEncoder from ENCODER_OPTIONS with per-route overrides
+    """
+    config = dict(ENCODER_OPTIONS)
+    config.update(options or {})
+    return JpegEncoder(**config)
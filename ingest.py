@@ -0,0 +1,275 @@
+# ingest.py
+#
+# Analysis backend mode: instead of reading the server's camera, browsers
+# push their own frames (JPEG or WebP, any size) and get analysis packets
+# back. Each remote client gets an IngestSession running the exercise's
+# *_data pipeline on an IngestSource, a VideoCapture-style source that is
+# fed by the client instead of a device.
+#
+# Backpressure is latest-wins all the way through: a frame that arrives
+# while the previous one is still waiting to be decoded replaces it, and the
+# pipeline drops anything the model cannot keep up with. A busy server
+# therefore analyzes fewer frames per client instead of queueing latency.
+
+import asyncio
+import itertools
+import secrets
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture import FrameBroadcast
+from pipeline import LatestQueue
+
+INGEST_OPTIONS = {
+    # Concurrent remote clients, each holds one Pose graph
+    'max_sessions': 8,
+    # Close sessions that have not pushed a frame for this many seconds
+    'idle_timeout': 15.0,
+    # Reject uploads larger than this
+    'max_frame_bytes': 2 * 1024 * 1024
+}
+
+
+class IngestSource:
+    """
+    cv2.VideoCapture-style source of frames pushed by a remote client.
+
+    `push()` only queues the encoded bytes; decoding happens in `read()`,
+    on the pipeline's capture thread, so request handlers return right away.
+    """
+
+    def __init__(self):
+        self._frames = LatestQueue(1)
+        self._closed = False
+        self.received = 0
+        # Frames that could not be decoded
+        self.corrupt = 0
+
+    @property
+    def dropped(self):
+        # Frames replaced by a newer one before they were decoded
+        return self._frames.dropped
+
+    def push(self, data):
+        self.received += 1
+        self._frames.put(data)
+
+    def isOpened(self):
+        return not self._closed
+
+    def read(self):
+        while True:
+            data = self._frames.get()
+            if data is None:
+                return False, None
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                return True, frame
+            self.corrupt += 1
+
+    def set(self, prop, value):
+        # The client picks the resolution
+        return False
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        self._closed = True
+        self._frames.close()
+
+
+class IngestSession:
+    """
+    One remote client: its frame source, its analysis stream and the
+    latest analysis parts (PacketEncoder dicts) it produced
+    """
+
+    def __init__(self, session_id, exercise):
+        self.id = session_id
+        self.exercise = exercise
+        self.source = IngestSource()
+        self.results = FrameBroadcast(ring_size=1)
+        self.closed = False
+        self.last_active = time.monotonic()
+        self.thread = None
+
+    def push(self, data):
+        self.last_active = time.monotonic()
+        self.source.push(data)
+
+    def latest(self):
+        """
+        (seq, part) of the newest analysis, part is None before the first one
+        """
+        return self.results.latest()
+
+    def stats(self):
+        return {
+            'received': self.source.received,
+            'dropped': self.source.dropped,
+            'corrupt': self.source.corrupt
+        }
+
+    def reply(self, fmt='json'):
+        """
+        HTTP answer to a pushed frame: (status, body, mimetype, headers) with
+        the newest analysis so far, frames are analyzed asynchronously
+        """
+        headers = {f'X-Frames-{name.title()}': str(value) for name, value in self.stats().items()}
+        seq, part = self.latest()
+        if part is None:
+            return 202, b'', None, headers
+
+        headers['X-Result-Seq'] = str(seq)
+        if fmt == 'binary':
+            return 200, part['binary'], 'application/octet-stream', headers
+        return 200, part['json'], 'application/json', headers
+
+
+class IngestManager:
+    """
+    Opens, feeds and reaps the sessions of remote clients.
+
+    Args:
+        factories: Exercise name -> *_data generator function taking a capture source
+        max_sessions, idle_timeout: See INGEST_OPTIONS
+        reap_interval: Seconds between idle checks
+    """
+
+    def __init__(self, factories, max_sessions=8, idle_timeout=15.0, max_frame_bytes=2 * 1024 * 1024, reap_interval=5.0):
+        self.factories = factories
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_frame_bytes = max_frame_bytes
+        self.reap_interval = reap_interval
+
+        self.sessions = {}
+        self._names = itertools.count(1)
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def open(self, exercise):
+        """
+        Start a session for `exercise`
+
+        Raises:
+            ValueError: Unknown exercise
+            RuntimeError: All max_sessions slots are taken
+        """
+        factory = self.factories.get(exercise)
+        if factory is None:
+            raise ValueError(f"Unknown exercise: {exercise}")
+
+        self._start_reaper()
+
+        with self._lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise RuntimeError("Too many ingest sessions")
+            # Unguessable, the id is all a client needs to push frames
+            session = IngestSession(secrets.token_urlsafe(16), exercise)
+            self.sessions[session.id] = session
+
+        session.thread = threading.Thread(target=self._produce, args=(session, factory),
+                                          name=f"ingest-{exercise}-{next(self._names)}", daemon=True)
+        session.thread.start()
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session):
+        with self._lock:
+            if self.sessions.pop(session.id, None) is None:
+                return
+        session.closed = True
+        # Ends the pipeline's capture stage, the producer cleans up from there
+        session.source.release()
+
+    def _produce(self, session, factory):
+        source = factory(session.source)
+        try:
+            for part in source:
+                session.results.publish(part)
+        except Exception as e:
+            print(f"Ingest session {session.exercise} failed: {e}")
+        finally:
+            source.close()
+            session.results.close()
+            self.close(session)
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap, name='ingest-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(self.reap_interval)
+
+            now = time.monotonic()
+            with self._lock:
+                idle = [s for s in self.sessions.values() if now - s.last_active > self.idle_timeout]
+
+            for session in idle:
+                print(f"Closing idle ingest session {session.exercise}")
+                self.close(session)
+
+
+def serve_websocket(manager, ws, exercise, fmt='json', poll_interval=0.01):
+    """
+    Run one ingest session over a WebSocket (flask-sock): binary messages
+    from the client are frames, every new analysis is sent back as a text
+    (json) or binary message
+    """
+    session = manager.open(exercise)
+    seq = 0
+    try:
+        while not session.closed:
+            data = ws.receive(timeout=poll_interval)
+            if isinstance(data, bytes):
+                if len(data) > manager.max_frame_bytes:
+                    continue
+                session.push(data)
+
+            newest, part = session.results.latest()
+            if part is not None and newest != seq:
+                seq = newest
+                ws.send(part['json'].decode() if fmt == 'json' else part['binary'])
+    finally:
+        manager.close(session)
+
+
+async def serve_websocket_async(manager, websocket, exercise, fmt='json'):
+    """
+    serve_websocket for ASGI (Quart) websockets: receiving frames and sending
+    results are both awaited, so an idle client holds no thread
+    """
+    session = manager.open(exercise)
+
+    async def receive_frames():
+        while not session.closed:
+            data = await websocket.receive()
+            if isinstance(data, bytes) and len(data) <= manager.max_frame_bytes:
+                session.push(data)
+
+    receiver = asyncio.ensure_future(receive_frames())
+    seq = 0
+    try:
+        while not receiver.done():
+            newest, part = await session.results.wait_newer_async(seq, timeout=1.0)
+            if part is None:
+                if session.results.closed:
+                    break
+                continue
+            seq = newest
+            await websocket.send(part['json'].decode() if fmt == 'json' else part['binary'])
+    finally:
+        receiver.cancel()
+        manager.close(session)
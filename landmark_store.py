@@ -0,0 +1,319 @@
+# landmark_store.py
+#
+# Append-only, memory-mapped store of session landmarks for analytics.
+#
+#   <root>/sessions.idx          SESSION_DTYPE records, one per session
+#   <root>/reps.idx              REP_DTYPE records, one per finished rep
+#   <root>/frames/<session>.lmk  (frames, 33, 4) float32 x, y, z, visibility,
+#                                the LandmarkArray.data layout, NaN where
+#                                nobody was detected
+#   <root>/frames/<session>.ts   (frames,) float64 processor clock, seconds
+#                                since the epoch for live streams
+#
+# Every session appends only to its own frame files, so live sessions never
+# contend. The two index files are shared and appended to under an
+# exclusive flock, which keeps appends from several server processes apart
+# as well. Rep records are written after the frames they point at, so a
+# reader never sees a rep past the end of its session's files.
+#
+# Readers memory-map the files read-only: slicing one rep out of months of
+# sessions only touches the pages of that rep, e.g.
+#
+#     store = LandmarkStore('/var/lib/gymgenius/landmarks')
+#     for rep in store.reps(exercise='squat'):
+#         frames = store.rep_landmarks(rep)     # (n, 33, 4) view, no copy
+
+import fcntl
+import os
+import queue
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import numpy as np
+
+from squat_modules.utils import NUM_LANDMARKS
+
+# Exercise name -> code stored in the index records
+EXERCISE_CODES = {
+    'bicep': 1,
+    'pushup': 2,
+    'squat': 3
+}
+
+SESSION_DTYPE = np.dtype([
+    ('session', '<u8'),
+    ('exercise', 'u1'),
+    # Processor clock of the first frame, wall-clock time for live streams
+    ('started', '<f8'),
+    ('width', '<u2'),
+    ('height', '<u2')
+])
+
+REP_DTYPE = np.dtype([
+    ('session', '<u8'),
+    ('rep', '<u4'),
+    ('exercise', 'u1'),
+    # Frames [start_frame, end_frame] of the session's frame files
+    ('start_frame', '<u8'),
+    ('end_frame', '<u8'),
+    ('start', '<f8'),
+    ('end', '<f8'),
+    ('correct', '?')
+])
+
+FRAME_SHAPE = (NUM_LANDMARKS, 4)
+
+# Frames a session buffers before handing them to the writer thread
+FLUSH_FRAMES = 256
+
+
+def _map(path, dtype, shape=()):
+    """
+    Read-only memory map of the whole records in `path`, empty if there are none
+    """
+    record_size = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+    try:
+        count = os.path.getsize(path) // record_size
+    except FileNotFoundError:
+        count = 0
+    if count == 0:
+        return np.empty((0,) + shape, dtype=dtype)
+    # Whole records only, a writer may be halfway through appending one
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,) + shape)
+
+
+@contextmanager
+def _locked_append(path):
+    # Index files are shared by every session and process appending to the store
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def _append(fd, data):
+    view = memoryview(data).cast('B')
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class StoreSession:
+    """
+    Writer for one live session, fed like a recording.LandmarkRecorder.
+
+    `add()` only copies into the current chunk; full chunks, the session
+    record and rep records are written by the store's writer thread.
+    """
+
+    def __init__(self, store, exercise):
+        self.store = store
+        self.exercise = exercise
+        # Assigned by the writer thread when the first chunk is written
+        self.id = None
+        self.frames = 0
+        self.reps = 0
+
+        self._times = array('d')
+        self._last_rep_end = -1
+        self._chunk = None
+        self._fds = None
+        self._closed = False
+
+    def _new_chunk(self):
+        return {
+            'count': 0,
+            'landmarks': np.empty((FLUSH_FRAMES,) + FRAME_SHAPE, dtype=np.float32),
+            'timestamps': np.empty(FLUSH_FRAMES, dtype=np.float64),
+            'size': None,
+            'reps': []
+        }
+
+    def add(self, timestamp, landmarks, width, height, result):
+        """
+        Append one analyzed frame, see recording.LandmarkRecorder.add
+        """
+        if self._closed:
+            return
+        if self._chunk is None:
+            self._chunk = self._new_chunk()
+        chunk = self._chunk
+
+        index = chunk['count']
+        if landmarks is None:
+            chunk['landmarks'][index] = np.nan
+        else:
+            chunk['landmarks'][index] = landmarks.data
+        chunk['timestamps'][index] = timestamp
+        if chunk['size'] is None:
+            chunk['size'] = (width, height)
+        chunk['count'] += 1
+        self._times.append(timestamp)
+
+        rep = result['rep']
+        if rep is not None:
+            self._add_rep(rep, timestamp)
+        self.frames += 1
+
+        if chunk['count'] == FLUSH_FRAMES:
+            self._hand_off()
+
+    def _add_rep(self, rep, end):
+        end_frame = self.frames
+        duration = rep.get('duration')
+        if duration:
+            start_frame = bisect_left(self._times, end - duration)
+        else:
+            # Reps without a measured duration span back to the previous rep
+            start_frame = self._last_rep_end + 1
+        start_frame = min(max(start_frame, self._last_rep_end + 1, 0), end_frame)
+        self._last_rep_end = end_frame
+        self.reps += 1
+
+        number = rep.get('number') or self.reps
+        self._chunk['reps'].append((number, start_frame, end_frame, self._times[start_frame], end, bool(rep['correct'])))
+
+    def _hand_off(self):
+        self.store._submit(self, self._chunk)
+        self._chunk = None
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._chunk is not None and self._chunk['count']:
+            self._hand_off()
+        self.store._submit(self, None)
+
+
+class LandmarkStore:
+    """
+    Appends live sessions to, and maps stored sessions from, the store at `root`
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.frames_dir = os.path.join(root, 'frames')
+        os.makedirs(self.frames_dir, exist_ok=True)
+        self.sessions_path = os.path.join(root, 'sessions.idx')
+        self.reps_path = os.path.join(root, 'reps.idx')
+
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    # Writing
+
+    def open_session(self, exercise):
+        if exercise not in EXERCISE_CODES:
+            raise ValueError(f"Unknown exercise: {exercise}")
+        self._start_writer()
+        return StoreSession(self, exercise)
+
+    def _submit(self, session, chunk):
+        # chunk None closes the session's files
+        self._queue.put((session, chunk))
+
+    def flush(self):
+        """
+        Wait until everything handed to the writer so far is on disk
+        """
+        self._queue.join()
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._write_loop, name='landmark-store', daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            session, chunk = self._queue.get()
+            try:
+                if chunk is None:
+                    self._close_files(session)
+                else:
+                    self._write_chunk(session, chunk)
+            except OSError as e:
+                print(f"Landmark store write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_chunk(self, session, chunk):
+        if session.id is None:
+            record = np.zeros(1, dtype=SESSION_DTYPE)
+            record['exercise'] = EXERCISE_CODES[session.exercise]
+            record['started'] = chunk['timestamps'][0]
+            record['width'], record['height'] = chunk['size']
+            session.id = self._append_session(record)
+            base = os.path.join(self.frames_dir, str(session.id))
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+            session._fds = (os.open(base + '.lmk', flags, 0o644), os.open(base + '.ts', flags, 0o644))
+
+        count = chunk['count']
+        landmarks_fd, timestamps_fd = session._fds
+        _append(landmarks_fd, chunk['landmarks'][:count])
+        _append(timestamps_fd, chunk['timestamps'][:count])
+
+        if chunk['reps']:
+            code = EXERCISE_CODES[session.exercise]
+            records = np.array([(session.id, number, code, start_frame, end_frame, start, end, correct)
+                                for number, start_frame, end_frame, start, end, correct in chunk['reps']],
+                               dtype=REP_DTYPE)
+            with _locked_append(self.reps_path) as fd:
+                _append(fd, records.tobytes())
+
+    def _append_session(self, record):
+        with _locked_append(self.sessions_path) as fd:
+            # Session ids are positions in sessions.idx, taken under the lock
+            session_id = os.fstat(fd).st_size // SESSION_DTYPE.itemsize
+            record['session'] = session_id
+            _append(fd, record.tobytes())
+        return session_id
+
+    def _close_files(self, session):
+        if session._fds is not None:
+            for fd in session._fds:
+                os.close(fd)
+            session._fds = None
+
+    # Reading
+
+    def sessions(self):
+        """
+        SESSION_DTYPE records of every stored session, memory mapped
+        """
+        return _map(self.sessions_path, SESSION_DTYPE)
+
+    def reps(self, exercise=None, session=None):
+        """
+        REP_DTYPE records, memory mapped, or filtered copies when `exercise`
+        and/or `session` are given
+        """
+        reps = _map(self.reps_path, REP_DTYPE)
+        mask = np.ones(len(reps), dtype=bool)
+        if exercise is not None:
+            mask &= reps['exercise'] == EXERCISE_CODES[exercise]
+        if session is not None:
+            mask &= reps['session'] == session
+        return reps if mask.all() else reps[mask]
+
+    def landmarks(self, session):
+        """
+        (frames, 33, 4) float32 memory map of a session's landmarks
+        """
+        return _map(os.path.join(self.frames_dir, f"{session}.lmk"), np.dtype(np.float32), FRAME_SHAPE)
+
+    def timestamps(self, session):
+        return _map(os.path.join(self.frames_dir, f"{session}.ts"), np.dtype(np.float64))
+
+    def rep_landmarks(self, rep):
+        """
+        View of the frames of one REP_DTYPE record, nothing is copied
+        """
+        return self.landmarks(int(rep['session']))[int(rep['start_frame']):int(rep['end_frame']) + 1]
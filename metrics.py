@@ -0,0 +1,223 @@
+# metrics.py
+#
+# In-process metrics for the streaming hot path, exposed in the Prometheus
+# text format by the /metrics route. Recording is a perf_counter() pair and
+# an append under a lock per stage and frame; quantiles are only computed
+# when the endpoint is scraped.
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Latency samples kept per summary, quantiles cover this sliding window
+SUMMARY_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+# Seconds of history the fps gauges average over
+RATE_WINDOW = 5.0
+
+# name -> (type, help)
+METRIC_FAMILIES = {
+    'gymgenius_stage_seconds': ('summary', "Per-frame latency of each stream stage"),
+    'gymgenius_dropped_frames_total': ('counter', "Frames dropped in front of a stage because it was busy"),
+    'gymgenius_fps': ('gauge', "Frames per second through a stage, averaged over the rate window")
+}
+
+
+class Summary:
+    """
+    Count, sum and a sliding window of samples for quantiles
+    """
+
+    def __init__(self, window=SUMMARY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """
+        ({quantile: value}, sum, count), quantiles empty before the first sample
+        """
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=np.float64, count=len(self._samples))
+            total, count = self.sum, self.count
+        if not len(samples):
+            return {}, total, count
+        values = np.quantile(samples, QUANTILES)
+        return dict(zip(QUANTILES, values)), total, count
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Meter:
+    """
+    Event rate over the last RATE_WINDOW seconds
+    """
+
+    def __init__(self, maxlen=1024):
+        self._times = deque(maxlen=maxlen)
+
+    def mark(self):
+        self._times.append(time.monotonic())
+
+    def rate(self):
+        now = time.monotonic()
+        times = [t for t in list(self._times) if now - t <= RATE_WINDOW]
+        if len(times) < 2:
+            return 0.0
+        # Measured over the span actually covered, the deque may hold less than the window
+        return (len(times) - 1) / max(now - times[0], 1e-6)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    Metrics by (family name, labels). Getting a metric creates it, so call
+    sites can hold on to what they record into.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, cls, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls()
+            return metric
+
+    def summary(self, name, **labels):
+        return self._get(name, Summary, labels)
+
+    def counter(self, name, **labels):
+        return self._get(name, Counter, labels)
+
+    def meter(self, name, **labels):
+        return self._get(name, Meter, labels)
+
+    def find(self, name, **labels):
+        """
+        [(labels dict, metric)] of family `name` whose labels include `labels`
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+        wanted = set(labels.items())
+        return [(dict(key_labels), metric) for (key_name, key_labels), metric in items
+                if key_name == name and wanted <= set(key_labels)]
+
+    def clear(self):
+        """
+        Forget every metric, streams started afterwards record from scratch
+        """
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+
+        lines = []
+        family = None
+        for (name, labels), metric in metrics:
+            if name != family:
+                family = name
+                kind, help_text = METRIC_FAMILIES.get(name, ('untyped', name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            if isinstance(metric, Summary):
+                quantiles, total, count = metric.snapshot()
+                for q, value in quantiles.items():
+                    lines.append(f"{name}{_format_labels(labels + (('quantile', q),))} {value:.6f}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            elif isinstance(metric, Counter):
+                lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {metric.rate():.2f}")
+
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+class StageTimings:
+    """
+    Latency, fps and drop metrics of one stream (e.g. 'bicep') on one
+    camera, by stage. Streams without a camera (ingest, benchmarks) are
+    labeled camera="".
+    """
+
+    def __init__(self, stream, camera=None, registry=METRICS):
+        self.stream = stream
+        self.camera = '' if camera is None else str(camera)
+        self.registry = registry
+        self._summaries = {}
+
+    def observe(self, stage, seconds):
+        summary = self._summaries.get(stage)
+        if summary is None:
+            summary = self._summaries[stage] = self.registry.summary('gymgenius_stage_seconds', stream=self.stream,
+                                                                     camera=self.camera, stage=stage)
+        summary.observe(seconds)
+
+    def dropped(self, stage):
+        return self.registry.counter('gymgenius_dropped_frames_total', stream=self.stream, camera=self.camera, stage=stage)
+
+    def fps(self, stage):
+        return self.registry.meter('gymgenius_fps', stream=self.stream, camera=self.camera, stage=stage)
+
+
+class _NullMetric:
+    def inc(self, amount=1):
+        pass
+
+    def mark(self):
+        pass
+
+
+class NullTimings:
+    """
+    StageTimings stand-in for uninstrumented callers (batch analysis, tests)
+    """
+
+    _metric = _NullMetric()
+
+    def observe(self, stage, seconds):
+        pass
+
+    def dropped(self, stage):
+        return self._metric
+
+    def fps(self, stage):
+        return self._metric
+
+
+NO_TIMINGS = NullTimings()
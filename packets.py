@@ -0,0 +1,146 @@
+# packets.py
+#
+# Per-frame analysis packets for clients that draw the overlays themselves.
+# Instead of a JPEG per frame the data routes stream, per frame:
+#
+#   exercise, t        exercise name (as in batch.EXERCISES) and server time in seconds
+#   detected           whether a person was found
+#   counts             {'total': int, 'correct': int}
+#   stage, feedback    state machine stage and feedback code (see FEEDBACK tables)
+#   angles             joint angles in degrees
+#   rep                the rep finished on this frame, or null
+#   landmarks          33 x [x, y, visibility], normalized to the frame
+#
+# Formats:
+#   json    text/event-stream, one `data: {...}` Server-Sent Event per frame
+#   binary  application/octet-stream, each packet prefixed with its uint32
+#           little-endian length, see pack_binary()
+
+import json
+import struct
+import time
+
+import numpy as np
+
+BINARY_VERSION = 1
+
+PACKET_MIMETYPES = {
+    'json': 'text/event-stream',
+    'binary': 'application/octet-stream'
+}
+
+_HEADER = struct.Struct('<BBdHHB')
+_ANGLE = struct.Struct('<f')
+_LENGTH = struct.Struct('<I')
+
+
+def make_packet(result, landmarks):
+    """
+    Build a packet from an analyze() result
+
+    Args:
+        result: Dict returned by a processor's analyze()
+        landmarks: The processor's LandmarkArray, read only if a person was detected
+    """
+    return {
+        'exercise': result['exercise'],
+        't': time.time(),
+        'detected': result['detected'],
+        'counts': result['counts'],
+        'stage': result['stage'],
+        'feedback': result['feedback'],
+        'angles': {name: round(float(angle), 1) for name, angle in result['angles'].items()},
+        'rep': result['rep'],
+        # Normalized x, y and visibility, copied since the buffer is reused
+        'landmarks': landmarks.data[:, [0, 1, 3]].copy() if result['detected'] else None
+    }
+
+
+def pack_json(packet):
+    data = dict(packet)
+    if data['landmarks'] is not None:
+        data['landmarks'] = np.round(data['landmarks'], 4).tolist()
+    # default=float covers the NumPy scalars in rep dicts
+    return json.dumps(data, separators=(',', ':'), default=float).encode()
+
+
+def _pack_string(text):
+    raw = (text or '').encode('ascii')[:255]
+    return bytes((len(raw),)) + raw
+
+
+def pack_binary(packet):
+    """
+    Little-endian layout:
+
+        uint8    version (BINARY_VERSION)
+        uint8    flags: bit 0 person detected, bit 1 rep finished
+        float64  server time
+        uint16   total reps, uint16 correct reps
+        uint8    number of angles
+        str      feedback code, str stage  (uint8 length + ASCII)
+        angles   per angle: str name, float32 degrees
+        uint8    number of landmarks (0 or 33)
+        landmarks  per landmark: uint16 x, y, visibility scaled from [0, 1] to [0, 65535]
+    """
+    flags = (1 if packet['detected'] else 0) | (2 if packet['rep'] else 0)
+    angles = packet['angles']
+
+    parts = [
+        _HEADER.pack(BINARY_VERSION, flags, packet['t'],
+                     min(packet['counts']['total'], 0xFFFF), min(packet['counts']['correct'], 0xFFFF), len(angles)),
+        _pack_string(packet['feedback']),
+        _pack_string(packet['stage'])
+    ]
+    for name, angle in angles.items():
+        parts.append(_pack_string(name))
+        parts.append(_ANGLE.pack(angle))
+
+    landmarks = packet['landmarks']
+    if landmarks is None:
+        parts.append(b'\x00')
+    else:
+        parts.append(bytes((len(landmarks),)))
+        parts.append((np.clip(landmarks, 0.0, 1.0) * 65535).astype('<u2').tobytes())
+
+    payload = b''.join(parts)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+class PacketEncoder:
+    """
+    Pipeline encoder for data streams: serializes each packet into every wire
+    format once, so viewers of either format share the work.
+    """
+
+    def encode_part(self, packet):
+        return {'json': pack_json(packet), 'binary': pack_binary(packet)}
+
+
+def frame_packet(part, fmt):
+    """
+    Pick one wire format out of a PacketEncoder part and frame it for a
+    streaming HTTP response (PACKET_MIMETYPES)
+    """
+    if fmt == 'json':
+        return b''.join((b'data: ', part['json'], b'\n\n'))
+    return part['binary']
+
+
+def packet_stream(parts, fmt):
+    try:
+        for part in parts:
+            yield frame_packet(part, fmt)
+    finally:
+        parts.close()
+
+
+async def apacket_stream(parts, fmt):
+    """
+    packet_stream for an async generator of parts
+    """
+    try:
+        async for part in parts:
+            yield frame_packet(part, fmt)
+    finally:
+        await parts.aclose()
@@ -0,0 +1,481 @@
+# pipeline.py
+
+import math
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from capture import pin_thread
+from encoder import make_encoder
+from metrics import NO_TIMINGS
+
+# Depth of the queue in front of each stage. A full queue drops its oldest
+# item, so a depth of 1 means "latest frame wins".
+PIPELINE_QUEUE_SIZES = {
+    'inference': 1,
+    'render': 1,
+    'network': 1
+}
+
+# How frames are fed to the pose graph, see PoseInference. The defaults run
+# on the whole captured frame; on large (e.g. 1080p) cameras set `max_width`
+# and/or `roi` to cut inference time.
+INFERENCE_OPTIONS = {
+    # Downscale the inference input to at most this width (None = as captured)
+    'max_width': None,
+    # Crop around the person found in the previous frame
+    'roi': False,
+    # Padding around the pose bounding box, as a fraction of its larger side
+    'roi_padding': 0.25,
+    # Run on the full frame every N frames to pick up people outside the crop
+    'redetect_interval': 30,
+    # Only run the model on every Nth frame, N picked from the measured
+    # inference latency, and extrapolate landmarks on the frames in between
+    'adaptive': False,
+    # Frame rate the adaptive mode tries to keep the overlays at
+    'target_fps': 30,
+    # Most frames between two inferences
+    'max_skip': 4
+}
+
+
+def pose_inference(pose, options=None, timings=None):
+    """
+    Build an inference stage that runs a MediaPipe Pose graph on BGR frames
+
+    Args:
+        pose: MediaPipe Pose graph
+        options: Overrides for INFERENCE_OPTIONS
+        timings: metrics.StageTimings to record the inference steps into
+    """
+    config = dict(INFERENCE_OPTIONS)
+    config.update(options or {})
+
+    adaptive = config.pop('adaptive')
+    target_fps = config.pop('target_fps')
+    max_skip = config.pop('max_skip')
+
+    inference = PoseInference(pose, timings=timings, **config)
+    if adaptive:
+        return SkippingInference(inference, target_fps, max_skip)
+    return inference
+
+
+def _reuse(buffer, shape):
+    # Keep a frame-sized buffer as long as the frame size does not change
+    if buffer is None or buffer.shape != shape:
+        return np.empty(shape, dtype=np.uint8)
+    return buffer
+
+
+def copy_to_buffer(buffer, frame):
+    """
+    Copy a frame into a reused buffer, reallocated only when the size changes
+    """
+    buffer = _reuse(buffer, frame.shape)
+    np.copyto(buffer, frame)
+    return buffer
+
+
+class PoseInference:
+    """
+    Runs a Pose graph on a downscaled frame and/or a crop around the person.
+
+    Landmarks are always returned normalized to the full captured frame, so
+    the render stage keeps drawing on the full-resolution image. The crop is
+    only moved when the person gets close to its edge, since every move
+    shifts the image MediaPipe's own tracker works on; it is dropped when
+    nobody is found and every `redetect_interval` frames.
+    """
+
+    # Smallest crop side in pixels, below this the model loses accuracy
+    MIN_ROI_SIZE = 96
+
+    def __init__(self, pose, max_width=None, roi=False, roi_padding=0.25, redetect_interval=30, timings=None):
+        self.pose = pose
+        self.max_width = max_width
+        self.roi = roi
+        self.roi_padding = roi_padding
+        self.redetect_interval = redetect_interval
+        self.timings = timings or NO_TIMINGS
+
+        # Current crop as pixel (x0, y0, x1, y1), None for the full frame
+        self.crop = None
+        self._frames_since_detect = 0
+
+        # Downscaled and RGB inference inputs, reused while the size holds
+        self._small = None
+        self._rgb = None
+
+    def __call__(self, frame, is_rgb=False):
+        height, width = frame.shape[:2]
+
+        if self.crop is not None and self._frames_since_detect >= self.redetect_interval:
+            self.crop = None
+
+        crop = self.crop
+        image = frame
+        if crop is not None:
+            x0, y0, x1, y1 = crop
+            image = image[y0:y1, x0:x1]
+
+        start = time.perf_counter()
+        if self.max_width and image.shape[1] > self.max_width:
+            size = (self.max_width, round(image.shape[0] * self.max_width / image.shape[1]))
+            self._small = _reuse(self._small, (size[1], size[0], image.shape[2]))
+            image = cv2.resize(image, size, dst=self._small, interpolation=cv2.INTER_AREA)
+
+        if not is_rgb:
+            self._rgb = _reuse(self._rgb, image.shape)
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+
+        # Read-only view, the buffers underneath are written again next frame
+        image = image.view()
+        image.flags.writeable = False
+
+        converted = time.perf_counter()
+        results = self.pose.process(image)
+        self.timings.observe('color_convert', converted - start)
+        self.timings.observe('pose_process', time.perf_counter() - converted)
+
+        if crop is None:
+            self._frames_since_detect = 0
+        else:
+            self._frames_since_detect += 1
+            if results.pose_landmarks:
+                self._to_frame_coords(results.pose_landmarks, crop, width, height)
+
+        if self.roi:
+            self._update_crop(results.pose_landmarks, width, height)
+
+        return results
+
+    def _to_frame_coords(self, pose_landmarks, crop, width, height):
+        x0, y0, x1, y1 = crop
+        sx, sy = (x1 - x0) / width, (y1 - y0) / height
+        ox, oy = x0 / width, y0 / height
+
+        for lm in pose_landmarks.landmark:
+            lm.x = ox + lm.x * sx
+            lm.y = oy + lm.y * sy
+
+    def _update_crop(self, pose_landmarks, width, height):
+        if not pose_landmarks:
+            self.crop = None
+            return
+
+        xs = [lm.x for lm in pose_landmarks.landmark]
+        ys = [lm.y for lm in pose_landmarks.landmark]
+        bx0, bx1 = min(xs) * width, max(xs) * width
+        by0, by1 = min(ys) * height, max(ys) * height
+        pad = self.roi_padding * max(bx1 - bx0, by1 - by0)
+
+        # Keep the crop while at least half the padding is left on every side
+        if self.crop is not None:
+            x0, y0, x1, y1 = self.crop
+            margin = pad / 2
+            if x0 <= bx0 - margin and y0 <= by0 - margin and x1 >= bx1 + margin and y1 >= by1 + margin:
+                return
+
+        half = self.MIN_ROI_SIZE / 2
+        cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+        half_w = max((bx1 - bx0) / 2 + pad, half)
+        half_h = max((by1 - by0) / 2 + pad, half)
+
+        x0, x1 = max(0, int(cx - half_w)), min(width, int(cx + half_w))
+        y0, y1 = max(0, int(cy - half_h)), min(height, int(cy + half_h))
+
+        # A crop covering (nearly) the whole frame gains nothing
+        if (x1 - x0) * (y1 - y0) >= 0.9 * width * height:
+            self.crop = None
+        else:
+            self.crop = (x0, y0, x1, y1)
+
+
+class PredictedPose:
+    """
+    Stands in for a Pose result on frames the model was not run on
+    """
+
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+class SkippingInference:
+    """
+    Runs a PoseInference on every Nth frame only, for hosts too slow to keep
+    up with the camera.
+
+    The model runs on a worker thread, so frames in between pass straight
+    through with landmarks linearly extrapolated from the last two inferred
+    frames. N is re-estimated after every inference as latency * target_fps
+    (at least 1, at most max_skip). Call `close()` before the pose graph is
+    released.
+    """
+
+    def __init__(self, inference, target_fps=30, max_skip=4):
+        self.inference = inference
+        self.target_fps = target_fps
+        self.max_skip = max_skip
+
+        # Frames between inferences and the smoothed inference latency
+        self.skip = 1
+        self.latency = None
+
+        self._index = 0
+        self._next_index = 0
+        self._busy = False
+        self._closed = False
+        # (frame index, (33, 3) landmark array, Pose result) of the last two inferences
+        self._history = deque(maxlen=2)
+        self._lock = threading.Lock()
+        self._jobs = LatestQueue(1)
+        self._worker = None
+
+    def __call__(self, frame, is_rgb=False):
+        index = self._index
+        self._index += 1
+
+        if self._worker is None:
+            # Nothing to extrapolate from yet, infer the first frame in place
+            self._run(index, frame, is_rgb)
+            self._worker = threading.Thread(target=self._work, name='pipeline-skip-inference', daemon=True)
+            self._worker.start()
+            return self._history[-1][2]
+
+        with self._lock:
+            submit = not self._busy and not self._closed and index >= self._next_index
+            if submit:
+                self._busy = True
+        if submit:
+            # The caller may draw on an RGB frame while the worker reads it
+            self._jobs.put((index, frame.copy() if is_rgb else frame, is_rgb))
+
+        return self._predict(index)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._jobs.close()
+        if self._worker is not None and self._worker is not threading.current_thread():
+            self._worker.join()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            self._run(*job)
+            with self._lock:
+                self._busy = False
+
+    def _run(self, index, frame, is_rgb):
+        start = time.perf_counter()
+        results = self.inference(frame, is_rgb)
+        elapsed = time.perf_counter() - start
+
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        self.skip = min(self.max_skip, max(1, math.ceil(self.latency * self.target_fps)))
+
+        points = None
+        if results.pose_landmarks:
+            points = np.array([(lm.x, lm.y, lm.z) for lm in results.pose_landmarks.landmark])
+
+        with self._lock:
+            self._history.append((index, points, results))
+            self._next_index = index + self.skip
+
+    def _predict(self, index):
+        with self._lock:
+            history = list(self._history)
+
+        last_index, last_points, last_results = history[-1]
+        if last_points is None or len(history) < 2 or history[0][1] is None or index == last_index:
+            return last_results
+
+        prev_index, prev_points, _ = history[0]
+        # A result lands up to one interval after its frame was captured
+        ahead = min(index - last_index, 2 * self.max_skip)
+        points = last_points + (last_points - prev_points) * (ahead / (last_index - prev_index))
+
+        pose_landmarks = landmark_pb2.NormalizedLandmarkList()
+        pose_landmarks.CopyFrom(last_results.pose_landmarks)
+        for lm, (x, y, z) in zip(pose_landmarks.landmark, points):
+            lm.x, lm.y, lm.z = x, y, z
+
+        return PredictedPose(pose_landmarks)
+
+
+class LatestQueue:
+    """
+    Bounded hand-off between two pipeline stages.
+
+    `put` never blocks: when the queue is full the oldest item is dropped,
+    so the consumer always works on the freshest data instead of a backlog.
+    """
+
+    def __init__(self, maxsize=1, dropped_counter=None):
+        self._items = deque(maxlen=max(1, maxsize))
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+        # Optional metrics Counter mirroring `dropped`
+        self._dropped_counter = dropped_counter
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self._dropped_counter is not None:
+                    self._dropped_counter.inc()
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Return the oldest queued item, or None once the queue is closed and empty
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed, timeout=timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StreamPipeline:
+    """
+    Staged capture -> inference -> render/encode -> network pipeline.
+
+    Capture, inference and render/encode each run on their own thread and
+    hand off through LatestQueues; the network stage is whoever iterates
+    the pipeline (the Flask response). A slow client or a slow model only
+    causes stale frames to be dropped, never queued up as latency.
+
+    Args:
+        cap: Anything with a cv2.VideoCapture style `read()`
+        infer: Called with each captured BGR frame, returns the inference output
+        render: Called with (frame, inference output), returns the BGR image
+                to stream or None to skip the frame
+        queue_sizes: Overrides for PIPELINE_QUEUE_SIZES
+        encoder: Turns rendered items into stream parts with `encode_part()`,
+                 a JpegEncoder from make_encoder() by default (PacketEncoder
+                 for the data streams)
+        timings: metrics.StageTimings of the stream, stages go unrecorded without
+    """
+
+    def __init__(self, cap, infer, render, queue_sizes=None, encoder=None, timings=None):
+        sizes = dict(PIPELINE_QUEUE_SIZES)
+        sizes.update(queue_sizes or {})
+
+        self.cap = cap
+        self.infer = infer
+        self.render = render
+        self.encoder = encoder or make_encoder()
+
+        self.timings = timings or NO_TIMINGS
+        # Drops are counted by the stage the queue feeds
+        self.queues = {name: LatestQueue(size, self.timings.dropped(name)) for name, size in sizes.items()}
+        self._stopped = threading.Event()
+        self._workers = []
+
+    def start(self):
+        # (stage, worker, queue the stage feeds)
+        stages = [
+            ('capture', self._capture_stage, 'inference'),
+            ('inference', self._inference_stage, 'render'),
+            ('render', self._render_stage, 'network')
+        ]
+        for name, target, output in stages:
+            worker = threading.Thread(target=self._run_stage, args=(name, target, output), name=f"pipeline-{name}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stopped.set()
+        for queue in self.queues.values():
+            queue.close()
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout=2.0)
+
+        # Inference stages with a worker of their own (SkippingInference)
+        close = getattr(self.infer, 'close', None)
+        if close is not None:
+            close()
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                part = self.queues['network'].get()
+                if part is None:
+                    break
+                yield part
+        finally:
+            self.stop()
+
+    def _run_stage(self, name, target, output):
+        # Stay on the CPUs of the camera being read (CameraRegistry pin_cpus)
+        pin_thread(getattr(self.cap, 'cpus', None))
+        try:
+            target()
+        except Exception as e:
+            print(f"Pipeline {name} stage failed: {e}")
+        finally:
+            # Downstream stages drain what is left and then finish too
+            self.queues[output].close()
+
+    def _capture_stage(self):
+        timings = self.timings
+        fps = timings.fps('capture')
+        while not self._stopped.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Failed to grab frame")
+                break
+            # Includes waiting for the camera, so it tracks the frame interval
+            timings.observe('capture', time.perf_counter() - start)
+            fps.mark()
+            self.queues['inference'].put(frame)
+
+    def _inference_stage(self):
+        timings = self.timings
+        fps = timings.fps('inference')
+        while not self._stopped.is_set():
+            frame = self.queues['inference'].get()
+            if frame is None:
+                break
+            start = time.perf_counter()
+            output = self.infer(frame)
+            timings.observe('inference', time.perf_counter() - start)
+            fps.mark()
+            self.queues['render'].put((frame, output))
+
+    def _render_stage(self):
+        timings = self.timings
+        fps = timings.fps('output')
+        while not self._stopped.is_set():
+            item = self.queues['render'].get()
+            if item is None:
+                break
+            start = time.perf_counter()
+            image = self.render(*item)
+            rendered = time.perf_counter()
+            timings.observe('render', rendered - start)
+            if image is None:
+                continue
+            part = self.encoder.encode_part(image)
+            timings.observe('encode', time.perf_counter() - rendered)
+            if part is not None:
+                fps.mark()
+                self.queues['network'].put(part)
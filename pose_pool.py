@@ -0,0 +1,131 @@
+# pose_pool.py
+
+import threading
+from contextlib import contextmanager
+
+from squat_modules.utils import get_mediapipe_pose
+
+# Defaults of get_mediapipe_pose, used to build the key of a configuration
+POSE_DEFAULTS = {
+    'static_image_mode': False,
+    'model_complexity': 1,
+    'smooth_landmarks': True,
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5
+}
+
+
+def pose_config_key(**config):
+    """
+    Normalize Pose keyword arguments into a hashable pool key
+    """
+    unknown = set(config) - set(POSE_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown pose options: {', '.join(sorted(unknown))}")
+
+    options = dict(POSE_DEFAULTS)
+    options.update(config)
+    return tuple(sorted(options.items()))
+
+
+class PosePool:
+    """
+    Size-bounded pool of initialized MediaPipe Pose graphs keyed by configuration.
+
+    Building a graph costs hundreds of milliseconds, so streams check one out
+    on connect and hand it back (reset) when they end. At most `max_size`
+    graphs exist at any time; when the pool is full an idle graph of another
+    configuration is closed to make room, otherwise `acquire` waits for a
+    graph to be released.
+    """
+
+    def __init__(self, factory=get_mediapipe_pose, max_size=8, acquire_timeout=10.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+
+        # config key -> idle graphs, least recently released first
+        self._idle = {}
+        # id(graph) -> config key of checked out graphs
+        self._in_use = {}
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self._in_use) + sum(len(graphs) for graphs in self._idle.values())
+
+    def acquire(self, **config):
+        key = pose_config_key(**config)
+
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._idle.get(key) or self._has_room(), timeout=self.acquire_timeout)
+            if not ready:
+                raise RuntimeError(f"No pose graph available after {self.acquire_timeout}s (pool size {self.max_size})")
+
+            if self._idle.get(key):
+                pose = self._idle[key].pop()
+                self._in_use[id(pose)] = key
+                return pose
+
+            self._make_room()
+            # Reserve the slot while the graph is built outside the lock
+            placeholder = object()
+            self._in_use[id(placeholder)] = key
+
+        try:
+            pose = self.factory(**dict(key))
+        except Exception:
+            with self._cond:
+                del self._in_use[id(placeholder)]
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            del self._in_use[id(placeholder)]
+            self._in_use[id(pose)] = key
+        return pose
+
+    def release(self, pose):
+        # Drop the tracking state of the previous stream before reuse
+        pose.reset()
+
+        with self._cond:
+            key = self._in_use.pop(id(pose))
+            self._idle.setdefault(key, []).append(pose)
+            self._cond.notify_all()
+
+    @contextmanager
+    def checkout(self, **config):
+        pose = self.acquire(**config)
+        try:
+            yield pose
+        finally:
+            self.release(pose)
+
+    def warm(self, count=1, **config):
+        """
+        Build `count` graphs of a configuration ahead of the first stream
+        """
+        graphs = [self.acquire(**config) for _ in range(count)]
+        for pose in graphs:
+            self.release(pose)
+
+    def _has_room(self):
+        if self.size < self.max_size:
+            return True
+        return any(self._idle.values())
+
+    def _make_room(self):
+        if self.size < self.max_size:
+            return
+
+        # Only reached when no graph of the wanted configuration is idle, so
+        # this evicts the oldest idle graph of some other configuration
+        for key, graphs in self._idle.items():
+            if graphs:
+                graphs.pop(0).close()
+                return
+
+
+# Shared by every exercise route
+POSE_POOL = PosePool()
@@ -3,370 +3,352 @@ import mediapipe as mp
 import numpy as np
 import time
 
-def calculate_angle(a, b, c):
-    """
-    Calculate the angle between three points (in degrees)
-    
-    Args:
-        a: First point [x, y]
-        b: Mid point [x, y]
-        c: End point [x, y]
-    
-    Returns:
-        Angle in degrees
-    """
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
-
-def calculate_visibility(landmarks, keypoints):
-    """
-    Calculate the average visibility of specified keypoints
-    
-    Args:
-        landmarks: MediaPipe pose landmarks
-        keypoints: List of landmark indices to check
-    
-    Returns:
-        Average visibility score (0-1)
-    """
-    visibility_sum = sum(landmarks[i].visibility for i in keypoints)
-    return visibility_sum / len(keypoints)
+from encoder import make_encoder
+from metrics import NO_TIMINGS, StageTimings
+from packets import PacketEncoder, make_packet
+from pipeline import StreamPipeline, copy_to_buffer, pose_inference
+from pose_pool import POSE_POOL
+from recording import recording
+from squat_modules.hud import draw_counter_bar
+from squat_modules.utils import LandmarkArray, SIDE_INDICES, find_angles
 
-def push_up_detection(cap):
-    """
-    Generator function for push-up detection that yields frame data for Flask streaming
-    """
-    # Reset cap to ensure fresh start
-    # if cap.isOpened():
-    #     cap.release()
-    # cap = cv2.VideoCapture(0)
-    
-    # Set width and height
-    cap.set(3, 640)
-    cap.set(4, 480)
-    
-    # MediaPipe Pose setup
-    mp_drawing = mp.solutions.drawing_utils
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-    
-    # Push-up variables
-    counter = 0
-    stage = None
-    form_feedback = "Position yourself sideways"
-    feedback_color = (245, 117, 16)  # Orange
-    
-    acceptable_form_count = 0
-    
+# Feedback code -> (message, BGR box color)
+FEEDBACK = {
+    'POSITION_SIDEWAYS': ("Position yourself sideways", (245, 117, 16)),
+    'NOT_SIDEWAYS': ("Position yourself sideways to the camera", (0, 0, 255)),
+    'STRAIGHTEN_BODY': ("Keep your body straight!", (0, 0, 255)),
+    'GOING_DOWN': ("Going down...", (245, 117, 16)),
+    'GO_LOWER': ("Go lower for better form", (0, 165, 255)),
+    'GOOD_DEPTH': ("Good depth!", (0, 255, 0)),
+    'COUNTED_GO_DEEPER': ("Push-up counted! Go deeper next time", (0, 165, 255)),
+    'TOO_SHALLOW': ("Too shallow! Not counted", (0, 0, 255)),
+    'GREAT_PUSHUP': ("Great push-up!", (0, 255, 0))
+}
+
+class PushUpProcessor:
     # Angle thresholds
     GOOD_ELBOW_ANGLE = 90  # Deeper is better
     MIN_ELBOW_ANGLE = 70   # Minimum to count a rep
     MIN_BODY_ANGLE = 160   # For straight body alignment
-    
-    # Previous angles for movement detection
-    prev_elbow_angle = None
-    
-    # Rep timing
-    rep_start_time = None
-    min_rep_angle = 180
-    
-    # Countdown setup
-    countdown_start = time.time()
-    countdown_duration = 3
-    countdown_active = True
-    
+
+    # Elbow, body and leg angles as (a, b, c) positions in SIDE_INDICES:
+    # shoulder-elbow-wrist, shoulder-hip-knee, hip-knee-ankle
+    ANGLE_TRIPLETS = np.array([(0, 1, 2), (0, 3, 4), (3, 4, 5)])
+
     # Movement detection to prevent false positives
-    movement_buffer = []
     MOVEMENT_BUFFER_SIZE = 10
     MIN_ANGLE_CHANGE = 15  # Minimum angle change to register as a movement
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to grab frame")
-            break
+
+    def __init__(self, draw=True, countdown=True, clock=time.time, timings=None, recorder=None):
+        # Headless callers (batch analysis) skip every drawing call
+        self.draw = draw
+        # Source of timestamps, video time when analyzing recordings
+        self.clock = clock
+        # Where rep logic and overlay latencies are recorded (metrics.StageTimings)
+        self.timings = timings or NO_TIMINGS
+        # Landmark log of every analyzed frame (recording.LandmarkRecorder)
+        self.recorder = recorder
+
+        # MediaPipe Pose setup
+        self.mp_drawing = mp.solutions.drawing_utils
+        self.mp_pose = mp.solutions.pose
+
+        # Landmark buffers reused for every frame
+        self.landmarks = LandmarkArray()
+        # Frame copy the overlays are drawn on, reused for every frame
+        self._display = None
+
+        # Push-up variables
+        self.counter = 0
+        self.stage = None
+        self.form_feedback = 'POSITION_SIDEWAYS'
         
-        # Get frame dimensions
-        h, w, _ = frame.shape
+        # The on-screen CORRECT counter: counted reps that were not GREAT_PUSHUP ("go deeper")
+        self.acceptable_form_count = 0
         
-        # Convert the BGR image to RGB
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        # Previous angles for movement detection
+        self.prev_elbow_angle = None
         
-        # Process the image with MediaPipe Pose
-        results = pose.process(image)
+        # Rep timing
+        self.rep_start_time = None
+        self.min_rep_angle = 180
+        self.max_rep_angle = 0
         
-        # Convert back to BGR for OpenCV
-        image.flags.writeable = True
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        # Countdown setup
+        self.countdown_start = clock()
+        self.countdown_duration = 3
+        self.countdown_active = countdown
+        
+        self.movement_buffer = []
+
+    def process(self, frame, results):
+        """
+        Run the push-up logic on one frame and draw the overlays
+
+        Args:
+            frame: Captured BGR frame (left untouched)
+            results: MediaPipe Pose output for the frame
+
+        Returns:
+            Annotated BGR image (overwritten by the next call), or None if the processor is headless
+        """
+        # Get frame dimensions
+        h, w, _ = frame.shape
         
         # Handle countdown
-        if countdown_active:
-            elapsed = time.time() - countdown_start
-            if elapsed < countdown_duration:
-                remaining = countdown_duration - elapsed
-                countdown_text = str(int(remaining) + 1)
-                font_scale = 7
-                text_size = cv2.getTextSize(countdown_text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
-                text_x = int((w - text_size[0]) / 2)
-                text_y = int((h + text_size[1]) / 2)
-                cv2.putText(image, countdown_text, (text_x, text_y), 
-                            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
+        if self.countdown_active:
+            elapsed = self.clock() - self.countdown_start
+            if elapsed < self.countdown_duration:
+                if not self.draw:
+                    return None
+
+                image = self._display_image(frame)
+                self.render_countdown(image, str(int(self.countdown_duration - elapsed) + 1))
                 
                 # Draw pose landmarks during countdown too
-                if results.pose_landmarks:
-                    mp_drawing.draw_landmarks(
-                        image, 
-                        results.pose_landmarks, 
-                        mp_pose.POSE_CONNECTIONS,
-                        mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
-                        mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2)
-                    )
-                
-                # Yield frame for Flask streaming
-                ret, buffer = cv2.imencode('.jpg', image)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                      b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                continue
+                self._draw_landmarks(image, results.pose_landmarks)
+                return image
             else:
-                go_text = "GO!"
-                font_scale = 7
-                text_size = cv2.getTextSize(go_text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
-                text_x = int((w - text_size[0]) / 2)
-                text_y = int((h + text_size[1]) / 2)
-                cv2.putText(image, go_text, (text_x, text_y), 
-                            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
-                
-                # Yield frame for Flask streaming
-                ret, buffer = cv2.imencode('.jpg', image)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                      b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                    
-                countdown_active = False
+                self.countdown_active = False
                 # Reset start time for rep timing
-                rep_start_time = time.time()
-                continue
+                self.rep_start_time = self.clock()
+                if not self.draw:
+                    return None
+
+                image = self._display_image(frame)
+                self.render_countdown(image, "GO!")
+                return image
         
+        start = time.perf_counter()
+        result = self.analyze(results.pose_landmarks, w, h)
+        analyzed = time.perf_counter()
+        self.timings.observe('rep_logic', analyzed - start)
+
+        if not self.draw:
+            return None
+        image = self._display_image(frame)
+        self.render(image, result, results.pose_landmarks)
+        self.timings.observe('overlay', time.perf_counter() - analyzed)
+        return image
+
+    def analyze(self, pose_landmarks, width, height):
+        """
+        Update the push-up state machine from one frame of landmarks, without drawing
+
+        Args:
+            pose_landmarks: MediaPipe NormalizedLandmarkList, or None if nobody was detected
+            width, height: Frame size used to place the angles in pixels
+
+        Returns:
+            Dict with the counts, stage, feedback code, elbow/body/leg angles
+            and the finished rep (or None) for this frame
+        """
+        result = {
+            'exercise': 'pushup',
+            'detected': False,
+            'angles': {},
+            'points': {},
+            'rep': None
+        }
+
         # Extract landmarks
         try:
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                # Check visibility of left vs right side
-                left_side_keypoints = [
-                    mp_pose.PoseLandmark.LEFT_SHOULDER.value,
-                    mp_pose.PoseLandmark.LEFT_ELBOW.value,
-                    mp_pose.PoseLandmark.LEFT_WRIST.value,
-                    mp_pose.PoseLandmark.LEFT_HIP.value,
-                    mp_pose.PoseLandmark.LEFT_KNEE.value,
-                    mp_pose.PoseLandmark.LEFT_ANKLE.value
-                ]
-                
-                right_side_keypoints = [
-                    mp_pose.PoseLandmark.RIGHT_SHOULDER.value,
-                    mp_pose.PoseLandmark.RIGHT_ELBOW.value,
-                    mp_pose.PoseLandmark.RIGHT_WRIST.value,
-                    mp_pose.PoseLandmark.RIGHT_HIP.value,
-                    mp_pose.PoseLandmark.RIGHT_KNEE.value,
-                    mp_pose.PoseLandmark.RIGHT_ANKLE.value
-                ]
-                
-                left_visibility = calculate_visibility(landmarks, left_side_keypoints)
-                right_visibility = calculate_visibility(landmarks, right_side_keypoints)
-                
-                # Determine which side to use based on visibility
-                use_left = left_visibility > right_visibility
-                
-                # Get coordinates based on the more visible side
-                if use_left:
-                    shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, 
-                               landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                    elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, 
-                            landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-                    wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, 
-                            landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-                    hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, 
-                          landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-                    knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, 
-                           landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-                    ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x, 
-                            landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-                else:
-                    shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x, 
-                               landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-                    elbow = [landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x, 
-                            landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].y]
-                    wrist = [landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].x, 
-                            landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].y]
-                    hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x, 
-                          landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-                    knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x, 
-                           landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-                    ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x, 
-                            landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-                
-                # Calculate angles
-                elbow_angle = calculate_angle(shoulder, elbow, wrist)
-                body_angle = calculate_angle(shoulder, hip, knee)
-                leg_angle = calculate_angle(hip, knee, ankle)
-                
-                # Display angle at elbow
-                elbow_coords = tuple(np.multiply(elbow, [w, h]).astype(int))
-                cv2.putText(image, str(round(elbow_angle, 2)), elbow_coords, 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-                
-                # Body angle at hip
-                hip_coords = tuple(np.multiply(hip, [w, h]).astype(int))
-                cv2.putText(image, str(round(body_angle, 2)), hip_coords, 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-                
-                # Track movement for false positive prevention
-                if prev_elbow_angle is not None:
-                    angle_change = abs(elbow_angle - prev_elbow_angle)
-                    movement_buffer.append(angle_change)
-                    if len(movement_buffer) > MOVEMENT_BUFFER_SIZE:
-                        movement_buffer.pop(0)
-                
-                # Significant movement detected
-                significant_movement = sum(movement_buffer) > MIN_ANGLE_CHANGE if movement_buffer else False
-                
-                # Push-up logic
-                if prev_elbow_angle is not None:
-                    
-                    # Body alignment check
-                    body_aligned = body_angle > MIN_BODY_ANGLE
-                    
-                    if not body_aligned:
-                        form_feedback = "Keep your body straight!"
-                        feedback_color = (0, 0, 255)  # Red
-                    else:
-                        # Going down - arms bending
-                        if elbow_angle < 120 and (stage == "up" or stage is None) and significant_movement:
-                            stage = "down"
-                            form_feedback = "Going down..."
-                            feedback_color = (245, 117, 16)  # Orange
-                            rep_start_time = time.time()
-                            min_rep_angle = elbow_angle
-                            
-                        # In down position - track minimum angle
-                        elif stage == "down":
-                            min_rep_angle = min(min_rep_angle, elbow_angle)
-                            
-                            # Only provide feedback if still in down position
-                            if elbow_angle < 120:
-                                # Feedback on depth
-                                if elbow_angle > 90:
-                                    form_feedback = "Go lower for better form"
-                                    feedback_color = (0, 165, 255)  # Orange
-                                else:
-                                    form_feedback = "Good depth!"
-                                    feedback_color = (0, 255, 0)  # Green
-                        
-                        # Going up - completed rep
-                        if elbow_angle > 160 and stage == "down" and significant_movement:
-                            # Only count if there was a significant bend
-                            if min_rep_angle < 120:
-                                # Evaluate form based on depth
-                                if min_rep_angle > MIN_ELBOW_ANGLE and min_rep_angle <= GOOD_ELBOW_ANGLE:
-                                    # Acceptable form but not great
-                                    counter += 1
-                                    acceptable_form_count += 1
-                                    form_feedback = "Push-up counted! Go deeper next time"
-                                    feedback_color = (0, 165, 255)  # Orange
-                                elif min_rep_angle <= MIN_ELBOW_ANGLE:
-                                    # Not deep enough
-                                    form_feedback = "Too shallow! Not counted"
-                                    feedback_color = (0, 0, 255)  # Red
-                                else:
-                                    # Good form
-                                    counter += 1
-                                    form_feedback = "Great push-up!"
-                                    feedback_color = (0, 255, 0)  # Green
-                                    
-                            stage = "up"
-                            rep_start_time = None
-                            # Reset movement buffer
-                            movement_buffer = []
-                
-                # Update previous angle
-                prev_elbow_angle = elbow_angle
+            if pose_landmarks:
+                result['detected'] = True
+                result['rep'] = self._update(self.landmarks.update(pose_landmarks.landmark, width, height), result)
                 
         except Exception as e:
             print(f"Error processing landmarks: {e}")
-            form_feedback = "Position yourself sideways to the camera"
-            feedback_color = (0, 0, 255)  # Red
-        
-        # Draw pose landmarks
-        if results.pose_landmarks:
-            mp_drawing.draw_landmarks(
-                image, 
-                results.pose_landmarks, 
-                mp_pose.POSE_CONNECTIONS,
-                mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
-                mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2)
-            )
-        
-        # ====== IMPROVED UI LAYOUT ======
-        
-        # Calculate widths for UI elements with better spacing
-        counter_width = 150
-        feedback_width = w - counter_width - 300
-        acceptable_width = 150
-        
-        # Total push-up counter (left side)
-        cv2.rectangle(image, (10, 10), (10 + counter_width, 60), (245, 117, 16), -1)
-        cv2.putText(image, 'TOTAL REPS', (15, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-        cv2.putText(image, str(counter), (50, 50), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Acceptable form counter (right side)
-        cv2.rectangle(image, (w - 10 - acceptable_width, 10), (w - 10, 60), (0, 165, 255), -1)
-        cv2.putText(image, 'CORRECT', (w - acceptable_width + 5, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-        cv2.putText(image, str(acceptable_form_count), (w - acceptable_width + 50, 50), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Form feedback (center)
-        feedback_x = 10 + counter_width + 10
-        feedback_width = w - feedback_x - acceptable_width - 20
-        
-        cv2.rectangle(image, (feedback_x, 10), (feedback_x + feedback_width, 60), feedback_color, -1)
+            self.form_feedback = 'NOT_SIDEWAYS'
+
+        result['counts'] = {'total': self.counter, 'correct': self.acceptable_form_count}
+        result['stage'] = self.stage
+        result['feedback'] = self.form_feedback
+
+        if self.recorder is not None:
+            self.recorder.add(self.clock(), self.landmarks if result['detected'] else None, width, height, result)
+        return result
+
+    def _update(self, landmarks, result):
+        rep = None
+
+        # Shoulder, elbow, wrist, hip, knee, ankle and foot of each side
+        left_side = SIDE_INDICES['left']
+        right_side = SIDE_INDICES['right']
+
+        # Check visibility of left vs right side (the foot is not needed)
+        left_visibility = landmarks.visibility[left_side[:6]].mean()
+        right_visibility = landmarks.visibility[right_side[:6]].mean()
         
-        # Ensure form feedback text fits in the box
-        form_text = form_feedback
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.7
-        thickness = 2
+        # Determine which side to use based on visibility
+        side = left_side if left_visibility > right_visibility else right_side
         
-        # Calculate text width to ensure it fits
-        text_size = cv2.getTextSize(form_text, font, font_scale, thickness)[0]
+        # Calculate angles on the more visible side
+        elbow_angle, body_angle, leg_angle = find_angles(landmarks.xy, side[self.ANGLE_TRIPLETS])
+        pixels = landmarks.pixels[side]
+
+        result['angles'] = {'elbow': elbow_angle, 'body': body_angle, 'leg': leg_angle}
+        result['points'] = {
+            'elbow': tuple(pixels[1]),
+            'hip': tuple(pixels[3])
+        }
         
-        # If text is too long, reduce font size
-        if text_size[0] > feedback_width - 20:
-            font_scale = 0.5
-            text_size = cv2.getTextSize(form_text, font, font_scale, thickness)[0]
+        # Track movement for false positive prevention
+        if self.prev_elbow_angle is not None:
+            angle_change = abs(elbow_angle - self.prev_elbow_angle)
+            self.movement_buffer.append(angle_change)
+            if len(self.movement_buffer) > self.MOVEMENT_BUFFER_SIZE:
+                self.movement_buffer.pop(0)
         
-        # Calculate text position to center it
-        text_x = feedback_x + (feedback_width - text_size[0]) // 2
-        text_y = 40
+        # Significant movement detected
+        significant_movement = sum(self.movement_buffer) > self.MIN_ANGLE_CHANGE if self.movement_buffer else False
         
-        cv2.putText(image, 'FORM', (feedback_x + 5, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
-        cv2.putText(image, form_text, (text_x, text_y), 
-                   font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+        # Push-up logic
+        if self.prev_elbow_angle is not None:
+            
+            # Body alignment check
+            body_aligned = body_angle > self.MIN_BODY_ANGLE
+            
+            if not body_aligned:
+                self.form_feedback = 'STRAIGHTEN_BODY'
+            else:
+                # Going down - arms bending
+                if elbow_angle < 120 and (self.stage == "up" or self.stage is None) and significant_movement:
+                    self.stage = "down"
+                    self.form_feedback = 'GOING_DOWN'
+                    self.rep_start_time = self.clock()
+                    self.min_rep_angle = elbow_angle
+                    self.max_rep_angle = elbow_angle
+                    
+                # In down position - track minimum angle
+                elif self.stage == "down":
+                    self.min_rep_angle = min(self.min_rep_angle, elbow_angle)
+                    self.max_rep_angle = max(self.max_rep_angle, elbow_angle)
+                    
+                    # Only provide feedback if still in down position
+                    if elbow_angle < 120:
+                        # Feedback on depth
+                        if elbow_angle > 90:
+                            self.form_feedback = 'GO_LOWER'
+                        else:
+                            self.form_feedback = 'GOOD_DEPTH'
+                
+                # Going up - completed rep
+                if elbow_angle > 160 and self.stage == "down" and significant_movement:
+                    # Only count if there was a significant bend
+                    if self.min_rep_angle < 120:
+                        # Evaluate form based on depth
+                        if self.min_rep_angle > self.MIN_ELBOW_ANGLE and self.min_rep_angle <= self.GOOD_ELBOW_ANGLE:
+                            # Acceptable form but not great
+                            self.form_feedback = 'COUNTED_GO_DEEPER'
+                        elif self.min_rep_angle <= self.MIN_ELBOW_ANGLE:
+                            # Not deep enough
+                            self.form_feedback = 'TOO_SHALLOW'
+                        else:
+                            # Good form
+                            self.form_feedback = 'GREAT_PUSHUP'
+
+                        # Attempts that are not counted are no reps, only counted ones are reported
+                        if self.form_feedback != 'TOO_SHALLOW':
+                            # Form verdict of the rep, the CORRECT counter stays the baseline's
+                            correct = self.form_feedback == 'GREAT_PUSHUP'
+                            self.counter += 1
+                            if self.form_feedback == 'COUNTED_GO_DEEPER':
+                                self.acceptable_form_count += 1
+
+                            rep = {
+                                'number': self.counter,
+                                'correct': correct,
+                                'duration': self.clock() - self.rep_start_time if self.rep_start_time is not None else 0,
+                                'min_angle': self.min_rep_angle,
+                                # The arms are straight again on the frame that finishes the rep
+                                'max_angle': max(self.max_rep_angle, elbow_angle),
+                                'feedback': self.form_feedback,
+                                'feedback_codes': [] if correct else [self.form_feedback]
+                            }
+                            
+                    self.stage = "up"
+                    self.rep_start_time = None
+                    # Reset movement buffer
+                    self.movement_buffer = []
         
-        # Convert to JPEG for Flask streaming
-        ret, buffer = cv2.imencode('.jpg', image)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-              b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
\ No newline at end of file
+        # Update previous angle
+        self.prev_elbow_angle = elbow_angle
+        return rep
+
+    def _display_image(self, frame):
+        # Captured frames are shared read-only, draw on a copy
+        self._display = copy_to_buffer(self._display, frame)
+        return self._display
+
+    def render_countdown(self, image, text):
+        h, w, _ = image.shape
+        font_scale = 7
+        text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 25)[0]
+        text_x = int((w - text_size[0]) / 2)
+        text_y = int((h + text_size[1]) / 2)
+        cv2.putText(image, text, (text_x, text_y), 
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 25, cv2.LINE_AA)
+
+    def render(self, image, result, pose_landmarks=None):
+        """
+        Draw the overlays for an analyze() result onto a BGR image in place
+        """
+        if 'elbow' in result['points']:
+            # Display angle at elbow
+            cv2.putText(image, str(round(result['angles']['elbow'], 2)), result['points']['elbow'], 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
+            
+            # Body angle at hip
+            cv2.putText(image, str(round(result['angles']['body'], 2)), result['points']['hip'], 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
+
+        # Draw pose landmarks
+        self._draw_landmarks(image, pose_landmarks)
+        self._draw_overlay(image, result)
+
+    def _draw_landmarks(self, image, pose_landmarks):
+        if pose_landmarks:
+            self.mp_drawing.draw_landmarks(
+                image, 
+                pose_landmarks, 
+                self.mp_pose.POSE_CONNECTIONS,
+                self.mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
+                self.mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2)
+            )
+
+    def _draw_overlay(self, image, result):
+        form_text, feedback_color = FEEDBACK[result['feedback']]
+        draw_counter_bar(image, result['counts']['total'], result['counts']['correct'], form_text,
+                         (245, 117, 16), (0, 165, 255), feedback_color)
+
+def push_up_detection(cap, queue_sizes=None, inference_options=None, encoder_options=None, pose_pool=POSE_POOL):
+    """
+    Generator function for push-up detection that yields frame data for Flask streaming
+    """
+    timings = StageTimings('pushup', getattr(cap, 'station', None))
+    with pose_pool.checkout(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose, \
+            recording('pushup', 'pushup', station=getattr(cap, 'station', None)) as recorder:
+        processor = PushUpProcessor(timings=timings, recorder=recorder)
+        yield from StreamPipeline(cap, pose_inference(pose, inference_options, timings), processor.process, queue_sizes,
+                                  make_encoder(encoder_options), timings)
+
+
+def push_up_data(cap, queue_sizes=None, inference_options=None, pose_pool=POSE_POOL):
+    """
+    Like push_up_detection, but yields analysis packets instead of video
+    """
+    timings = StageTimings('pushup-data', getattr(cap, 'station', None))
+    with pose_pool.checkout(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose, \
+            recording('pushup-data', 'pushup', station=getattr(cap, 'station', None)) as recorder:
+        processor = PushUpProcessor(draw=False, countdown=False, timings=timings, recorder=recorder)
+
+        def analyze(frame, results):
+            h, w = frame.shape[:2]
+            start = time.perf_counter()
+            result = processor.analyze(results.pose_landmarks, w, h)
+            timings.observe('rep_logic', time.perf_counter() - start)
+            return make_packet(result, processor.landmarks)
+
+        yield from StreamPipeline(cap, pose_inference(pose, inference_options, timings), analyze, queue_sizes,
+                                  PacketEncoder(), timings)
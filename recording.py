@@ -0,0 +1,359 @@
+# recording.py
+#
+# Landmark logs: the landmarks, timestamp and emitted feedback of every
+# analyzed frame, written as a compressed .npz, and a replay path that feeds
+# a log back through the analyzers without running MediaPipe.
+#
+# Streams record when GYMGENIUS_RECORD_DIR points at a directory; each one
+# writes <dir>/<stream>-<YYYYmmdd-HHMMSS>-<n>-<part>.npz when it ends, and a
+# new part every RECORDING_OPTIONS['max_frames'] frames. With
+# GYMGENIUS_LANDMARK_STORE set they also append to that landmark store for
+# analytics, see landmark_store.py. To replay a log, e.g. with the pro
+# squat thresholds:
+#
+#     python recording.py logs/squat-20250101-120000-1-0.npz --level pro
+#
+# Log arrays, N analyzed frames:
+#
+#   version         LOG_VERSION
+#   exercise        name from batch.EXERCISES
+#   timestamps      (N,) float64 processor clock: seconds since the epoch
+#                   for every live stream, whatever the exercise
+#   landmarks       (N, 33, 4) float32 normalized x, y, z, visibility, NaN
+#                   where nobody was detected
+#   frame_size      (N, 2) uint16 width, height the frame was analyzed at
+#   feedback        (N,) uint8 index into feedback_codes
+#   feedback_codes  feedback codes seen in the log, see the FEEDBACK tables
+#   counts          (N, 2) uint16 total and correct reps after the frame
+#   rep             (N,) bool, a rep finished on the frame
+
+import argparse
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from landmark_store import LandmarkStore
+from rep_events import RepEventRecorder, shared_writer
+from squat_modules.utils import NUM_LANDMARKS
+
+LOG_VERSION = 1
+
+RECORDING_OPTIONS = {
+    # Where streams write their logs, recording is off while unset
+    'directory': os.environ.get('GYMGENIUS_RECORD_DIR'),
+    # Frames per file, 30 minutes at 30 fps
+    'max_frames': 54000,
+    # Landmark store every stream also appends to (landmark_store.py), off while unset
+    'store': os.environ.get('GYMGENIUS_LANDMARK_STORE')
+}
+
+# Frames allocated at a time while recording
+CHUNK_FRAMES = 1024
+
+_stream_ids = itertools.count(1)
+
+# Store root -> LandmarkStore shared by the streams of this process
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class LandmarkRecorder:
+    """
+    Buffers analyzed frames in preallocated chunks and writes them out as
+    numbered .npz parts of `prefix`.
+
+    Processors call `add()` at the end of analyze(). When a part is full
+    only its buffers are swapped out there; compressing and writing it
+    happens on the recorder's saver thread. `close()` hands off the last
+    part and waits until every part is on disk.
+    """
+
+    def __init__(self, prefix, exercise, max_frames=54000):
+        self.prefix = prefix
+        self.exercise = exercise
+        self.max_frames = max_frames
+        self.paths = []
+
+        self._codes = {}
+        self._chunks = []
+        self._length = 0
+        self._parts = 0
+        self._lock = threading.Lock()
+
+        # Full parts waiting to be saved, None stops the saver
+        self._pending = queue.Queue()
+        self._saver = None
+
+    def _new_chunk(self):
+        return {
+            'timestamps': np.empty(CHUNK_FRAMES, dtype=np.float64),
+            'landmarks': np.empty((CHUNK_FRAMES, NUM_LANDMARKS, 4), dtype=np.float32),
+            'frame_size': np.empty((CHUNK_FRAMES, 2), dtype=np.uint16),
+            'feedback': np.empty(CHUNK_FRAMES, dtype=np.uint8),
+            'counts': np.empty((CHUNK_FRAMES, 2), dtype=np.uint16),
+            'rep': np.empty(CHUNK_FRAMES, dtype=bool)
+        }
+
+    def add(self, timestamp, landmarks, width, height, result):
+        """
+        Record one analyze() result
+
+        Args:
+            timestamp: Processor clock of the frame, wall-clock time in live streams
+            landmarks: The processor's LandmarkArray, or None if nobody was detected
+            width, height: Frame size the landmarks were analyzed at
+            result: Dict returned by analyze()
+        """
+        with self._lock:
+            index = self._length % CHUNK_FRAMES
+            if index == 0:
+                self._chunks.append(self._new_chunk())
+            chunk = self._chunks[-1]
+
+            chunk['timestamps'][index] = timestamp
+            if landmarks is None:
+                chunk['landmarks'][index] = np.nan
+            else:
+                chunk['landmarks'][index] = landmarks.data
+            chunk['frame_size'][index] = width, height
+            chunk['feedback'][index] = self._codes.setdefault(result['feedback'], len(self._codes))
+            chunk['counts'][index] = result['counts']['total'], result['counts']['correct']
+            chunk['rep'][index] = result['rep'] is not None
+            self._length += 1
+
+            if self._length >= self.max_frames:
+                self._hand_off()
+
+    def close(self):
+        with self._lock:
+            if self._length:
+                self._hand_off()
+            saver, self._saver = self._saver, None
+        if saver is not None:
+            self._pending.put(None)
+            saver.join()
+
+    def _hand_off(self):
+        # Called with the lock held, the next frame starts a fresh part
+        path = f"{self.prefix}-{self._parts}.npz"
+        self._pending.put((path, self._chunks, self._codes, self._length))
+        self._parts += 1
+        self._chunks = []
+        self._codes = {}
+        self._length = 0
+
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_parts, name='landmark-recorder', daemon=True)
+            self._saver.start()
+
+    def _save_parts(self):
+        while True:
+            part = self._pending.get()
+            if part is None:
+                return
+            try:
+                self._save(*part)
+            except OSError as e:
+                print(f"Could not save recording {part[0]}: {e}")
+
+    def _save(self, path, chunks, codes, length):
+        arrays = {name: np.concatenate([chunk[name] for chunk in chunks])[:length] for name in chunks[0]}
+        codes = sorted(codes, key=codes.get)
+        np.savez_compressed(path, version=LOG_VERSION, exercise=self.exercise,
+                            feedback_codes=np.array([str(code) for code in codes]), **arrays)
+        self.paths.append(path)
+        print(f"Recorded {length} frames to {path}")
+
+
+class RecorderGroup:
+    """
+    Feeds every analyzed frame to several recorders
+    """
+
+    def __init__(self, recorders):
+        self.recorders = recorders
+
+    def add(self, timestamp, landmarks, width, height, result):
+        for recorder in self.recorders:
+            recorder.add(timestamp, landmarks, width, height, result)
+
+    def close(self):
+        for recorder in self.recorders:
+            recorder.close()
+
+
+def shared_store(root):
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = LandmarkStore(root)
+        return store
+
+
+@contextmanager
+def recording(stream, exercise, directory=None, store=None, station=None):
+    """
+    Recorder for one stream: any of a LandmarkRecorder writing a log, a
+    session of the landmark store and a RepEventRecorder for the rep history
+    (rep_events.py), a RecorderGroup when several are on, or None when none
+    is. Everything is written out when the block exits.
+    """
+    directory = directory or RECORDING_OPTIONS['directory']
+    store = store or RECORDING_OPTIONS['store']
+
+    recorders = []
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{stream}-{time.strftime('%Y%m%d-%H%M%S')}-{next(_stream_ids)}")
+        recorders.append(LandmarkRecorder(prefix, exercise, RECORDING_OPTIONS['max_frames']))
+    if store:
+        recorders.append(shared_store(store).open_session(exercise))
+    writer = shared_writer()
+    if writer is not None:
+        recorders.append(RepEventRecorder(writer, exercise, station))
+
+    if not recorders:
+        yield None
+        return
+
+    recorder = recorders[0] if len(recorders) == 1 else RecorderGroup(recorders)
+    try:
+        yield recorder
+    finally:
+        recorder.close()
+
+
+class LandmarkLog:
+    """
+    A recorded log loaded into memory, arrays as described at the top
+    """
+
+    def __init__(self, exercise, timestamps, landmarks, frame_size, feedback, counts, rep):
+        self.exercise = exercise
+        self.timestamps = timestamps
+        self.landmarks = landmarks
+        self.frame_size = frame_size
+        self.feedback = feedback
+        self.counts = counts
+        self.rep = rep
+
+    @classmethod
+    def load(cls, path):
+        """
+        Raises:
+            ValueError: The file was written by another log version
+        """
+        with np.load(path) as data:
+            if int(data['version']) != LOG_VERSION:
+                raise ValueError(f"{path}: log version {int(data['version'])}, expected {LOG_VERSION}")
+            codes = data['feedback_codes'].tolist()
+            return cls(str(data['exercise']), data['timestamps'], data['landmarks'], data['frame_size'],
+                       [codes[i] for i in data['feedback']], data['counts'], data['rep'])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class ReplayLandmarks:
+    """
+    NormalizedLandmarkList stand-in over one recorded (33, 4) row,
+    LandmarkArray.update copies it in a single assignment
+    """
+
+    __slots__ = ('landmark',)
+
+    def __init__(self, row):
+        self.landmark = row
+
+
+def replay(log, level='beginner'):
+    """
+    Run a log through a headless processor of its exercise on the recorded
+    timestamps
+
+    Args:
+        log: LandmarkLog
+        level: Squat thresholds to use, 'beginner' or 'pro'
+
+    Returns:
+        analyze() result dict per frame
+    """
+    # Deferred, the exercise modules batch imports record through this one
+    from batch import EXERCISES
+
+    if not len(log):
+        return []
+
+    timestamps = log.timestamps.tolist()
+    frame = 0
+    processor = EXERCISES[log.exercise](lambda: timestamps[frame], level)
+
+    detected = ~np.isnan(log.landmarks[:, 0, 0])
+    results = []
+    for frame in range(len(log)):
+        pose_landmarks = ReplayLandmarks(log.landmarks[frame]) if detected[frame] else None
+        width, height = log.frame_size[frame]
+        results.append(processor.analyze(pose_landmarks, int(width), int(height)))
+    return results
+
+
+def differences(log, results):
+    """
+    Frames where replayed results disagree with the recording, as
+    (frame, recorded (feedback, total, correct), replayed (feedback, total, correct))
+    """
+    found = []
+    for frame, result in enumerate(results):
+        recorded = (log.feedback[frame], int(log.counts[frame, 0]), int(log.counts[frame, 1]))
+        replayed = (result['feedback'], result['counts']['total'], result['counts']['correct'])
+        if recorded != replayed:
+            found.append((frame, recorded, replayed))
+    return found
+
+
+def replay_file(path, level='beginner', show=10):
+    """
+    Replay one log file and describe the outcome, lines of text
+    """
+    log = LandmarkLog.load(path)
+    start = time.perf_counter()
+    results = replay(log, level)
+    elapsed = time.perf_counter() - start
+
+    span = log.timestamps[-1] - log.timestamps[0] if len(log) > 1 else 0.0
+    final = results[-1]['counts'] if results else {'total': 0, 'correct': 0}
+    lines = [f"{path}: {log.exercise}, {len(log)} frames, {final['total']} reps ({final['correct']} correct), "
+             f"replayed in {elapsed:.3f}s ({span / max(elapsed, 1e-9):.0f}x real time)"]
+
+    found = differences(log, results)
+    if found:
+        lines.append(f"  {len(found)} frames differ from the recording")
+    for frame, recorded, replayed in found[:show]:
+        lines.append(f"  frame {frame} at {log.timestamps[frame]:.3f}s: recorded {recorded}, replayed {replayed}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay landmark logs through the analyzers")
+    parser.add_argument('logs', nargs='+', help=".npz logs written by a recording stream")
+    parser.add_argument('--level', choices=['beginner', 'pro'], default='beginner',
+                        help="Squat thresholds to replay with")
+    parser.add_argument('--show', type=int, default=10, help="Differing frames to print per log")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    args = parser.parse_args()
+
+    # Replays are single-threaded Python, one log per core
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        jobs = [pool.submit(replay_file, path, args.level, args.show) for path in args.logs]
+        for job in jobs:
+            print('\n'.join(job.result()))
+
+
+if __name__ == '__main__':
+    main()
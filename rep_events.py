@@ -0,0 +1,415 @@
+# rep_events.py
+#
+# Structured rep events, persisted to a local SQLite database. Rep history
+# is off unless GYMGENIUS_REP_DB names the database file.
+#
+# Analyzers report every finished rep in their analyze() result; a
+# RepEventRecorder (fed through the processors' `recorder` hook, see
+# recording.py) turns those into events and hands them to the process-wide
+# RepEventWriter. Handing off is a non-blocking queue put, the writer thread
+# inserts whole batches in one transaction, so frame processing never
+# waits on the disk. If the writer falls more than `max_pending` events
+# behind, new events are dropped and counted instead of queueing without
+# bound.
+#
+# Every rep event has:
+#
+#   exercise            name from batch.EXERCISES
+#   station, user       where and by whom, None when unknown; the user is
+#                       whoever is checked in at the station (CHECKINS)
+#   rep                 number of the rep in its stream
+#   started_at, ended_at  wall-clock seconds since the epoch
+#   duration            seconds
+#   min_angle, max_angle  range of the exercise's main angle over the rep:
+#                       elbow for curls and push-ups, knee from vertical for squats
+#   correct             the analyzer's verdict
+#   feedback            verdict feedback code, see the FEEDBACK tables
+#   feedback_codes      form issues reported during the rep, empty for a clean rep
+#
+# The same transaction that inserts a batch adds it to two daily tables,
+# rep_stats_daily and rep_feedback_daily, per user, exercise and UTC day,
+# plus a USER_TOTAL row over everyone. rep_stats.py answers the dashboards
+# from those, so a year of stats reads a few hundred rows however many reps
+# are stored. Reps without a checked-in user count under ''.
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+REP_EVENT_OPTIONS = {
+    # SQLite file the events go to, rep history is off while unset
+    'database': os.environ.get('GYMGENIUS_REP_DB'),
+    # Most events inserted per transaction
+    'batch_size': 500,
+    # Seconds an event may wait for its batch to fill up
+    'flush_interval': 1.0,
+    # Events queued for the writer before new ones are dropped
+    'max_pending': 100000
+}
+
+REP_EVENT_FIELDS = ['exercise', 'station', 'user', 'rep', 'started_at', 'ended_at', 'duration',
+                    'min_angle', 'max_angle', 'correct', 'feedback', 'feedback_codes']
+
+# Angle that measures how deep a rep went: curls and push-ups bottom out
+# at the smallest elbow angle, squats at the largest knee angle
+DEPTH_ANGLES = {
+    'bicep': 'min_angle',
+    'pushup': 'min_angle',
+    'squat': 'max_angle'
+}
+
+# User of the daily rows summed over everyone
+USER_TOTAL = '*'
+
+# Bumped whenever the daily tables change, connect() rebuilds them from the events
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rep_events (
+    id INTEGER PRIMARY KEY,
+    exercise TEXT NOT NULL,
+    station TEXT,
+    user TEXT,
+    rep INTEGER,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    duration REAL,
+    min_angle REAL,
+    max_angle REAL,
+    correct INTEGER NOT NULL,
+    feedback TEXT,
+    -- comma-separated
+    feedback_codes TEXT
+);
+
+-- History pages, newest first, of one user and of one user's exercise
+CREATE INDEX IF NOT EXISTS rep_events_user ON rep_events (user, ended_at);
+CREATE INDEX IF NOT EXISTS rep_events_user_exercise ON rep_events (user, exercise, ended_at);
+
+CREATE TABLE IF NOT EXISTS rep_stats_daily (
+    user TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    -- days since the epoch, UTC
+    day INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    duration_sum REAL NOT NULL,
+    duration_count INTEGER NOT NULL,
+    depth_sum REAL NOT NULL,
+    depth_count INTEGER NOT NULL,
+    PRIMARY KEY (user, exercise, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rep_feedback_daily (
+    user TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user, exercise, day, code)
+) WITHOUT ROWID;
+"""
+
+_INSERT = (f"INSERT INTO rep_events ({', '.join(REP_EVENT_FIELDS)}) "
+           f"VALUES ({', '.join('?' for _ in REP_EVENT_FIELDS)})")
+
+_ADD_STATS = """
+INSERT INTO rep_stats_daily (user, exercise, day, reps, correct, duration_sum, duration_count, depth_sum, depth_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user, exercise, day) DO UPDATE SET
+    reps = reps + excluded.reps,
+    correct = correct + excluded.correct,
+    duration_sum = duration_sum + excluded.duration_sum,
+    duration_count = duration_count + excluded.duration_count,
+    depth_sum = depth_sum + excluded.depth_sum,
+    depth_count = depth_count + excluded.depth_count
+"""
+
+_ADD_FEEDBACK = """
+INSERT INTO rep_feedback_daily (user, exercise, day, code, count) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (user, exercise, day, code) DO UPDATE SET count = count + excluded.count
+"""
+
+_SECONDS_PER_DAY = 86400
+
+
+def _optional_float(value):
+    return None if value is None else float(value)
+
+
+def make_rep_event(exercise, rep, station=None, user=None, now=None):
+    """
+    Rep event dict from the `rep` of an analyze() result, finished at `now`
+    (time.time() by default)
+    """
+    ended_at = time.time() if now is None else now
+    duration = float(rep.get('duration') or 0.0)
+    return {
+        'exercise': exercise,
+        'station': station,
+        'user': user,
+        'rep': rep.get('number'),
+        'started_at': ended_at - duration,
+        'ended_at': ended_at,
+        'duration': duration,
+        'min_angle': _optional_float(rep.get('min_angle')),
+        'max_angle': _optional_float(rep.get('max_angle')),
+        'correct': bool(rep['correct']),
+        'feedback': rep.get('feedback'),
+        'feedback_codes': list(rep.get('feedback_codes') or ())
+    }
+
+
+def _row(event):
+    values = [event[field] for field in REP_EVENT_FIELDS]
+    values[REP_EVENT_FIELDS.index('correct')] = int(event['correct'])
+    values[REP_EVENT_FIELDS.index('feedback_codes')] = ','.join(event['feedback_codes'])
+    return values
+
+
+def event_day(timestamp):
+    """
+    Day of the daily tables a wall-clock time falls on
+    """
+    return int(timestamp // _SECONDS_PER_DAY)
+
+
+def _add_stats(connection, rows):
+    # Add _row() values to the daily tables, inside the caller's transaction
+    fields = {name: i for i, name in enumerate(REP_EVENT_FIELDS)}
+    stats = defaultdict(lambda: [0, 0, 0.0, 0, 0.0, 0])
+    feedback = defaultdict(int)
+    for row in rows:
+        exercise = row[fields['exercise']]
+        day = event_day(row[fields['ended_at']])
+        duration = row[fields['duration']]
+        depth_field = DEPTH_ANGLES.get(exercise)
+        depth = row[fields[depth_field]] if depth_field else None
+        codes = row[fields['feedback_codes']]
+
+        for user in (row[fields['user']] or '', USER_TOTAL):
+            entry = stats[user, exercise, day]
+            entry[0] += 1
+            entry[1] += row[fields['correct']]
+            if duration is not None:
+                entry[2] += duration
+                entry[3] += 1
+            if depth is not None:
+                entry[4] += depth
+                entry[5] += 1
+            if codes:
+                for code in codes.split(','):
+                    feedback[user, exercise, day, code] += 1
+
+    connection.executemany(_ADD_STATS, [key + tuple(entry) for key, entry in stats.items()])
+    connection.executemany(_ADD_FEEDBACK, [key + (count,) for key, count in feedback.items()])
+
+
+def _rebuild_stats(connection):
+    # Daily tables from scratch out of every stored event, e.g. for a
+    # database written before they existed
+    connection.execute("DELETE FROM rep_stats_daily")
+    connection.execute("DELETE FROM rep_feedback_daily")
+    cursor = connection.execute(f"SELECT {', '.join(REP_EVENT_FIELDS)} FROM rep_events")
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        _add_stats(connection, rows)
+
+
+def connect(path):
+    """
+    SQLite connection to an events database, schema created and daily
+    tables brought up to date if needed
+    """
+    connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    # Readers (the stats routes) keep working while a batch is written
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+
+    if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # Only one connection rebuilds, the others wait for its write lock and find it done
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                _rebuild_stats(connection)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+    return connection
+
+
+class RepEventWriter:
+    """
+    Batches rep events into SQLite transactions on a thread of its own.
+
+    Args:
+        path: SQLite database file
+        batch_size, flush_interval, max_pending: See REP_EVENT_OPTIONS
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.written = 0
+        self.dropped = 0
+        # Set when the database cannot be opened, events are dropped from then on
+        self.failed = False
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        """
+        Queue an event for the next batch, never blocks
+        """
+        if self.failed:
+            self.dropped += 1
+            return
+        self._start_writer()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """
+        Wait until every event emitted so far is committed
+        """
+        if self._writer is not None:
+            self._queue.join()
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='rep-events', daemon=True)
+                self._writer.start()
+
+    def _next_batch(self):
+        # Block for the first event, then take what arrives within flush_interval
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as e:
+            print(f"Could not open rep history {self.path}, rep events are dropped: {e}")
+            self.failed = True
+            self._discard()
+            return
+        while True:
+            batch = self._next_batch()
+            try:
+                rows = [_row(event) for event in batch]
+                with connection:
+                    connection.executemany(_INSERT, rows)
+                    _add_stats(connection, rows)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                print(f"Could not store {len(batch)} rep events: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _discard(self):
+        # Keep the queue empty after a failure, events that raced past the failed check are counted as dropped
+        # and flush() still returns
+        while True:
+            self._queue.get()
+            self.dropped += 1
+            self._queue.task_done()
+
+
+class StationCheckins:
+    """
+    Who is working out at each station, rep events of a station without a
+    fixed user go to whoever is checked in there at the time
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def check_in(self, station, user):
+        """
+        Raises:
+            ValueError: `user` is empty or USER_TOTAL
+        """
+        if not user or user == USER_TOTAL:
+            raise ValueError(f"Invalid user: {user!r}")
+        with self._lock:
+            self._users[station] = user
+
+    def check_out(self, station):
+        with self._lock:
+            return self._users.pop(station, None)
+
+    def user(self, station):
+        return self._users.get(station)
+
+
+# Check-ins of this process, see the /stations routes of app.py
+CHECKINS = StationCheckins()
+
+
+class RepEventRecorder:
+    """
+    Recorder (see recording.py) that emits an event for every finished rep
+    of one stream and ignores all other frames
+    """
+
+    def __init__(self, writer, exercise, station=None, user=None, checkins=CHECKINS):
+        self.writer = writer
+        self.exercise = exercise
+        self.station = station
+        self.user = user
+        self.checkins = checkins
+
+    def add(self, timestamp, landmarks, width, height, result):
+        rep = result['rep']
+        if rep is not None:
+            user = self.user or self.checkins.user(self.station)
+            self.writer.emit(make_rep_event(self.exercise, rep, self.station, user))
+
+    def close(self):
+        pass
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def shared_writer(path=None):
+    """
+    The RepEventWriter of a database, shared by every stream of the process,
+    or None when rep history is off
+    """
+    path = path or REP_EVENT_OPTIONS['database']
+    if not path:
+        return None
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            options = {name: REP_EVENT_OPTIONS[name] for name in ('batch_size', 'flush_interval', 'max_pending')}
+            writer = _writers[path] = RepEventWriter(path, **options)
+        return writer
@@ -0,0 +1,239 @@
+# rep_stats.py
+#
+# Read side of the rep history (rep_events.py): paged rep history of a user
+# and per-day stats, rolling averages and form issue frequencies for the
+# dashboards, as JSON-ready dicts.
+#
+# History pages walk the (user, ended_at) indexes newest first, ties in
+# order of id, and a page continues after the (ended_at, id) `next` of the
+# previous one. Stats only read the daily tables, one row per user, exercise
+# and day, so their cost depends on the days asked for and not on the reps
+# stored. Days are UTC.
+
+import datetime
+import threading
+import time
+
+from rep_events import DEPTH_ANGLES, REP_EVENT_OPTIONS, REP_EVENT_FIELDS, USER_TOTAL, connect, event_day
+
+STATS_OPTIONS = {
+    # Most days one stats request covers
+    'max_days': 366,
+    # Most days a rolling average spans
+    'max_window': 90,
+    # Most reps per history page
+    'max_history': 500
+}
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def _date(day):
+    return (_EPOCH + datetime.timedelta(days=day)).isoformat()
+
+
+def _average(total, count):
+    return total / count if count else None
+
+
+def _int_arg(args, name, default, low, high):
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number") from None
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def _exercise_arg(args):
+    exercise = args.get('exercise') or None
+    if exercise is not None and exercise not in DEPTH_ANGLES:
+        raise ValueError(f"Unknown exercise: {exercise}")
+    return exercise
+
+
+def stats_query(args):
+    """
+    (exercise, days, window) of a stats request's query args
+
+    Raises:
+        ValueError: An arg is malformed or out of range
+    """
+    return (_exercise_arg(args),
+            _int_arg(args, 'days', 30, 1, STATS_OPTIONS['max_days']),
+            _int_arg(args, 'window', 7, 1, STATS_OPTIONS['max_window']))
+
+
+def history_query(args):
+    """
+    (exercise, before, limit) of a history request's query args, `before`
+    the (ended_at, id) of ?before=<ended_at>&before_id=<id> or None
+
+    Raises:
+        ValueError: An arg is malformed or out of range
+    """
+    before = None
+    if args.get('before'):
+        try:
+            before = (float(args['before']), int(args['before_id']))
+        except (KeyError, ValueError):
+            raise ValueError("before must be a time in seconds and before_id a rep id, "
+                             "both from the next of the previous page") from None
+    return _exercise_arg(args), before, _int_arg(args, 'limit', 50, 1, STATS_OPTIONS['max_history'])
+
+
+class RepStats:
+    """
+    Queries on the rep events database at `path`, one connection per thread
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+    def history(self, user, exercise=None, before=None, limit=50):
+        """
+        A page of a user's rep events, newest first
+
+        Args:
+            user: User the reps were checked in to
+            exercise: Only reps of this exercise, all exercises when None
+            before: Only reps before this (ended_at, id), from the `next` of the previous page
+            limit: Most reps on the page
+
+        Returns:
+            {'reps': [event with its id, ...],
+             'next': {'before': ended_at, 'before_id': id} to continue from, None on the last page}
+        """
+        conditions = ['user = ?']
+        params = [user]
+        if exercise is not None:
+            conditions.append('exercise = ?')
+            params.append(exercise)
+        if before is not None:
+            # Reps ending at the same time as the last one of the previous page are told apart by id
+            conditions.append('(ended_at, id) < (?, ?)')
+            params.extend(before)
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(REP_EVENT_FIELDS)} FROM rep_events WHERE {' AND '.join(conditions)} "
+            f"ORDER BY ended_at DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+
+        reps = []
+        for row in rows:
+            event = dict(zip(['id'] + REP_EVENT_FIELDS, row))
+            event['correct'] = bool(event['correct'])
+            event['feedback_codes'] = event['feedback_codes'].split(',') if event['feedback_codes'] else []
+            reps.append(event)
+
+        last = reps[-1] if len(reps) == limit else None
+        return {'reps': reps, 'next': {'before': last['ended_at'], 'before_id': last['id']} if last else None}
+
+    def summary(self, user=USER_TOTAL, exercise=None, days=30, window=7, now=None):
+        """
+        Per-exercise stats over the last `days` days up to `now` (time.time()
+        by default)
+
+        Args:
+            user: User to summarize, USER_TOTAL for everyone
+            exercise: Only this exercise, every exercise when None
+            days: Days to cover, today included
+            window: Days each rolling average spans, the day itself included
+
+        Returns:
+            {'user', 'from', 'to', 'exercises': {exercise: {
+                'reps', 'correct',
+                'days': [{'date', 'reps', 'correct', 'avg_duration', 'avg_depth',
+                          'rolling_duration', 'rolling_depth'}, ...] oldest first,
+                'feedback': [{'code', 'count', 'frequency'}, ...] most frequent first}}}
+
+            Depth is the DEPTH_ANGLES angle in degrees, frequency the share
+            of reps the issue was reported for. Averages are None without reps.
+        """
+        last = event_day(time.time() if now is None else now)
+        first = last - days + 1
+        connection = self._connection()
+
+        exercises = {}
+        for name in ([exercise] if exercise is not None else list(DEPTH_ANGLES)):
+            # Rolling averages of the first days reach back before them
+            rows = connection.execute(
+                "SELECT day, reps, correct, duration_sum, duration_count, depth_sum, depth_count "
+                "FROM rep_stats_daily WHERE user = ? AND exercise = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user, name, first - window + 1, last)).fetchall()
+            if exercise is None and not any(row[0] >= first for row in rows):
+                continue
+            exercises[name] = self._exercise_summary(connection, user, name, rows, first, last, window)
+
+        return {'user': user, 'from': _date(first), 'to': _date(last), 'exercises': exercises}
+
+    def _exercise_summary(self, connection, user, exercise, rows, first, last, window):
+        by_day = {row[0]: row[1:] for row in rows}
+        empty = (0, 0, 0.0, 0, 0.0, 0)
+
+        series = []
+        # Sums over the trailing window: duration_sum, duration_count, depth_sum, depth_count
+        rolling = [0.0, 0, 0.0, 0]
+        total_reps = total_correct = 0
+        for day in range(first - window + 1, last + 1):
+            reps, correct, duration_sum, duration_count, depth_sum, depth_count = by_day.get(day, empty)
+            for i, value in enumerate((duration_sum, duration_count, depth_sum, depth_count)):
+                rolling[i] += value
+            leaving = by_day.get(day - window)
+            if leaving is not None:
+                for i, value in enumerate(leaving[2:]):
+                    rolling[i] -= value
+            if day < first:
+                continue
+
+            total_reps += reps
+            total_correct += correct
+            series.append({
+                'date': _date(day),
+                'reps': reps,
+                'correct': correct,
+                'avg_duration': _average(duration_sum, duration_count),
+                'avg_depth': _average(depth_sum, depth_count),
+                'rolling_duration': _average(rolling[0], rolling[1]),
+                'rolling_depth': _average(rolling[2], rolling[3])
+            })
+
+        feedback = connection.execute(
+            "SELECT code, SUM(count) AS total FROM rep_feedback_daily "
+            "WHERE user = ? AND exercise = ? AND day BETWEEN ? AND ? GROUP BY code ORDER BY total DESC, code",
+            (user, exercise, first, last)).fetchall()
+
+        return {
+            'reps': total_reps,
+            'correct': total_correct,
+            'days': series,
+            'feedback': [{'code': code, 'count': count, 'frequency': _average(count, total_reps)}
+                         for code, count in feedback]
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def shared_stats(path=None):
+    """
+    RepStats of the rep events database, or None when rep history is off
+    """
+    path = path or REP_EVENT_OPTIONS['database']
+    if not path:
+        return None
+    with _stats_lock:
+        stats = _stats.get(path)
+        if stats is None:
+            stats = _stats[path] = RepStats(path)
+        return stats
@@ -0,0 +1,162 @@
+# routes.py
+#
+# What the HTTP routes do, shared by the Flask app (app.py) and the ASGI
+# app (asgi.py). The tables list the page and stream routes both apps
+# register, and the helpers hold the logic of the others. Each app only
+# adds its framework's request, response and streaming glue.
+#
+# Helpers raise RouteError for a bad request; both apps turn it into an
+# error response with its status.
+
+from bicep_curl import bicep_curl_detection, bicep_curl_data
+from squats import squat_detection, squat_data
+from pushups import push_up_detection, push_up_data
+from packets import PACKET_MIMETYPES
+from tracking import GROUP_EXERCISES, group_detection
+from rep_events import CHECKINS
+from rep_stats import history_query, shared_stats, stats_query
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+# Analysis packets are streamed as they are produced, not buffered by proxies
+PACKET_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# (endpoint, path, template) of the pages, rendered with ?camera=<id>
+PAGES = [
+    ('home', '/', 'index.html'),
+    ('bicep_curls', '/bicep-curls', 'bicep-curls.html'),
+    ('squats', '/squats', 'squats.html'),
+    ('push_ups', '/push-ups', 'push-ups.html')
+]
+
+# (endpoint, path, exercise, generator factory) of the MJPEG video streams
+VIDEO_STREAMS = [
+    ('bicep_video', '/bicep-video', 'bicep', bicep_curl_detection),
+    ('squats_video', '/squats-video', 'squat', squat_detection),
+    ('push_ups_video', '/push-ups-video', 'pushup', push_up_detection)
+]
+
+# (endpoint, path, exercise, generator factory) of the analysis packet streams
+DATA_STREAMS = [
+    ('bicep_data', '/bicep-data', 'bicep', bicep_curl_data),
+    ('squats_data', '/squats-data', 'squat', squat_data),
+    ('push_ups_data', '/push-ups-data', 'pushup', push_up_data)
+]
+
+# Data stream factory of every exercise, for ingest sessions
+INGEST_FACTORIES = {exercise: factory for _, _, exercise, factory in DATA_STREAMS}
+
+
+class RouteError(Exception):
+    """
+    A request the route cannot serve, answered with `status` and `message`
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def camera(cameras, camera_id=None):
+    """
+    (camera id, CaptureService) of ?camera=<id>, the first camera when not given
+    """
+    camera_id = camera_id or cameras.default
+    try:
+        return camera_id, cameras.get(camera_id)
+    except KeyError:
+        raise RouteError(404, f"Unknown camera: {camera_id}") from None
+
+
+def packet_format(fmt):
+    if fmt not in PACKET_MIMETYPES:
+        raise RouteError(400, f"Unknown format: {fmt}")
+    return fmt
+
+
+def group_stream(exercise):
+    """
+    (stream name, generator factory) of a group mode video stream
+    """
+    if exercise not in GROUP_EXERCISES:
+        raise RouteError(404, f"Unknown exercise: {exercise}")
+    return f'group-{exercise}', lambda cap: group_detection(cap, exercise)
+
+
+def open_ingest(ingest, exercise):
+    """
+    Open an ingest session, the JSON answer
+    """
+    try:
+        session = ingest.open(exercise)
+    except ValueError as e:
+        raise RouteError(404, str(e)) from None
+    except RuntimeError as e:
+        raise RouteError(503, str(e)) from None
+    return {'session': session.id, 'exercise': exercise}
+
+
+def ingest_session(ingest, session_id, content_length):
+    """
+    The session a frame of `content_length` bytes is pushed to
+    """
+    session = ingest.get(session_id)
+    if session is None:
+        raise RouteError(404, "Unknown ingest session")
+    if content_length is None or content_length > ingest.max_frame_bytes:
+        raise RouteError(413, "Frame too large")
+    return session
+
+
+def close_ingest(ingest, session_id):
+    session = ingest.get(session_id)
+    if session is not None:
+        ingest.close(session)
+
+
+def _stats():
+    stats = shared_stats()
+    if stats is None:
+        raise RouteError(404, "Rep history is off")
+    return stats
+
+
+def stats_summary(user, args):
+    """
+    JSON stats of `user` (rep_events.USER_TOTAL for everyone), see RepStats.summary.
+    Runs SQLite queries, async apps call it off the event loop.
+    """
+    try:
+        exercise, days, window = stats_query(args)
+    except ValueError as e:
+        raise RouteError(400, str(e)) from None
+    return _stats().summary(user, exercise, days, window)
+
+
+def stats_history(user, args):
+    """
+    JSON page of a user's rep history, see RepStats.history.
+    Runs SQLite queries, async apps call it off the event loop.
+    """
+    try:
+        exercise, before, limit = history_query(args)
+    except ValueError as e:
+        raise RouteError(400, str(e)) from None
+    return _stats().history(user, exercise, before, limit)
+
+
+def check_in(station, body):
+    """
+    Check the user of a {"user": "<id>"} request body in at `station`
+    """
+    user = body.get('user') if isinstance(body, dict) else None
+    try:
+        CHECKINS.check_in(station, user)
+    except ValueError as e:
+        raise RouteError(400, str(e)) from None
+    return {'station': station, 'user': user}
+
+
+def check_out(station):
+    CHECKINS.check_out(station)
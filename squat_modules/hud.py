@@ -0,0 +1,236 @@
+import functools
+
+import cv2
+import numpy as np
+
+# Number of distinct pre-rendered sprites kept around (texts x colors x sizes)
+SPRITE_CACHE_SIZE = 256
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Icons that 'icon' ops can place, registered by name
+ICONS = {}
+
+
+# A sprite is described by a tuple of drawing ops, so it can key the cache:
+#   ('rect',    (x0, y0), (x1, y1), color)                 filled, corners inclusive
+#   ('ellipse', center, axes, start_angle, end_angle, color)  filled
+#   ('circle',  center, radius, color)                      filled
+#   ('text',    text, (x, y), font_scale, color, thickness[, font]) anti-aliased
+#   ('icon',    name, (x, y), size)                         ICONS[name] resized to size x size
+
+
+class Sprite:
+    """
+    Pre-rendered BGRA overlay. Color channels are premultiplied by alpha so a
+    blit is one multiply and one add, and fully opaque sprites are plain copies.
+    """
+
+    def __init__(self, pixels, offset):
+        self.pixels = pixels
+        self.offset = offset
+        self.opaque = bool((pixels[:, :, 3] == 255).all())
+
+        self.color = np.ascontiguousarray(pixels[:, :, :3])
+        # 255 - alpha per channel, what is left of the frame under the sprite
+        self.inv_alpha = None if self.opaque else cv2.merge([255 - pixels[:, :, 3]] * 3)
+
+
+
+def _op_bounds(op):
+    kind = op[0]
+
+    if kind == 'rect':
+        (x0, y0), (x1, y1) = op[1], op[2]
+        return min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1
+
+    if kind == 'ellipse':
+        (cx, cy), (ax, ay) = op[1], op[2]
+        return cx - ax, cy - ay, cx + ax + 1, cy + ay + 1
+
+    if kind == 'circle':
+        (cx, cy), r = op[1], op[2]
+        return cx - r, cy - r, cx + r + 1, cy + r + 1
+
+    if kind == 'text':
+        text, (x, y), font_scale, _, thickness = op[1:6]
+        font = op[6] if len(op) > 6 else FONT
+        (text_w, text_h), baseline = cv2.getTextSize(text, font, font_scale, thickness)
+        # Anti-aliasing and stroke width spill a little past the text box
+        pad = thickness + 2
+        return x - pad, y - text_h - pad, x + text_w + pad, y + baseline + pad
+
+    if kind == 'icon':
+        (x, y), size = op[2], op[3]
+        return x, y, x + size, y + size
+
+    raise ValueError(f"Unknown sprite op: {kind}")
+
+
+
+def _draw_op(canvas, mask, op, shift):
+    kind = op[0]
+    sx, sy = shift
+
+    if kind == 'rect':
+        (x0, y0), (x1, y1), color = op[1:]
+        cv2.rectangle(canvas, (x0 + sx, y0 + sy), (x1 + sx, y1 + sy), color, -1)
+        cv2.rectangle(mask, (x0 + sx, y0 + sy), (x1 + sx, y1 + sy), 255, -1)
+
+    elif kind == 'ellipse':
+        (cx, cy), axes, start, end, color = op[1:]
+        cv2.ellipse(canvas, (cx + sx, cy + sy), axes, angle = 0, startAngle = start, endAngle = end, color = color, thickness = -1)
+        cv2.ellipse(mask, (cx + sx, cy + sy), axes, angle = 0, startAngle = start, endAngle = end, color = 255, thickness = -1)
+
+    elif kind == 'circle':
+        (cx, cy), r, color = op[1:]
+        cv2.circle(canvas, (cx + sx, cy + sy), r, color, -1)
+        cv2.circle(mask, (cx + sx, cy + sy), r, 255, -1)
+
+    elif kind == 'text':
+        text, (x, y), font_scale, color, thickness = op[1:6]
+        font = op[6] if len(op) > 6 else FONT
+        cv2.putText(canvas, text, (x + sx, y + sy), font, font_scale, color, thickness, cv2.LINE_AA)
+        cv2.putText(mask, text, (x + sx, y + sy), font, font_scale, 255, thickness, cv2.LINE_AA)
+
+    elif kind == 'icon':
+        name, (x, y), size = op[1:]
+        canvas[y + sy:y + sy + size, x + sx:x + sx + size] = _icon(name, size)
+        mask[y + sy:y + sy + size, x + sx:x + sx + size] = 255
+
+
+
+@functools.lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def _icon(name, size):
+    return cv2.resize(ICONS[name], (size, size), interpolation = cv2.INTER_AREA)
+
+
+
+@functools.lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def render_sprite(ops):
+    """
+    Render a tuple of drawing ops (see above) once into a cached Sprite.
+    Op coordinates are relative to the point the sprite is blitted at.
+    """
+    bounds = [_op_bounds(op) for op in ops]
+    x0 = min(b[0] for b in bounds)
+    y0 = min(b[1] for b in bounds)
+    x1 = max(b[2] for b in bounds)
+    y1 = max(b[3] for b in bounds)
+
+    # Drawing on black gives premultiplied color, the mask is the coverage
+    canvas = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    for op in ops:
+        _draw_op(canvas, mask, op, (-x0, -y0))
+
+    # Bounds are generous, trim to what was drawn so panels stay opaque
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = cols[0], cols[-1] + 1
+
+    pixels = np.dstack((canvas, mask))[top:bottom, left:right]
+    pixels.flags.writeable = False
+    return Sprite(pixels, (x0 + left, y0 + top))
+
+
+
+def blit(image, sprite, pos):
+    """
+    Composite a Sprite onto a 3-channel image in place, clipped to the image
+    """
+    x = pos[0] + sprite.offset[0]
+    y = pos[1] + sprite.offset[1]
+    h, w = sprite.pixels.shape[:2]
+    img_h, img_w = image.shape[:2]
+
+    # Visible part of the sprite
+    left, top = max(0, -x), max(0, -y)
+    right, bottom = min(w, img_w - x), min(h, img_h - y)
+    if right <= left or bottom <= top:
+        return
+
+    color = sprite.color[top:bottom, left:right]
+    dst = image[y + top:y + bottom, x + left:x + right]
+
+    if sprite.opaque:
+        dst[:] = color
+        return
+
+    # dst = color + dst * (1 - alpha), saturating
+    cv2.add(cv2.multiply(dst, sprite.inv_alpha[top:bottom, left:right], scale=1 / 255), color, dst=dst)
+
+
+
+def draw_sprite(image, ops, pos = (0, 0)):
+    blit(image, render_sprite(ops), pos)
+
+
+
+def rounded_rect_ops(rect_start, rect_end, corner_width, box_color):
+    """
+    Drawing ops of a filled rounded rectangle, as drawn by utils.draw_rounded_rect
+    """
+    x1, y1 = rect_start
+    x2, y2 = rect_end
+    w = corner_width
+
+    return (
+        ('rect', (x1 + w, y1), (x2 - w, y1 + w), box_color),
+        ('rect', (x1 + w, y2 - w), (x2 - w, y2), box_color),
+        ('rect', (x1, y1 + w), (x1 + w, y2 - w), box_color),
+        ('rect', (x2 - w, y1 + w), (x2, y2 - w), box_color),
+        ('rect', (x1 + w, y1 + w), (x2 - w, y2 - w), box_color),
+        ('ellipse', (x1 + w, y1 + w), (w, w), -90, -180, box_color),
+        ('ellipse', (x2 - w, y1 + w), (w, w), 0, -90, box_color),
+        ('ellipse', (x1 + w, y2 - w), (w, w), 90, 180, box_color),
+        ('ellipse', (x2 - w, y2 - w), (w, w), 0, 90, box_color)
+    )
+
+
+
+@functools.lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def _form_panel(width, text, color):
+    # Panel plus the largest font scale (0.7, else 0.5) its message fits at
+    font_scale = 0.7
+    thickness = 2
+
+    text_size = cv2.getTextSize(text, FONT, font_scale, thickness)[0]
+    if text_size[0] > width - 20:
+        font_scale = 0.5
+        text_size = cv2.getTextSize(text, FONT, font_scale, thickness)[0]
+
+    return render_sprite((
+        ('rect', (0, 0), (width, 50), color),
+        ('text', 'FORM', (5, 20), 0.5, (0, 0, 0), 1),
+        ('text', text, ((width - text_size[0]) // 2, 30), font_scale, (255, 255, 255), thickness)
+    ))
+
+
+
+def draw_counter_bar(image, total, correct, form_text, total_color, correct_color, form_color):
+    """
+    Draw the top bar shared by every exercise: total reps on the left,
+    correct reps on the right and the form feedback in between.
+    Each panel is a cached sprite, so this is three blits per frame.
+    """
+    frame_width = image.shape[1]
+    counter_width = 150
+    correct_width = 150
+
+    draw_sprite(image, (
+        ('rect', (0, 0), (counter_width, 50), total_color),
+        ('text', 'TOTAL REPS', (5, 20), 0.5, (0, 0, 0), 1),
+        ('text', str(total), (40, 40), 1.0, (255, 255, 255), 2)
+    ), (10, 10))
+
+    draw_sprite(image, (
+        ('rect', (0, 0), (correct_width, 50), correct_color),
+        ('text', 'CORRECT', (15, 20), 0.5, (0, 0, 0), 1),
+        ('text', str(correct), (60, 40), 1.0, (255, 255, 255), 2)
+    ), (frame_width - 10 - correct_width, 10))
+
+    feedback_x = 10 + counter_width + 10
+    feedback_width = frame_width - feedback_x - correct_width - 20
+    blit(image, _form_panel(feedback_width, form_text, form_color), (feedback_x, 10))
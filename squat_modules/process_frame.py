@@ -559,15 +559,29 @@
 import time
 import cv2
 import numpy as np
-from .utils import find_angle, get_landmark_features, draw_text
+from .hud import draw_counter_bar
+from .utils import find_angles, find_vertical_angles, get_landmark_features, draw_text, LandmarkArray
 
 
 class ProcessFrame:
-    def __init__(self, thresholds, flip_frame = False):
+    def __init__(self, thresholds, flip_frame = False, draw = True, clock = time.time, timings = None, recorder = None):
         
         # Set if frame should be flipped or not.
         self.flip_frame = flip_frame
 
+        # Headless callers (batch analysis) skip every drawing call.
+        self.draw = draw
+
+        # Source of timestamps: wall-clock time like the other exercises' processors,
+        # video time when analyzing recordings.
+        self.clock = clock
+
+        # Where rep logic and overlay latencies are recorded (metrics.StageTimings).
+        self.timings = timings
+
+        # Landmark log of every analyzed frame (recording.LandmarkRecorder).
+        self.recorder = recorder
+
         # self.thresholds
         self.thresholds = thresholds
 
@@ -580,18 +594,18 @@ class ProcessFrame:
         # set radius to draw arc
         self.radius = 20
 
-        # Colors in BGR format.
+        # Colors in BGR format, frames are drawn on as captured.
         self.COLORS = {
-                        'blue'       : (0, 127, 255),
-                        'red'        : (255, 50, 50),
-                        'green'      : (0, 255, 127),
-                        'light_green': (100, 233, 127),
-                        'yellow'     : (255, 255, 0),
+                        'blue'       : (255, 127, 0),
+                        'red'        : (50, 50, 255),
+                        'green'      : (127, 255, 0),
+                        'light_green': (127, 233, 100),
+                        'yellow'     : (0, 255, 255),
                         'magenta'    : (255, 0, 255),
                         'white'      : (255,255,255),
-                        'cyan'       : (0, 255, 255),
-                        'light_blue' : (102, 204, 255),
-                        'orange'     : (16, 117, 245)  # BGR format for orange
+                        'cyan'       : (255, 255, 0),
+                        'light_blue' : (255, 204, 102),
+                        'orange'     : (245, 117, 16)
                       }
 
 
@@ -622,13 +636,27 @@ class ProcessFrame:
         self.dict_features['right'] = self.right_features
         self.dict_features['nose'] = 0
 
+        # Landmark buffers reused for every frame
+        self.landmarks = LandmarkArray()
+
+        # Shoulder-nose-shoulder angle, large when facing the camera
+        self.offset_triplet = [(self.left_features['shoulder'], self.dict_features['nose'], self.right_features['shoulder'])]
+
+        # (upper, lower) landmarks of the hip, knee and ankle vertical angles
+        self.vertical_pairs = {
+                                side: [(features['shoulder'], features['hip']),
+                                       (features['hip'], features['knee']),
+                                       (features['knee'], features['ankle'])]
+                                for side, features in (('left', self.left_features), ('right', self.right_features))
+                              }
+
         
         # For tracking counters and sharing states in and out of callbacks.
         self.state_tracker = {
             'state_seq': [],
 
-            'start_inactive_time': time.perf_counter(),
-            'start_inactive_time_front': time.perf_counter(),
+            'start_inactive_time': self.clock(),
+            'start_inactive_time_front': self.clock(),
             'INACTIVE_TIME': 0.0,
             'INACTIVE_TIME_FRONT': 0.0,
 
@@ -645,16 +673,37 @@ class ProcessFrame:
 
             'SQUAT_COUNT': 0,
             'IMPROPER_SQUAT':0,
+
+            # Clock, knee vertical angle range and form issues of the squat in progress
+            'REP_START': None,
+            'REP_MIN_KNEE': None,
+            'REP_MAX_KNEE': None,
+            'REP_FEEDBACK': set(),
             
-            'FORM_FEEDBACK': 'STAND STRAIGHT',
-            'FEEDBACK_COLOR': (0, 255, 0)  # Default green
+            'FORM_FEEDBACK': 'STAND_STRAIGHT'
         }
         
+        # Feedback code -> (message, box color)
+        self.FEEDBACK = {
+                            'STAND_STRAIGHT'    : ('STAND STRAIGHT', (0, 255, 0)),
+                            'GOOD_FORM'         : ('GOOD FORM', self.COLORS['green']),
+                            'LOWER_HIPS'        : ('LOWER YOUR HIPS', self.COLORS['yellow']),
+                            'BEND_BACKWARDS'    : ('BEND BACKWARDS', (255, 153, 0)),
+                            'BEND_FORWARD'      : ('BEND FORWARD', (255, 153, 0)),
+                            'KNEE_OVER_TOE'     : ('KNEE FALLING OVER TOE', (80, 80, 255)),
+                            'TOO_DEEP'          : ('SQUAT TOO DEEP', (80, 80, 255)),
+                            'INCOMPLETE_SQUAT'  : ('INCOMPLETE SQUAT', self.COLORS['red']),
+                            'CAMERA_NOT_ALIGNED': ('CAMERA NOT ALIGNED', self.COLORS['orange']),
+                            'INACTIVITY_RESET'  : ('RESET DUE TO INACTIVITY', self.COLORS['orange']),
+                            'NO_PERSON'         : ('NO PERSON DETECTED', self.COLORS['orange'])
+                        }
+
+        # DISPLAY_TEXT index -> (feedback code, y position of its message box)
         self.FEEDBACK_ID_MAP = {
-                                0: ('BEND BACKWARDS', 215, (0, 153, 255)),
-                                1: ('BEND FORWARD', 215, (0, 153, 255)),
-                                2: ('KNEE FALLING OVER TOE', 170, (255, 80, 80)),
-                                3: ('SQUAT TOO DEEP', 125, (255, 80, 80))
+                                0: ('BEND_BACKWARDS', 215),
+                                1: ('BEND_FORWARD', 215),
+                                2: ('KNEE_OVER_TOE', 170),
+                                3: ('TOO_DEEP', 125)
                                }
 
         
@@ -691,62 +740,90 @@ class ProcessFrame:
             
 
 
-    def _show_feedback(self, frame, c_frame, dict_maps, lower_hips_disp):
-        # Update form feedback based on current issues
-        feedback_text = 'GOOD FORM'
-        feedback_color = self.COLORS['green']
+    def _update_feedback(self, c_frame, lower_hips_disp):
+        # Pick the form feedback to show, the last active issue wins
+        feedback = 'GOOD_FORM'
 
         if lower_hips_disp:
-            feedback_text = 'LOWER YOUR HIPS'
-            feedback_color = self.COLORS['yellow']
+            feedback = 'LOWER_HIPS'
 
-        for idx in np.where(c_frame)[0]:
-            # Set the most important feedback to display in UI
-            feedback_text = dict_maps[idx][0]
-            feedback_color = dict_maps[idx][2]
-            
-            # Still show all individual feedback messages in their original positions
-            draw_text(
-                    frame, 
-                    dict_maps[idx][0], 
-                    pos=(30, dict_maps[idx][1]),
-                    text_color=(255, 255, 230),
-                    font_scale=0.6,
-                    text_color_bg=dict_maps[idx][2]
-                )
+        feedback_ids = [int(idx) for idx in np.where(c_frame)[0]]
+        for idx in feedback_ids:
+            feedback = self.FEEDBACK_ID_MAP[idx][0]
 
         # Update the state tracker with current feedback
-        self.state_tracker['FORM_FEEDBACK'] = feedback_text
-        self.state_tracker['FEEDBACK_COLOR'] = feedback_color
+        self.state_tracker['FORM_FEEDBACK'] = feedback
 
-        return frame
+        return feedback_ids
 
 
 
-    def process(self, frame: np.array, pose):
-        play_sound = None
-    
+    def _draw_counters(self, frame, total_reps, correct_reps, feedback):
+        form_text, feedback_color = self.FEEDBACK[feedback]
+        draw_counter_bar(frame, total_reps, correct_reps, form_text,
+                         self.COLORS['orange'], self.COLORS['green'], feedback_color)
+
+
+
+    def process(self, frame: np.array, pose, keypoints = None):
         frame_height, frame_width, _ = frame.shape
 
-        # Process the image.
-        keypoints = pose.process(frame)
+        # Process the image, unless inference already ran in its own stage.
+        if keypoints is None:
+            keypoints = pose.process(frame)
+
+        start = time.perf_counter()
+        result = self.analyze(keypoints.pose_landmarks, frame_width, frame_height)
+        analyzed = time.perf_counter()
+
+        if self.draw:
+            frame = self.render(frame, result)
+
+        if self.timings is not None:
+            self.timings.observe('rep_logic', analyzed - start)
+            self.timings.observe('overlay', time.perf_counter() - analyzed)
+
+        return frame, result['play_sound']
+
+
 
-        if keypoints.pose_landmarks:
-            ps_lm = keypoints.pose_landmarks
+    def analyze(self, pose_landmarks, frame_width, frame_height):
+        """
+        Update the squat state machine from one frame of landmarks, without drawing.
 
-            nose_coord = get_landmark_features(ps_lm.landmark, self.dict_features, 'nose', frame_width, frame_height)
+        Returns a dict with the counts, current state, feedback codes, vertical
+        angles, the pixel coordinates the renderer needs and the finished rep
+        (or None) for this frame.
+        """
+        play_sound = None
+        rep = None
+
+        result = {
+            'exercise': 'squat',
+            'detected': pose_landmarks is not None,
+            'camera_aligned': None,
+            'feedback_ids': [],
+            'angles': {},
+            'points': {}
+        }
+
+        if pose_landmarks:
+            landmarks = self.landmarks.update(pose_landmarks.landmark, frame_width, frame_height)
+
+            nose_coord = get_landmark_features(landmarks, self.dict_features, 'nose')
             left_shldr_coord, left_elbow_coord, left_wrist_coord, left_hip_coord, left_knee_coord, left_ankle_coord, left_foot_coord = \
-                                get_landmark_features(ps_lm.landmark, self.dict_features, 'left', frame_width, frame_height)
+                                get_landmark_features(landmarks, self.dict_features, 'left')
             right_shldr_coord, right_elbow_coord, right_wrist_coord, right_hip_coord, right_knee_coord, right_ankle_coord, right_foot_coord = \
-                                get_landmark_features(ps_lm.landmark, self.dict_features, 'right', frame_width, frame_height)
+                                get_landmark_features(landmarks, self.dict_features, 'right')
 
-            offset_angle = find_angle(left_shldr_coord, right_shldr_coord, nose_coord)
+            offset_angle = find_angles(landmarks.pixels, self.offset_triplet)[0]
+            result['angles']['offset'] = offset_angle
 
             if offset_angle > self.thresholds['OFFSET_THRESH']:
                 
                 display_inactivity = False
 
-                end_time = time.perf_counter()
+                end_time = self.clock()
                 self.state_tracker['INACTIVE_TIME_FRONT'] += end_time - self.state_tracker['start_inactive_time_front']
                 self.state_tracker['start_inactive_time_front'] = end_time
 
@@ -755,83 +832,23 @@ class ProcessFrame:
                     self.state_tracker['IMPROPER_SQUAT'] = 0
                     display_inactivity = True
 
-                cv2.circle(frame, nose_coord, 7, self.COLORS['white'], -1)
-                cv2.circle(frame, left_shldr_coord, 7, self.COLORS['yellow'], -1)
-                cv2.circle(frame, right_shldr_coord, 7, self.COLORS['magenta'], -1)
-
-                if self.flip_frame:
-                    frame = cv2.flip(frame, 1)
+                result['camera_aligned'] = False
+                result['points'] = {
+                                    'nose': nose_coord,
+                                    'left_shoulder': left_shldr_coord,
+                                    'right_shoulder': right_shldr_coord
+                                   }
 
                 if display_inactivity:
                     play_sound = 'reset_counters'
                     self.state_tracker['INACTIVE_TIME_FRONT'] = 0.0
-                    self.state_tracker['start_inactive_time_front'] = time.perf_counter()
+                    self.state_tracker['start_inactive_time_front'] = self.clock()
 
                 # Update form feedback
-                self.state_tracker['FORM_FEEDBACK'] = 'CAMERA NOT ALIGNED'
-                self.state_tracker['FEEDBACK_COLOR'] = self.COLORS['orange']
-                
-                # Draw new UI elements
-                # Calculate widths for UI elements
-                counter_width = 150
-                feedback_width = frame_width - counter_width - 300
-                correct_width = 150
-                
-                # Total squat counter (left side)
-                cv2.rectangle(frame, (10, 10), (10 + counter_width, 60), self.COLORS['orange'], -1)
-                cv2.putText(frame, 'TOTAL REPS', (15, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT']), (50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-                
-                # Correct form counter (right side)
-                cv2.rectangle(frame, (frame_width - 10 - correct_width, 10), (frame_width - 10, 60), self.COLORS['green'], -1)
-                cv2.putText(frame, 'CORRECT', (frame_width - correct_width + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT']), (frame_width - correct_width + 50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-                
-                # Form feedback (center)
-                feedback_x = 10 + counter_width + 10
-                feedback_width = frame_width - feedback_x - correct_width - 20
-                cv2.rectangle(frame, (feedback_x, 10), (feedback_x + feedback_width, 60), self.state_tracker['FEEDBACK_COLOR'], -1)
-                
-                # Ensure form feedback text fits in the box
-                form_text = self.state_tracker['FORM_FEEDBACK']
-                font_scale = 0.7
-                thickness = 2
-                
-                # Calculate text width to ensure it fits
-                text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-                
-                # If text is too long, reduce font size
-                if text_size[0] > feedback_width - 20:
-                    font_scale = 0.5
-                    text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-                
-                # Calculate text position to center it
-                text_x = feedback_x + (feedback_width - text_size[0]) // 2
-                text_y = 40
-                cv2.putText(frame, 'FORM', (feedback_x + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, form_text, (text_x, text_y), self.font, font_scale, self.COLORS['white'], thickness, self.linetype)
-
-                # draw_text(
-                #     frame, 
-                #     'CAMERA NOT ALIGNED PROPERLY!!!', 
-                #     pos=(30, frame_height-60),
-                #     text_color=(255, 255, 230),
-                #     font_scale=0.65,
-                #     text_color_bg=(255, 153, 0),
-                # ) 
-                
-                
-                # draw_text(
-                #     frame, 
-                #     'OFFSET ANGLE: '+str(offset_angle), 
-                #     pos=(30, frame_height-30),
-                #     text_color=(255, 255, 230),
-                #     font_scale=0.65,
-                #     text_color_bg=(255, 153, 0),
-                # ) 
+                self.state_tracker['FORM_FEEDBACK'] = 'CAMERA_NOT_ALIGNED'
 
                 # Reset inactive times for side view.
-                self.state_tracker['start_inactive_time'] = time.perf_counter()
+                self.state_tracker['start_inactive_time'] = self.clock()
                 self.state_tracker['INACTIVE_TIME'] = 0.0
                 self.state_tracker['prev_state'] =  None
                 self.state_tracker['curr_state'] = None
@@ -840,7 +857,7 @@ class ProcessFrame:
             else:
 
                 self.state_tracker['INACTIVE_TIME_FRONT'] = 0.0
-                self.state_tracker['start_inactive_time_front'] = time.perf_counter()
+                self.state_tracker['start_inactive_time_front'] = self.clock()
 
                 # FIX: Correct distance calculation for right side
                 dist_l_sh_hip = abs(left_foot_coord[1] - left_shldr_coord[1])
@@ -863,6 +880,7 @@ class ProcessFrame:
                     ankle_coord = left_ankle_coord
                     foot_coord = left_foot_coord
 
+                    side = 'left'
                     multiplier = -1
                                     
                 
@@ -875,63 +893,47 @@ class ProcessFrame:
                     ankle_coord = right_ankle_coord
                     foot_coord = right_foot_coord
 
+                    side = 'right'
                     multiplier = 1
                     
 
                 # ------------------- Verical Angle calculation --------------
                 
-                hip_vertical_angle = find_angle(shldr_coord, np.array([hip_coord[0], 0]), hip_coord)
-                cv2.ellipse(frame, hip_coord, (30, 30), 
-                            angle = 0, startAngle = -90, endAngle = -90+multiplier*hip_vertical_angle, 
-                            color = self.COLORS['white'], thickness = 3, lineType = self.linetype)
-
-                cv2.line(frame, (hip_coord[0], hip_coord[1] + 20), (hip_coord[0], hip_coord[1] - 80), self.COLORS['blue'], 4, lineType=self.linetype)
-
-
-
-
-                knee_vertical_angle = find_angle(hip_coord, np.array([knee_coord[0], 0]), knee_coord)
-                cv2.ellipse(frame, knee_coord, (20, 20), 
-                            angle = 0, startAngle = -90, endAngle = -90-multiplier*knee_vertical_angle, 
-                            color = self.COLORS['white'], thickness = 3,  lineType = self.linetype)
-
-                cv2.line(frame, (knee_coord[0], knee_coord[1] + 20), (knee_coord[0], knee_coord[1] - 50), self.COLORS['blue'], 4, lineType=self.linetype)
-
-
-
-                ankle_vertical_angle = find_angle(knee_coord, np.array([ankle_coord[0], 0]), ankle_coord)
-                cv2.ellipse(frame, ankle_coord, (30, 30),
-                            angle = 0, startAngle = -90, endAngle = -90 + multiplier*ankle_vertical_angle,
-                            color = self.COLORS['white'], thickness = 3,  lineType=self.linetype)
-
-                cv2.line(frame, (ankle_coord[0], ankle_coord[1] + 20), (ankle_coord[0], ankle_coord[1] - 50), self.COLORS['blue'], 4, lineType=self.linetype)
+                hip_vertical_angle, knee_vertical_angle, ankle_vertical_angle = \
+                                find_vertical_angles(landmarks.pixels, self.vertical_pairs[side])
 
                 # ------------------------------------------------------------
-        
-                
-                # Join landmarks.
-                cv2.line(frame, shldr_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, wrist_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, shldr_coord, hip_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, knee_coord, hip_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                cv2.line(frame, ankle_coord, knee_coord,self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                cv2.line(frame, ankle_coord, foot_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                
-                # Plot landmark points
-                cv2.circle(frame, shldr_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, elbow_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, wrist_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, hip_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, knee_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, ankle_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, foot_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
 
+                result['camera_aligned'] = True
+                result['multiplier'] = multiplier
+                result['angles'].update({
+                                            'hip': hip_vertical_angle,
+                                            'knee': knee_vertical_angle,
+                                            'ankle': ankle_vertical_angle
+                                        })
+                result['points'] = {
+                                    'shoulder': shldr_coord,
+                                    'elbow': elbow_coord,
+                                    'wrist': wrist_coord,
+                                    'hip': hip_coord,
+                                    'knee': knee_coord,
+                                    'ankle': ankle_coord,
+                                    'foot': foot_coord
+                                   }
                 
 
                 current_state = self._get_state(int(knee_vertical_angle))
                 self.state_tracker['curr_state'] = current_state
                 self._update_state_sequence(current_state)
 
+                if current_state in ('s2', 's3'):
+                    if self.state_tracker['REP_START'] is None:
+                        self.state_tracker['REP_START'] = self.clock()
+                        self.state_tracker['REP_MIN_KNEE'] = knee_vertical_angle
+                        self.state_tracker['REP_MAX_KNEE'] = knee_vertical_angle
+                    self.state_tracker['REP_MIN_KNEE'] = min(self.state_tracker['REP_MIN_KNEE'], knee_vertical_angle)
+                    self.state_tracker['REP_MAX_KNEE'] = max(self.state_tracker['REP_MAX_KNEE'], knee_vertical_angle)
+
 
 
                 # -------------------------------------- COMPUTE COUNTERS --------------------------------------
@@ -941,24 +943,33 @@ class ProcessFrame:
                         self.state_tracker['SQUAT_COUNT']+=1
                         play_sound = str(self.state_tracker['SQUAT_COUNT'])
                         # Update feedback for good squat
-                        self.state_tracker['FORM_FEEDBACK'] = 'GOOD FORM'
-                        self.state_tracker['FEEDBACK_COLOR'] = self.COLORS['green']
+                        self.state_tracker['FORM_FEEDBACK'] = 'GOOD_FORM'
+                        rep = {'correct': True, 'feedback': 'GOOD_FORM'}
                         
                     elif 's2' in self.state_tracker['state_seq'] and len(self.state_tracker['state_seq'])==1:
                         self.state_tracker['IMPROPER_SQUAT']+=1
                         play_sound = 'incorrect'
                         # Update feedback for improper squat
-                        self.state_tracker['FORM_FEEDBACK'] = 'INCOMPLETE SQUAT'
-                        self.state_tracker['FEEDBACK_COLOR'] = self.COLORS['red']
+                        self.state_tracker['FORM_FEEDBACK'] = 'INCOMPLETE_SQUAT'
+                        rep = {'correct': False, 'feedback': 'INCOMPLETE_SQUAT'}
 
                     elif self.state_tracker['INCORRECT_POSTURE']:
                         self.state_tracker['IMPROPER_SQUAT']+=1
                         play_sound = 'incorrect'
-                        # Form feedback is already set by _show_feedback
-                        
+                        # Form feedback is already set by _update_feedback
+                        rep = {'correct': False, 'feedback': self.state_tracker['FORM_FEEDBACK']}
+
+                    if rep is not None and self.state_tracker['REP_START'] is not None:
+                        rep['duration'] = self.clock() - self.state_tracker['REP_START']
+                        rep['min_angle'] = self.state_tracker['REP_MIN_KNEE']
+                        rep['max_angle'] = self.state_tracker['REP_MAX_KNEE']
+                        issues = self.state_tracker['REP_FEEDBACK'] | {rep['feedback']}
+                        rep['feedback_codes'] = sorted(issues - {'GOOD_FORM'})
                     
                     self.state_tracker['state_seq'] = []
                     self.state_tracker['INCORRECT_POSTURE'] = False
+                    self.state_tracker['REP_START'] = None
+                    self.state_tracker['REP_FEEDBACK'] = set()
 
 
                 # ----------------------------------------------------------------------------------------------------
@@ -1005,7 +1016,7 @@ class ProcessFrame:
                 
                 if self.state_tracker['curr_state'] == self.state_tracker['prev_state']:
 
-                    end_time = time.perf_counter()
+                    end_time = self.clock()
                     self.state_tracker['INACTIVE_TIME'] += end_time - self.state_tracker['start_inactive_time']
                     self.state_tracker['start_inactive_time'] = end_time
 
@@ -1017,23 +1028,10 @@ class ProcessFrame:
                 
                 else:
                     
-                    self.state_tracker['start_inactive_time'] = time.perf_counter()
+                    self.state_tracker['start_inactive_time'] = self.clock()
                     self.state_tracker['INACTIVE_TIME'] = 0.0
 
                 # -------------------------------------------------------------------------------------------------------
-            
-
-
-                hip_text_coord_x = hip_coord[0] + 10
-                knee_text_coord_x = knee_coord[0] + 15
-                ankle_text_coord_x = ankle_coord[0] + 10
-
-                if self.flip_frame:
-                    frame = cv2.flip(frame, 1)
-                    hip_text_coord_x = frame_width - hip_coord[0] + 10
-                    knee_text_coord_x = frame_width - knee_coord[0] + 15
-                    ankle_text_coord_x = frame_width - ankle_coord[0] + 10
-
                 
                 
                 if 's3' in self.state_tracker['state_seq']:
@@ -1041,61 +1039,18 @@ class ProcessFrame:
 
                 self.state_tracker['COUNT_FRAMES'][self.state_tracker['DISPLAY_TEXT']]+=1
 
-                frame = self._show_feedback(frame, self.state_tracker['COUNT_FRAMES'], self.FEEDBACK_ID_MAP, self.state_tracker['LOWER_HIPS'])
+                result['feedback_ids'] = self._update_feedback(self.state_tracker['COUNT_FRAMES'], self.state_tracker['LOWER_HIPS'])
+
+                if self.state_tracker['REP_START'] is not None:
+                    self.state_tracker['REP_FEEDBACK'].update(self.FEEDBACK_ID_MAP[idx][0] for idx in result['feedback_ids'])
 
 
 
                 if display_inactivity:
                     play_sound = 'reset_counters'
-                    self.state_tracker['start_inactive_time'] = time.perf_counter()
+                    self.state_tracker['start_inactive_time'] = self.clock()
                     self.state_tracker['INACTIVE_TIME'] = 0.0
-                    self.state_tracker['FORM_FEEDBACK'] = 'RESET DUE TO INACTIVITY'
-                    self.state_tracker['FEEDBACK_COLOR'] = self.COLORS['orange']
-
-                
-                cv2.putText(frame, str(int(hip_vertical_angle)), (hip_text_coord_x, hip_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
-                cv2.putText(frame, str(int(knee_vertical_angle)), (knee_text_coord_x, knee_coord[1]+10), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
-                cv2.putText(frame, str(int(ankle_vertical_angle)), (ankle_text_coord_x, ankle_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
-
-                # Draw new UI elements
-                # Calculate widths for UI elements
-                counter_width = 150
-                feedback_width = frame_width - counter_width - 300
-                correct_width = 150
-                
-                # Total squat counter (left side)
-                cv2.rectangle(frame, (10, 10), (10 + counter_width, 60), self.COLORS['orange'], -1)
-                cv2.putText(frame, 'TOTAL REPS', (15, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT'] + self.state_tracker['IMPROPER_SQUAT']), (50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-                
-                # Correct form counter (right side)
-                cv2.rectangle(frame, (frame_width - 10 - correct_width, 10), (frame_width - 10, 60), self.COLORS['green'], -1)
-                cv2.putText(frame, 'CORRECT', (frame_width - correct_width + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT']), (frame_width - correct_width + 50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-                
-                # Form feedback (center)
-                feedback_x = 10 + counter_width + 10
-                feedback_width = frame_width - feedback_x - correct_width - 20
-                cv2.rectangle(frame, (feedback_x, 10), (feedback_x + feedback_width, 60), self.state_tracker['FEEDBACK_COLOR'], -1)
-                
-                # Ensure form feedback text fits in the box
-                form_text = self.state_tracker['FORM_FEEDBACK']
-                font_scale = 0.7
-                thickness = 2
-                
-                # Calculate text width to ensure it fits
-                text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-                
-                # If text is too long, reduce font size
-                if text_size[0] > feedback_width - 20:
-                    font_scale = 0.5
-                    text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-                
-                # Calculate text position to center it
-                text_x = feedback_x + (feedback_width - text_size[0]) // 2
-                text_y = 40
-                cv2.putText(frame, 'FORM', (feedback_x + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-                cv2.putText(frame, form_text, (text_x, text_y), self.font, font_scale, self.COLORS['white'], thickness, self.linetype)
+                    self.state_tracker['FORM_FEEDBACK'] = 'INACTIVITY_RESET'
                 
                 self.state_tracker['DISPLAY_TEXT'][self.state_tracker['COUNT_FRAMES'] > self.thresholds['CNT_FRAME_THRESH']] = False
                 self.state_tracker['COUNT_FRAMES'][self.state_tracker['COUNT_FRAMES'] > self.thresholds['CNT_FRAME_THRESH']] = 0    
@@ -1106,10 +1061,7 @@ class ProcessFrame:
         
         else:
             # When no pose landmarks are detected
-            if self.flip_frame:
-                frame = cv2.flip(frame, 1)
-
-            end_time = time.perf_counter()
+            end_time = self.clock()
             self.state_tracker['INACTIVE_TIME'] += end_time - self.state_tracker['start_inactive_time']
 
             display_inactivity = False
@@ -1118,49 +1070,124 @@ class ProcessFrame:
                 self.state_tracker['SQUAT_COUNT'] = 0
                 self.state_tracker['IMPROPER_SQUAT'] = 0
                 display_inactivity = True
-                self.state_tracker['FORM_FEEDBACK'] = 'NO PERSON DETECTED'
-                self.state_tracker['FEEDBACK_COLOR'] = self.COLORS['orange']
+                self.state_tracker['FORM_FEEDBACK'] = 'NO_PERSON'
 
             self.state_tracker['start_inactive_time'] = end_time
 
-            # Draw new UI elements
-            # Calculate widths for UI elements
-            counter_width = 150
-            feedback_width = frame_width - counter_width - 300
-            correct_width = 150
-            
-            # Total squat counter (left side)
-            cv2.rectangle(frame, (10, 10), (10 + counter_width, 60), self.COLORS['orange'], -1)
-            cv2.putText(frame, 'TOTAL REPS', (15, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-            cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT'] + self.state_tracker['IMPROPER_SQUAT']), (50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-            
-            # Correct form counter (right side)
-            cv2.rectangle(frame, (frame_width - 10 - correct_width, 10), (frame_width - 10, 60), self.COLORS['green'], -1)
-            cv2.putText(frame, 'CORRECT', (frame_width - correct_width + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-            cv2.putText(frame, str(self.state_tracker['SQUAT_COUNT']), (frame_width - correct_width + 50, 50), self.font, 1.0, self.COLORS['white'], 2, self.linetype)
-            
-            # Form feedback (center)
-            feedback_x = 10 + counter_width + 10
-            feedback_width = frame_width - feedback_x - correct_width - 20
-            cv2.rectangle(frame, (feedback_x, 10), (feedback_x + feedback_width, 60), self.state_tracker['FEEDBACK_COLOR'], -1)
-            
-            # Ensure form feedback text fits in the box
-            form_text = self.state_tracker['FORM_FEEDBACK']
-            font_scale = 0.7
-            thickness = 2
-            
-            # Calculate text width to ensure it fits
-            text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-            
-            # If text is too long, reduce font size
-            if text_size[0] > feedback_width - 20:
-                font_scale = 0.5
-                text_size = cv2.getTextSize(form_text, self.font, font_scale, thickness)[0]
-            
-            # Calculate text position to center it
-            text_x = feedback_x + (feedback_width - text_size[0]) // 2
-            text_y = 40
-            cv2.putText(frame, 'FORM', (feedback_x + 5, 30), self.font, 0.5, (0, 0, 0), 1, self.linetype)
-            cv2.putText(frame, form_text, (text_x, text_y), self.font, font_scale, self.COLORS['white'], thickness, self.linetype)
+        if rep is not None:
+            rep['number'] = self.state_tracker['SQUAT_COUNT'] + self.state_tracker['IMPROPER_SQUAT']
+
+        result['counts'] = {
+                            'total': self.state_tracker['SQUAT_COUNT'] + self.state_tracker['IMPROPER_SQUAT'],
+                            'correct': self.state_tracker['SQUAT_COUNT']
+                           }
+        result['stage'] = self.state_tracker['curr_state']
+        result['feedback'] = self.state_tracker['FORM_FEEDBACK']
+        result['play_sound'] = play_sound
+        result['rep'] = rep
+
+        if self.recorder is not None:
+            self.recorder.add(self.clock(), self.landmarks if pose_landmarks else None, frame_width, frame_height, result)
+
+        return result
+
+
+
+    def render(self, frame, result):
+        """
+        Draw the overlays for an analyze() result onto a BGR frame in place
+        (mirrored first when flip_frame is set) and return it.
+        """
+        frame_width = frame.shape[1]
+        points = result['points']
+
+        if result['camera_aligned'] is False:
+            cv2.circle(frame, points['nose'], 7, self.COLORS['white'], -1)
+            cv2.circle(frame, points['left_shoulder'], 7, self.COLORS['yellow'], -1)
+            cv2.circle(frame, points['right_shoulder'], 7, self.COLORS['magenta'], -1)
+
+            if self.flip_frame:
+                cv2.flip(frame, 1, dst=frame)
+
+        elif result['camera_aligned']:
+            shldr_coord = points['shoulder']
+            elbow_coord = points['elbow']
+            wrist_coord = points['wrist']
+            hip_coord = points['hip']
+            knee_coord = points['knee']
+            ankle_coord = points['ankle']
+            foot_coord = points['foot']
+
+            multiplier = result['multiplier']
+            hip_vertical_angle = result['angles']['hip']
+            knee_vertical_angle = result['angles']['knee']
+            ankle_vertical_angle = result['angles']['ankle']
+
+            cv2.ellipse(frame, hip_coord, (30, 30), 
+                        angle = 0, startAngle = -90, endAngle = -90+multiplier*hip_vertical_angle, 
+                        color = self.COLORS['white'], thickness = 3, lineType = self.linetype)
+
+            cv2.line(frame, (hip_coord[0], hip_coord[1] + 20), (hip_coord[0], hip_coord[1] - 80), self.COLORS['blue'], 4, lineType=self.linetype)
+
+            cv2.ellipse(frame, knee_coord, (20, 20), 
+                        angle = 0, startAngle = -90, endAngle = -90-multiplier*knee_vertical_angle, 
+                        color = self.COLORS['white'], thickness = 3,  lineType = self.linetype)
+
+            cv2.line(frame, (knee_coord[0], knee_coord[1] + 20), (knee_coord[0], knee_coord[1] - 50), self.COLORS['blue'], 4, lineType=self.linetype)
+
+            cv2.ellipse(frame, ankle_coord, (30, 30),
+                        angle = 0, startAngle = -90, endAngle = -90 + multiplier*ankle_vertical_angle,
+                        color = self.COLORS['white'], thickness = 3,  lineType=self.linetype)
+
+            cv2.line(frame, (ankle_coord[0], ankle_coord[1] + 20), (ankle_coord[0], ankle_coord[1] - 50), self.COLORS['blue'], 4, lineType=self.linetype)
+
+            # Join landmarks.
+            cv2.line(frame, shldr_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, wrist_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, shldr_coord, hip_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, knee_coord, hip_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
+            cv2.line(frame, ankle_coord, knee_coord,self.COLORS['light_blue'], 4,  lineType=self.linetype)
+            cv2.line(frame, ankle_coord, foot_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
             
-        return frame, play_sound
\ No newline at end of file
+            # Plot landmark points
+            cv2.circle(frame, shldr_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, elbow_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, wrist_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, hip_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, knee_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, ankle_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, foot_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+
+            hip_text_coord_x = hip_coord[0] + 10
+            knee_text_coord_x = knee_coord[0] + 15
+            ankle_text_coord_x = ankle_coord[0] + 10
+
+            if self.flip_frame:
+                # Mirror the drawn geometry in place, text below stays readable
+                cv2.flip(frame, 1, dst=frame)
+                hip_text_coord_x = frame_width - hip_coord[0] + 10
+                knee_text_coord_x = frame_width - knee_coord[0] + 15
+                ankle_text_coord_x = frame_width - ankle_coord[0] + 10
+
+            # Still show all individual feedback messages in their original positions
+            for idx in result['feedback_ids']:
+                code, pos_y = self.FEEDBACK_ID_MAP[idx]
+                draw_text(
+                        frame, 
+                        self.FEEDBACK[code][0], 
+                        pos=(30, pos_y),
+                        text_color=(230, 255, 255),
+                        font_scale=0.6,
+                        text_color_bg=self.FEEDBACK[code][1]
+                    )
+
+            cv2.putText(frame, str(int(hip_vertical_angle)), (hip_text_coord_x, hip_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+            cv2.putText(frame, str(int(knee_vertical_angle)), (knee_text_coord_x, knee_coord[1]+10), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+            cv2.putText(frame, str(int(ankle_vertical_angle)), (ankle_text_coord_x, ankle_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+
+        elif self.flip_frame:
+            cv2.flip(frame, 1, dst=frame)
+
+        self._draw_counters(frame, result['counts']['total'], result['counts']['correct'], result['feedback'])
+
+        return frame
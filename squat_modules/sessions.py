@@ -0,0 +1,102 @@
+import itertools
+import threading
+import time
+
+from .process_frame import ProcessFrame
+
+
+class SquatSession:
+    """
+    Everything one squat stream owns: its Pose graph and its own ProcessFrame,
+    so counters and tracking state never leak between clients.
+    """
+
+    def __init__(self, session_id, pose, thresholds, flip_frame, cap = None):
+        self.id = session_id
+        self.pose = pose
+        self.frame_processor = ProcessFrame(thresholds=thresholds, flip_frame=flip_frame)
+        self.cap = cap
+        # Inference stage wrapping `pose`, set by the stream
+        self.inference = None
+
+        # Held while the Pose graph is in use so the reaper never pulls it mid-frame
+        self.lock = threading.Lock()
+        self.closed = False
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+
+class SessionManager:
+    """
+    Hands every squat stream its own session backed by a pooled Pose graph.
+
+    Sessions are closed by the stream when it ends; a reaper thread also
+    closes sessions that have not processed a frame for `idle_timeout`
+    seconds (e.g. a client that vanished without the server noticing) and
+    returns their graphs to the pool.
+    """
+
+    def __init__(self, pose_pool, thresholds, flip_frame = False, idle_timeout = 30.0, reap_interval = 5.0):
+        self.pose_pool = pose_pool
+        self.thresholds = thresholds
+        self.flip_frame = flip_frame
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._reaper = None
+
+
+    def open(self, cap = None):
+        self._start_reaper()
+
+        session = SquatSession(next(self._ids), self.pose_pool.acquire(), self.thresholds, self.flip_frame, cap)
+        with self._lock:
+            self.sessions[session.id] = session
+
+        return session
+
+
+    def close(self, session):
+        with self._lock:
+            if self.sessions.pop(session.id, None) is None:
+                return
+
+        with session.lock:
+            session.closed = True
+            # Stop inference running on a worker thread before the graph is reset
+            close_inference = getattr(session.inference, 'close', None)
+            if close_inference is not None:
+                close_inference()
+            self.pose_pool.release(session.pose)
+            session.pose = None
+
+        # Ends the stream's capture stage if it is still running
+        if session.cap is not None:
+            session.cap.release()
+
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap, name='squat-session-reaper', daemon=True)
+            self._reaper.start()
+
+
+    def _reap(self):
+        while True:
+            time.sleep(self.reap_interval)
+
+            now = time.monotonic()
+            with self._lock:
+                idle = [s for s in self.sessions.values() if now - s.last_active > self.idle_timeout]
+
+            for session in idle:
+                print(f"Closing idle squat session {session.id}")
+                self.close(session)
@@ -1,8 +1,11 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+import functools
 import os
 
+from .hud import ICONS, SPRITE_CACHE_SIZE, blit, render_sprite, rounded_rect_ops
+
 # Get the absolute path to the current file's directory
 module_dir = os.path.dirname(__file__)
 
@@ -14,12 +17,13 @@ incorrect_path = os.path.join(module_dir, 'wrong.png')
 correct = cv2.imread(correct_path)
 if correct is None:
     raise FileNotFoundError(f"Could not load image at {correct_path}")
-correct = cv2.cvtColor(correct, cv2.COLOR_BGR2RGB)
 
 incorrect = cv2.imread(incorrect_path)
 if incorrect is None:
     raise FileNotFoundError(f"Could not load image at {incorrect_path}")
-incorrect = cv2.cvtColor(incorrect, cv2.COLOR_BGR2RGB)
+
+ICONS['correct'] = correct
+ICONS['incorrect'] = incorrect
 
 
 def draw_rounded_rect(img, rect_start, rect_end, corner_width, box_color):
@@ -77,89 +81,139 @@ def draw_text(
     overlay_type = None
 ):
 
+    sprite, text_size = _text_box_sprite(msg, width, font, font_scale, font_thickness, tuple(text_color),
+                                         tuple(text_color_bg), tuple(box_offset), overlay_image, overlay_type)
+    blit(img, sprite, pos)
+
+    return text_size
+
+
+
+@functools.lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def _text_box_sprite(msg, width, font, font_scale, font_thickness, text_color, text_color_bg, box_offset, overlay_image, overlay_type):
+    # The draw_text box rendered once per message and style, relative to pos
     offset = box_offset
-    x, y = pos
     text_size, _ = cv2.getTextSize(msg, font, font_scale, font_thickness)
     text_w, text_h = text_size
 
-    rec_start = tuple(p - o for p, o in zip(pos, offset))
-    rec_end = tuple(m + n - o for m, n, o in zip((x + text_w, y + text_h), offset, (25, 0)))
+    rec_start = (-offset[0], -offset[1])
+    rec_end = (text_w + offset[0] - 25, text_h + offset[1])
 
     resize_height = 0
 
     if overlay_image:
         resize_height = rec_end[1] - rec_start[1]
-        # print("Height: ", resize_height)
-        # print("Width: ", rec_end[0] - rec_start[0])
-        img = draw_rounded_rect(img, rec_start, (rec_end[0]+resize_height, rec_end[1]), width, text_color_bg)
-        if overlay_type == "correct":
-            overlay_res = cv2.resize(correct, (resize_height, resize_height), interpolation = cv2.INTER_AREA)		
-        elif overlay_type == "incorrect":
-            overlay_res = cv2.resize(incorrect, (resize_height, resize_height), interpolation = cv2.INTER_AREA)
-
-        img[rec_start[1]:rec_start[1]+resize_height, rec_start[0]+width:rec_start[0]+width+resize_height] = overlay_res
+        ops = rounded_rect_ops(rec_start, (rec_end[0]+resize_height, rec_end[1]), width, text_color_bg)
+        ops += (('icon', overlay_type, (rec_start[0]+width, rec_start[1]), resize_height),)
 
     else:
-        img = draw_rounded_rect(img, rec_start, rec_end, width, text_color_bg)
+        ops = rounded_rect_ops(rec_start, rec_end, width, text_color_bg)
 
+    ops += (('text', msg, (int(rec_start[0]+resize_height + 8), int(text_h + font_scale - 1)), font_scale, text_color, font_thickness, font),)
 
-    cv2.putText(
-        img,
-        msg,
-        (int(rec_start[0]+resize_height + 8), int(y + text_h + font_scale - 1)), 
-        font,
-        font_scale,
-        text_color,
-        font_thickness,
-        cv2.LINE_AA,
-    )
+    return render_sprite(ops), text_size
+
+
+
+
+# Image y grows downwards, so "up" is -y
+VERTICAL = np.array([0.0, -1.0])
 
-    
-    
-    return text_size
 
+def _angle_between(u, v):
+    # atan2(|u x v|, u . v) stays accurate near 0 and 180 degrees, unlike arccos
+    cross = u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+    dot = u[..., 0] * v[..., 0] + u[..., 1] * v[..., 1]
+    return np.degrees(np.abs(np.arctan2(cross, dot)))
 
 
-def find_angle(p1, p2, ref_pt = np.array([0,0])):
-    p1_ref = p1 - ref_pt
-    p2_ref = p2 - ref_pt
 
-    cos_theta = (np.dot(p1_ref,p2_ref)) / (1.0 * np.linalg.norm(p1_ref) * np.linalg.norm(p2_ref))
-    theta = np.arccos(np.clip(cos_theta, -1.0, 1.0))
-            
-    degree = int(180 / np.pi) * theta
 
-    return int(degree)
+def find_angles(points, triplets):
+    """
+    Joint angles of (a, b, c) landmark triplets, measured at b.
 
+    `points` is (33, 2) for one frame or (N, 33, 2) for a whole video; the
+    result is (len(triplets),) or (N, len(triplets)) float64 degrees in
+    [0, 180]. Live and batch analysis share this so they agree exactly.
+    """
+    triplets = np.asarray(triplets)
+    a = points[..., triplets[:, 0], :]
+    b = points[..., triplets[:, 1], :]
+    c = points[..., triplets[:, 2], :]
 
+    return _angle_between(np.subtract(a, b, dtype=np.float64), np.subtract(c, b, dtype=np.float64))
 
 
 
-def get_landmark_array(pose_landmark, key, frame_width, frame_height):
 
-    denorm_x = int(pose_landmark[key].x * frame_width)
-    denorm_y = int(pose_landmark[key].y * frame_height)
+def find_vertical_angles(points, pairs):
+    """
+    Angles between the b -> a segment of (a, b) landmark pairs and the vertical
+    through b, shaped like find_angles.
+    """
+    pairs = np.asarray(pairs)
+    segment = np.subtract(points[..., pairs[:, 0], :], points[..., pairs[:, 1], :], dtype=np.float64)
 
-    return np.array([denorm_x, denorm_y])
+    return _angle_between(segment, VERTICAL)
 
 
 
 
-def get_landmark_features(kp_results, dict_features, feature, frame_width, frame_height):
+
+# MediaPipe Pose landmark indices of the joints the analyzers use
+NUM_LANDMARKS = 33
+NOSE = 0
+SIDE_JOINTS = ('shoulder', 'elbow', 'wrist', 'hip', 'knee', 'ankle', 'foot')
+SIDE_INDICES = {
+    'left' : np.array([11, 13, 15, 23, 25, 27, 31]),
+    'right': np.array([12, 14, 16, 24, 26, 28, 32])
+}
+
+
+class LandmarkArray:
+    """
+    Per-frame pose landmarks as NumPy arrays, reused from frame to frame.
+
+    `data` is a (33, 4) float32 array of normalized (x, y, z, visibility) and
+    `pixels` the (33, 2) int32 frame coordinates, filled by one vectorized
+    multiply. Rows are views, e.g. `pixels[NOSE]`, and are overwritten by
+    the next `update`.
+    """
+
+    def __init__(self):
+        self.data = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self.pixels = np.zeros((NUM_LANDMARKS, 2), dtype=np.int32)
+        self.xy = self.data[:, :2]
+        self.visibility = self.data[:, 3]
+        # float64 so truncation matches int(x * width) on the Python floats
+        self._size = np.zeros(2, dtype=np.float64)
+
+
+    def update(self, pose_landmark, frame_width, frame_height):
+        if isinstance(pose_landmark, np.ndarray):
+            # Replayed (33, 4) rows, see recording.ReplayLandmarks
+            self.data[:] = pose_landmark
+        else:
+            self.data[:] = [(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmark]
+
+        self._size[:] = frame_width, frame_height
+        # float -> int cast truncates like int() did per coordinate
+        np.multiply(self.xy, self._size, out=self.pixels, casting='unsafe')
+
+        return self
+
+
+
+
+def get_landmark_features(landmarks, dict_features, feature):
 
     if feature == 'nose':
-        return get_landmark_array(kp_results, dict_features[feature], frame_width, frame_height)
-
-    elif feature == 'left' or 'right':
-        shldr_coord = get_landmark_array(kp_results, dict_features[feature]['shoulder'], frame_width, frame_height)
-        elbow_coord   = get_landmark_array(kp_results, dict_features[feature]['elbow'], frame_width, frame_height)
-        wrist_coord   = get_landmark_array(kp_results, dict_features[feature]['wrist'], frame_width, frame_height)
-        hip_coord   = get_landmark_array(kp_results, dict_features[feature]['hip'], frame_width, frame_height)
-        knee_coord   = get_landmark_array(kp_results, dict_features[feature]['knee'], frame_width, frame_height)
-        ankle_coord   = get_landmark_array(kp_results, dict_features[feature]['ankle'], frame_width, frame_height)
-        foot_coord   = get_landmark_array(kp_results, dict_features[feature]['foot'], frame_width, frame_height)
-
-        return shldr_coord, elbow_coord, wrist_coord, hip_coord, knee_coord, ankle_coord, foot_coord
+        return landmarks.pixels[dict_features[feature]]
+
+    elif feature in ('left', 'right'):
+        # shoulder, elbow, wrist, hip, knee, ankle, foot
+        return tuple(landmarks.pixels[[dict_features[feature][joint] for joint in SIDE_JOINTS]])
     
     else:
        raise ValueError("feature needs to be either 'nose', 'left' or 'right")
@@ -1,38 +1,92 @@
 import cv2
+import numpy as np
 from squat_modules.thresholds import get_thresholds_beginner
-from squat_modules.process_frame import ProcessFrame
-from squat_modules.utils import get_mediapipe_pose
+from squat_modules.sessions import SessionManager
+from encoder import make_encoder
+from metrics import StageTimings
+from packets import PacketEncoder, make_packet
+from pipeline import StreamPipeline, pose_inference
+from pose_pool import POSE_POOL
+from recording import recording
 
-# Set up thresholds and pose detector
+# Set up thresholds
 thresholds = get_thresholds_beginner()
-pose = get_mediapipe_pose()
 
-# Create frame processor
-frame_processor = ProcessFrame(thresholds=thresholds, flip_frame=True)
+# Every stream gets its own frame processor and pooled pose detector
+sessions = SessionManager(POSE_POOL, thresholds, flip_frame=True)
 
-def squat_detection(cap):
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+# Squat overlays are laid out for this display size
+DISPLAY_SIZE = (640, 480)
 
-        # Resize and convert frame to RGB
-        frame = cv2.resize(frame, (640, 480))
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+def squat_detection(cap, queue_sizes=None, inference_options=None, encoder_options=None):
+    session = sessions.open(cap)
+    timings = StageTimings('squat', getattr(cap, 'station', None))
+    session.frame_processor.timings = timings
+
+    # Inference does not need more than the display resolution
+    options = {'max_width': DISPLAY_SIZE[0]}
+    options.update(inference_options or {})
+    session.inference = pose_inference(session.pose, options, timings)
+
+    # Drawn on and encoded by the render stage, one frame at a time
+    display = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+
+    def infer_squat(frame):
+        with session.lock:
+            if session.closed:
+                return None
+            session.touch()
+            return session.inference(frame)
+
+    def render_squat(frame, keypoints):
+        if keypoints is None:
+            return None
+
+        # Resize straight into the BGR display buffer
+        cv2.resize(frame, DISPLAY_SIZE, dst=display)
 
         # Process frame
-        # processed_frame, _ = frame_processor.process(frame_rgb, pose)
-        processed_frame, play_sound = frame_processor.process(frame_rgb, pose)
+        processed_frame, play_sound = session.frame_processor.process(display, None, keypoints=keypoints)
+        return processed_frame
+
+    try:
+        with recording('squat', 'squat', station=getattr(cap, 'station', None)) as recorder:
+            session.frame_processor.recorder = recorder
+            yield from StreamPipeline(cap, infer_squat, render_squat, queue_sizes, make_encoder(encoder_options), timings)
+    finally:
+        sessions.close(session)
+
+
+def squat_data(cap, queue_sizes=None, inference_options=None):
+    """
+    Like squat_detection, but yields analysis packets instead of video
+    """
+    session = sessions.open(cap)
+    timings = StageTimings('squat-data', getattr(cap, 'station', None))
+
+    options = {'max_width': DISPLAY_SIZE[0]}
+    options.update(inference_options or {})
+    session.inference = pose_inference(session.pose, options, timings)
 
-        # Convert back to BGR for display
-        display_frame = cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR)
+    def infer_squat(frame):
+        with session.lock:
+            if session.closed:
+                return None
+            session.touch()
+            return session.inference(frame)
 
-        # Encode the frame as JPEG
-        ret, buffer = cv2.imencode('.jpg', display_frame)
-        frame_bytes = buffer.tobytes()
+    def analyze_squat(frame, keypoints):
+        if keypoints is None:
+            return None
 
-        # Stream the frame
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        # Thresholds are tuned for the display size the video stream analyzes at
+        processor = session.frame_processor
+        result = processor.analyze(keypoints.pose_landmarks, DISPLAY_SIZE[0], DISPLAY_SIZE[1])
+        return make_packet(result, processor.landmarks)
 
-    cap.release()
+    try:
+        with recording('squat-data', 'squat', station=getattr(cap, 'station', None)) as recorder:
+            session.frame_processor.recorder = recorder
+            yield from StreamPipeline(cap, infer_squat, analyze_squat, queue_sizes, PacketEncoder(), timings)
+    finally:
+        sessions.close(session)
@@ -0,0 +1,327 @@
+# tracking.py
+#
+# Group mode: count reps for several people on one camera.
+#
+# A person detector (OpenCV's HOG people detector by default) runs every
+# few frames and seeds tracks. Every track owns a Pose graph that runs on a
+# crop around its person, the way PoseInference's ROI mode does for a
+# single person, and the track's box follows its landmarks between
+# detections. Detections are matched to tracks by box overlap (IoU), so
+# track ids stay stable while people move. Each track has its own exercise
+# processor, so counters and feedback never mix between people.
+
+import itertools
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from bicep_curl import BicepCurlProcessor, FEEDBACK as BICEP_FEEDBACK
+from encoder import make_encoder
+from metrics import NO_TIMINGS, StageTimings
+from pipeline import PoseInference, StreamPipeline, copy_to_buffer
+from pose_pool import POSE_POOL
+from pushups import PushUpProcessor, FEEDBACK as PUSHUP_FEEDBACK
+from rep_events import RepEventRecorder, shared_writer
+from squat_modules.hud import draw_sprite
+from squat_modules.process_frame import ProcessFrame
+from squat_modules.thresholds import get_thresholds_beginner
+
+TRACKING_OPTIONS = {
+    # Most people tracked at once, each holds one Pose graph
+    'max_people': 4,
+    # Frames between person detector runs
+    'detect_interval': 15,
+    # Smallest box overlap for a detection to continue a track
+    'iou_threshold': 0.3,
+    # Frames a track survives without finding its person
+    'max_missed': 10,
+    # Crop padding around a person, relative to the larger box side
+    'box_padding': 0.15
+}
+
+# Track id -> BGR color, cycled
+TRACK_COLORS = [(245, 117, 16), (0, 200, 0), (230, 66, 245), (0, 165, 255), (255, 255, 0), (66, 66, 245)]
+
+
+def _bicep():
+    return BicepCurlProcessor(draw=False, countdown=False), BICEP_FEEDBACK
+
+def _pushup():
+    return PushUpProcessor(draw=False, countdown=False), PUSHUP_FEEDBACK
+
+def _squat():
+    processor = ProcessFrame(thresholds=get_thresholds_beginner(), draw=False)
+    return processor, processor.FEEDBACK
+
+
+# exercise -> () -> (processor, feedback code -> (message, color))
+GROUP_EXERCISES = {
+    'bicep': _bicep,
+    'pushup': _pushup,
+    'squat': _squat
+}
+
+
+def box_iou(a, b):
+    """
+    Intersection over union of two (x0, y0, x1, y1) boxes
+    """
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union
+
+
+class HogPersonDetector:
+    """
+    OpenCV's HOG + linear SVM people detector, needs no model files.
+    Runs on a copy downscaled to `max_width` and returns boxes in frame pixels.
+    """
+
+    def __init__(self, max_width=640, min_score=0.3, nms_threshold=0.45):
+        self.max_width = max_width
+        self.min_score = min_score
+        self.nms_threshold = nms_threshold
+        self._hog = cv2.HOGDescriptor()
+        self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def __call__(self, frame):
+        scale = 1.0
+        image = frame
+        if image.shape[1] > self.max_width:
+            scale = image.shape[1] / self.max_width
+            image = cv2.resize(image, (self.max_width, round(image.shape[0] / scale)), interpolation=cv2.INTER_AREA)
+
+        rects, weights = self._hog.detectMultiScale(image, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        if len(rects) == 0:
+            return []
+
+        rects = [tuple(int(v) for v in rect) for rect in rects]
+        scores = [float(w) for w in np.ravel(weights)]
+        keep = cv2.dnn.NMSBoxes(rects, scores, self.min_score, self.nms_threshold)
+
+        boxes = []
+        for i in np.ravel(keep):
+            x, y, w, h = rects[i]
+            boxes.append((x * scale, y * scale, (x + w) * scale, (y + h) * scale))
+        return boxes
+
+
+class Track:
+    """
+    One tracked person: box, Pose graph, exercise processor and last landmarks
+    """
+
+    def __init__(self, track_id, box, pose, processor, feedback, timings=None):
+        self.id = track_id
+        self.box = box
+        self.pose = pose
+        # Crop set by the tracker every frame, never its own ROI logic
+        self.inference = PoseInference(pose, redetect_interval=float('inf'), timings=timings)
+        self.processor = processor
+        self.feedback = feedback
+        self.pose_landmarks = None
+        self.missed = 0
+
+
+class TrackState:
+    """
+    What the render stage needs of a Track for one frame
+    """
+
+    def __init__(self, track):
+        self.id = track.id
+        self.box = track.box
+        self.pose_landmarks = track.pose_landmarks
+        self.processor = track.processor
+        self.feedback = track.feedback
+
+
+class MultiPoseTracker:
+    """
+    Inference stage for group mode: returns a TrackState per live track,
+    with `pose_landmarks` normalized to the full frame.
+
+    Args:
+        make_processor: () -> (processor, feedback table), see GROUP_EXERCISES
+        detector: frame -> list of person boxes, HogPersonDetector by default
+        pose_pool: Pool the per-track Pose graphs come from
+        timings: metrics.StageTimings for detection and per-track inference
+        make_recorder: track id -> recorder for the track's processor (see recording.py), or None
+        Others: See TRACKING_OPTIONS
+    """
+
+    def __init__(self, make_processor, detector=None, pose_pool=POSE_POOL, max_people=4, detect_interval=15,
+                 iou_threshold=0.3, max_missed=10, box_padding=0.15, timings=None, make_recorder=None):
+        self.make_processor = make_processor
+        self.make_recorder = make_recorder
+        self.timings = timings or NO_TIMINGS
+        self.detector = detector or HogPersonDetector()
+        self.pose_pool = pose_pool
+        self.max_people = max_people
+        self.detect_interval = detect_interval
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.box_padding = box_padding
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._frame_index = 0
+        # Graphs of ended tracks, reused before asking the pool again
+        self._spare_poses = []
+
+    def __call__(self, frame):
+        height, width = frame.shape[:2]
+
+        if self._frame_index % self.detect_interval == 0:
+            start = time.perf_counter()
+            boxes = self.detector(frame)
+            self.timings.observe('person_detect', time.perf_counter() - start)
+            self._match(boxes)
+        self._frame_index += 1
+
+        for track in self.tracks:
+            track.inference.crop = self._crop(track.box, width, height)
+            results = track.inference(frame)
+            track.pose_landmarks = results.pose_landmarks
+            if results.pose_landmarks:
+                track.box = self._landmark_box(results.pose_landmarks, width, height)
+                track.missed = 0
+            else:
+                track.missed += 1
+
+        self._prune()
+        # Snapshots, the tracks are updated again while the render stage draws
+        return [TrackState(track) for track in self.tracks]
+
+    def close(self):
+        for track in self.tracks:
+            self._spare_poses.append(track.pose)
+        self.tracks = []
+        for pose in self._spare_poses:
+            self.pose_pool.release(pose)
+        self._spare_poses = []
+
+    def _match(self, boxes):
+        # Greedy matching, best overlapping pairs first
+        pairs = sorted(
+            ((box_iou(track.box, box), t, d) for t, track in enumerate(self.tracks) for d, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(d)
+            # Landmark boxes stay, they are tighter than detector boxes; only refresh lost tracks
+            if self.tracks[t].missed:
+                self.tracks[t].box = boxes[d]
+
+        for d, box in enumerate(boxes):
+            if d not in matched_boxes and len(self.tracks) < self.max_people:
+                self._start_track(box)
+
+    def _start_track(self, box):
+        if self._spare_poses:
+            pose = self._spare_poses.pop()
+            pose.reset()
+        else:
+            try:
+                pose = self.pose_pool.acquire()
+            except RuntimeError as e:
+                print(f"Not tracking another person: {e}")
+                return
+
+        track_id = next(self._ids)
+        processor, feedback = self.make_processor()
+        if self.make_recorder is not None:
+            processor.recorder = self.make_recorder(track_id)
+        self.tracks.append(Track(track_id, box, pose, processor, feedback, self.timings))
+
+    def _prune(self):
+        alive = []
+        for track in self.tracks:
+            lost = track.missed > self.max_missed
+            # Two tracks that converged on the same person, keep the older one
+            duplicate = any(box_iou(track.box, other.box) > 0.7 for other in alive)
+            if lost or duplicate:
+                self._spare_poses.append(track.pose)
+            else:
+                alive.append(track)
+        self.tracks = alive
+
+    def _crop(self, box, width, height):
+        x0, y0, x1, y1 = box
+        pad = self.box_padding * max(x1 - x0, y1 - y0)
+        half = PoseInference.MIN_ROI_SIZE / 2
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        half_w = max((x1 - x0) / 2 + pad, half)
+        half_h = max((y1 - y0) / 2 + pad, half)
+        return (max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+                min(width, int(cx + half_w)), min(height, int(cy + half_h)))
+
+    @staticmethod
+    def _landmark_box(pose_landmarks, width, height):
+        xs = [lm.x for lm in pose_landmarks.landmark]
+        ys = [lm.y for lm in pose_landmarks.landmark]
+        return (max(0.0, min(xs)) * width, max(0.0, min(ys)) * height,
+                min(1.0, max(xs)) * width, min(1.0, max(ys)) * height)
+
+
+def _draw_track(image, track, result):
+    color = TRACK_COLORS[(track.id - 1) % len(TRACK_COLORS)]
+    spec = mp.solutions.drawing_utils.DrawingSpec(color=color, thickness=2, circle_radius=2)
+    mp.solutions.drawing_utils.draw_landmarks(image, track.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS, spec, spec)
+
+    form_text, form_color = track.feedback.get(result['feedback'], ("", color))
+    counts = result['counts']
+    label = f"#{track.id}  {counts['total']} reps  {counts['correct']} good"
+    x0, y0 = int(track.box[0]), int(track.box[1])
+    draw_sprite(image, (
+        ('rect', (0, 0), (220, 22), color),
+        ('text', label, (5, 16), 0.5, (255, 255, 255), 1),
+        ('rect', (0, 23), (220, 44), form_color),
+        ('text', form_text, (5, 39), 0.45, (255, 255, 255), 1)
+    ), (max(0, x0), max(0, y0 - 48)))
+
+
+def group_detection(cap, exercise, queue_sizes=None, tracking_options=None, encoder_options=None):
+    """
+    Generator of MJPEG parts counting `exercise` reps for every person in view
+    """
+    options = dict(TRACKING_OPTIONS)
+    options.update(tracking_options or {})
+    timings = StageTimings(f'group-{exercise}', getattr(cap, 'station', None))
+
+    # Every tracked person's reps go to the history under a station of their own
+    writer = shared_writer()
+    station = getattr(cap, 'station', None) or 'group'
+    make_recorder = None
+    if writer is not None:
+        make_recorder = lambda track_id: RepEventRecorder(writer, exercise, f"{station}/{track_id}")
+
+    tracker = MultiPoseTracker(GROUP_EXERCISES[exercise], timings=timings, make_recorder=make_recorder, **options)
+
+    display = None
+
+    def render_group(frame, tracks):
+        nonlocal display
+        # Captured frames are shared read-only, draw on a reused copy
+        display = copy_to_buffer(display, frame)
+        h, w = display.shape[:2]
+        for track in tracks:
+            result = track.processor.analyze(track.pose_landmarks, w, h)
+            if track.pose_landmarks:
+                _draw_track(display, track, result)
+        return display
+
+    # StreamPipeline.stop() closes the tracker, returning its graphs to the pool
+    yield from StreamPipeline(cap, tracker, render_group, queue_sizes, make_encoder(encoder_options), timings)